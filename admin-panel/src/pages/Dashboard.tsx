@@ -12,8 +12,8 @@ import {
   VideoLibrary,
   PlayCircle,
 } from '@mui/icons-material';
-import { analyticsApi } from '../services/api';
-import type { DashboardStats } from '../types';
+import { analyticsApi, videosApi } from '../services/api';
+import type { DashboardStats, LiveStats } from '../types';
 
 interface StatCardProps {
   title: string;
@@ -58,9 +58,18 @@ function StatCard({ title, value, icon, color }: StatCardProps) {
 export default function Dashboard() {
   const [stats, setStats] = useState<DashboardStats | null>(null);
   const [loading, setLoading] = useState(true);
+  const [live, setLive] = useState<LiveStats | null>(null);
+  const [videoTitles, setVideoTitles] = useState<Record<number, string>>({});
 
   useEffect(() => {
     loadStats();
+    videosApi
+      .getAll()
+      .then((response) =>
+        setVideoTitles(Object.fromEntries(response.data.map((v) => [v.id, v.title])))
+      )
+      .catch((error) => console.error('Error loading videos:', error));
+    return analyticsApi.subscribeLive(setLive);
   }, []);
 
   const loadStats = async () => {
@@ -119,6 +128,56 @@ export default function Dashboard() {
         </Grid>
       </Grid>
 
+      <Grid container spacing={3} sx={{ mt: 2 }}>
+        <Grid item xs={12} md={6}>
+          <Paper sx={{ p: 3 }}>
+            <Typography variant="h6" gutterBottom>
+              Сейчас (за последнюю минуту)
+            </Typography>
+            {live ? (
+              <Box sx={{ mt: 2 }}>
+                <Typography variant="body1">
+                  Показов в минуту: {live.total_plays_per_minute.toFixed(0)}
+                </Typography>
+                <Typography variant="body1" sx={{ mt: 1 }}>
+                  Автомобилей с показами: {live.active_vehicles}
+                </Typography>
+                {Object.entries(live.plays_per_minute).map(([tariff, plays]) => (
+                  <Typography key={tariff} variant="body2" color="textSecondary" sx={{ mt: 1 }}>
+                    • {tariff}: {plays.toFixed(0)} показов/мин,{' '}
+                    {live.active_vehicles_by_tariff[tariff] || 0} авто
+                  </Typography>
+                ))}
+              </Box>
+            ) : (
+              <Typography variant="body2" color="textSecondary" sx={{ mt: 2 }}>
+                Ожидание данных...
+              </Typography>
+            )}
+          </Paper>
+        </Grid>
+        <Grid item xs={12} md={6}>
+          <Paper sx={{ p: 3 }}>
+            <Typography variant="h6" gutterBottom>
+              Топ видео (за последнюю минуту)
+            </Typography>
+            <Box sx={{ mt: 2 }}>
+              {live && live.top_videos.length > 0 ? (
+                live.top_videos.map((item) => (
+                  <Typography key={item.video_id} variant="body2" sx={{ mt: 1 }}>
+                    {videoTitles[item.video_id] || `#${item.video_id}`}: {item.plays}
+                  </Typography>
+                ))
+              ) : (
+                <Typography variant="body2" color="textSecondary">
+                  Нет показов
+                </Typography>
+              )}
+            </Box>
+          </Paper>
+        </Grid>
+      </Grid>
+
       <Grid container spacing={3} sx={{ mt: 2 }}>
         <Grid item xs={12} md={6}>
           <Paper sx={{ p: 3 }}>
@@ -22,6 +22,7 @@ import {
   InputLabel,
   Select,
   OutlinedInput,
+  LinearProgress,
 } from '@mui/material';
 import {
   Add as AddIcon,
@@ -46,6 +47,7 @@ export default function Videos() {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingVideo, setEditingVideo] = useState<Video | null>(null);
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
+  const [uploadProgress, setUploadProgress] = useState<number | null>(null);
   const { enqueueSnackbar } = useSnackbar();
 
   const [formData, setFormData] = useState({
@@ -104,6 +106,7 @@ export default function Videos() {
   const handleCloseDialog = () => {
     setDialogOpen(false);
     setEditingVideo(null);
+    setUploadProgress(null);
   };
 
   const handleFileChange = (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -139,18 +142,17 @@ export default function Videos() {
           return;
         }
 
-        const formDataToSend = new FormData();
-        formDataToSend.append('file', selectedFile);
-        formDataToSend.append('title', formData.title);
-        formDataToSend.append('video_type', formData.video_type);
-        formDataToSend.append('tariffs', JSON.stringify(formData.tariffs));
-        formDataToSend.append('priority', formData.priority.toString());
-        
-        if (formData.video_type === 'contract') {
-          formDataToSend.append('plays_per_hour', formData.plays_per_hour.toString());
-        }
-
-        await videosApi.create(formDataToSend);
+        await videosApi.uploadResumable(
+          selectedFile,
+          {
+            title: formData.title,
+            video_type: formData.video_type,
+            tariffs: formData.tariffs,
+            priority: formData.priority,
+            plays_per_hour: formData.video_type === 'contract' ? formData.plays_per_hour : undefined,
+          },
+          (uploaded, total) => setUploadProgress(Math.round((uploaded / total) * 100)),
+        );
         enqueueSnackbar('Видео загружено', { variant: 'success' });
       }
       
@@ -160,6 +162,7 @@ export default function Videos() {
       console.error('Error saving video:', error);
       const message = error.response?.data?.detail || (editingVideo ? 'Ошибка обновления видео' : 'Ошибка загрузки видео');
       enqueueSnackbar(message, { variant: 'error' });
+      setUploadProgress(null);
     }
   };
 
@@ -368,10 +371,19 @@ export default function Videos() {
               <input type="file" hidden accept="video/*" onChange={handleFileChange} />
             </Button>
           )}
+
+          {uploadProgress !== null && (
+            <Box sx={{ mt: 2 }}>
+              <LinearProgress variant="determinate" value={uploadProgress} />
+              <Typography variant="caption" color="text.secondary">
+                Загружено {uploadProgress}% (при обрыве загрузка продолжится с того же места)
+              </Typography>
+            </Box>
+          )}
         </DialogContent>
         <DialogActions>
           <Button onClick={handleCloseDialog}>Отмена</Button>
-          <Button onClick={handleSubmit} variant="contained">
+          <Button onClick={handleSubmit} variant="contained" disabled={uploadProgress !== null}>
             {editingVideo ? 'Сохранить' : 'Загрузить'}
           </Button>
         </DialogActions>
@@ -6,6 +6,14 @@ import type {
   Session,
   VehicleAnalytics,
   DashboardStats,
+  FleetVehicleTotals,
+  FleetVideoTotals,
+  FleetTariffTotals,
+  FleetPage,
+  FleetQueryParams,
+  LiveStats,
+  UploadSession,
+  VideoUploadMeta,
 } from '../types';
 
 // Backend API на порту 8000; в production задать VITE_API_URL
@@ -52,6 +60,75 @@ export const vehiclesApi = {
   delete: (id: number) => api.delete(`/vehicles/${id}`),
 };
 
+// Возобновляемая загрузка: куски по 8 МБ, повтор куска при обрыве,
+// id загрузки хранится в localStorage - после перезагрузки страницы загрузка продолжается
+const UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024;
+const UPLOAD_CHUNK_RETRIES = 5;
+
+const sha256Hex = async (data: ArrayBuffer): Promise<string> => {
+  const digest = await crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+const uploadVideoResumable = async (
+  file: File,
+  meta: VideoUploadMeta,
+  onProgress?: (uploaded: number, total: number) => void,
+): Promise<Video> => {
+  const storageKey = `video_upload:${file.name}:${file.size}:${file.lastModified}`;
+  let session: UploadSession | null = null;
+
+  const savedId = localStorage.getItem(storageKey);
+  if (savedId) {
+    try {
+      session = (await api.get<UploadSession>(`/videos/uploads/${savedId}`)).data;
+    } catch {
+      localStorage.removeItem(storageKey);
+    }
+  }
+  if (!session) {
+    session = (await api.post<UploadSession>('/videos/uploads', { filename: file.name, size: file.size })).data;
+    localStorage.setItem(storageKey, session.upload_id);
+  }
+
+  const chunkBytes = Math.min(UPLOAD_CHUNK_BYTES, session.chunk_max_bytes);
+  let offset = session.offset;
+  let failures = 0;
+  onProgress?.(offset, file.size);
+
+  while (offset < file.size) {
+    const chunk = await file.slice(offset, offset + chunkBytes).arrayBuffer();
+    try {
+      const response = await api.put<UploadSession>(
+        `/videos/uploads/${session.upload_id}`,
+        chunk,
+        {
+          params: { offset },
+          headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': await sha256Hex(chunk) },
+        },
+      );
+      offset = response.data.offset;
+      failures = 0;
+    } catch (error: any) {
+      const serverOffset = error.response?.headers?.['x-upload-offset'];
+      if (error.response?.status === 409 && serverOffset !== undefined) {
+        // Кусок уже принят (ответ потерялся) - продолжить с серверного смещения
+        offset = Number(serverOffset);
+        continue;
+      }
+      if (++failures > UPLOAD_CHUNK_RETRIES || (error.response && error.response.status < 500)) {
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+    }
+    onProgress?.(offset, file.size);
+  }
+
+  const video = await api.post<Video>(`/videos/uploads/${session.upload_id}/complete`, meta);
+  localStorage.removeItem(storageKey);
+  return video.data;
+};
+
 // Videos
 export const videosApi = {
   getAll: (params?: { tariff?: string; video_type?: string; is_active?: boolean }) =>
@@ -61,6 +138,7 @@ export const videosApi = {
     api.post<Video>('/videos', formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
     }),
+  uploadResumable: uploadVideoResumable,
   update: (id: number, data: Partial<Video> & { tariffs?: string[] }) => {
     // Backend ожидает tariffs как массив строк
     const updateData: any = { ...data };
@@ -96,6 +174,20 @@ export const analyticsApi = {
     if (endDate) params.end_date = endDate;
     return api.get<VehicleAnalytics>(`/analytics/vehicle/${vehicleId}`, { params });
   },
+  // Отчеты по всему парку (считаются в БД по дневным агрегатам)
+  getFleetVehicles: (params?: FleetQueryParams) =>
+    api.get<FleetPage<FleetVehicleTotals>>('/analytics/fleet/vehicles', { params }),
+  getFleetVideos: (params?: FleetQueryParams) =>
+    api.get<FleetPage<FleetVideoTotals>>('/analytics/fleet/videos', { params }),
+  getFleetTariffs: (params?: Pick<FleetQueryParams, 'start_date' | 'end_date' | 'sort_by' | 'order'>) =>
+    api.get<FleetTariffTotals[]>('/analytics/fleet/tariffs', { params }),
+  // Живые счетчики: сервер присылает снимок раз в несколько секунд (Server-Sent Events).
+  // Возвращает функцию отписки; EventSource сам переподключается при обрыве.
+  subscribeLive: (onSnapshot: (stats: LiveStats) => void): (() => void) => {
+    const source = new EventSource(`${API_BASE_URL}/analytics/live`);
+    source.onmessage = (event) => onSnapshot(JSON.parse(event.data));
+    return () => source.close();
+  },
   getDashboardStats: async (): Promise<DashboardStats> => {
     // Собрать статистику из разных endpoints
     const [vehicles, videos] = await Promise.all([
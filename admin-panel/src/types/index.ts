@@ -15,7 +15,15 @@ export interface Video {
   filename: string;
   file_path: string;
   file_size?: number;
-  duration?: number;
+  content_sha256?: string;
+  duration?: number;  // пустая, пока файл не разобран (probe_status = pending)
+  video_codec?: string;
+  width?: number;
+  height?: number;
+  bit_rate?: number;
+  probe_status?: 'pending' | 'done' | 'failed';
+  transcode_status?: 'pending' | 'done' | 'failed' | 'skipped';  // лестница качеств HLS
+  hls_path?: string;
   video_type: 'filler' | 'contract';
   plays_per_hour?: number;
   tariffs: string;
@@ -24,20 +32,37 @@ export interface Video {
   created_at: string;
 }
 
+// Возобновляемая загрузка (/videos/uploads)
+export interface UploadSession {
+  upload_id: string;
+  filename: string;
+  size: number;
+  offset: number;
+  chunk_max_bytes: number;
+}
+
+export interface VideoUploadMeta {
+  title: string;
+  video_type: Video['video_type'];
+  tariffs: string[];
+  priority: number;
+  plays_per_hour?: number;
+}
+
 export interface ContractVideoItem {
   video_id: number;
   start_time: number;  // Время начала в секундах от начала часа (0-3600)
   end_time: number;    // Время окончания в секундах от начала часа (0-3600)
   duration: number;    // Длительность в секундах
   frequency: number;   // Количество повторений этого видео в плейлисте
-  file_path: string;   // Путь к файлу (например, /videos/filename.mp4)
+  file_path: string;   // URL файла (например, /media/<sha256>.mp4)
   media_url: string;   // Полный URL для доступа к медиа файлу
 }
 
 export interface FillerVideoItem {
   video_id: number;
   duration: number;    // Длительность в секундах
-  file_path: string;   // Путь к файлу (например, /videos/filename.mp4)
+  file_path: string;   // URL файла (например, /media/<sha256>.mp4)
   media_url: string;   // Полный URL для доступа к медиа файлу
 }
 
@@ -60,6 +85,7 @@ export interface Session {
   end_time?: string;
   total_duration_seconds: number;
   videos_played: number;
+  total_played_seconds: number;
 }
 
 export interface PlaybackLog {
@@ -95,6 +121,61 @@ export interface VehicleAnalytics {
   total_earnings: number;
 }
 
+export interface FleetVehicleTotals {
+  vehicle_id: number;
+  car_number: string;
+  tariff: Vehicle['tariff'];
+  videos_played: number;
+  total_duration_seconds: number;
+  prime_time_duration_seconds: number;
+  earnings: number;
+}
+
+export interface FleetVideoTotals {
+  video_id: number;
+  video_title: string;
+  video_type: Video['video_type'];
+  play_count: number;
+  total_duration: number;
+  earnings: number;
+}
+
+export interface FleetTariffTotals {
+  tariff: Vehicle['tariff'];
+  active_vehicles: number;
+  videos_played: number;
+  total_duration_seconds: number;
+  prime_time_duration_seconds: number;
+  earnings: number;
+}
+
+// Страница keyset-пагинации: next_cursor === null — страниц больше нет
+export interface FleetPage<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
+export interface FleetQueryParams {
+  start_date?: string;
+  end_date?: string;
+  tariff?: string;
+  sort_by?: string;
+  order?: 'asc' | 'desc';
+  limit?: number;
+  cursor?: string;
+}
+
+// Живые счетчики (SSE /analytics/live); ключи - тарифы
+export interface LiveStats {
+  generated_at: string;
+  window_seconds: number;
+  plays_per_minute: Record<string, number>;
+  total_plays_per_minute: number;
+  active_vehicles: number;
+  active_vehicles_by_tariff: Record<string, number>;
+  top_videos: { video_id: number; plays: number }[];
+}
+
 export interface DashboardStats {
   total_vehicles: number;
   active_vehicles: number;
@@ -0,0 +1,111 @@
+"""add daily rollups for fleet analytics
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Базовая ставка на момент миграции (AnalyticsService.BASE_RATE_PER_SECOND)
+BASE_RATE_PER_SECOND = 100
+
+
+def _index_exists(connection, name: str) -> bool:
+    return connection.execute(sa.text(
+        "SELECT COUNT(*) FROM pg_indexes WHERE indexname = :name"
+    ), {"name": name}).scalar() > 0
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = set(inspector.get_table_names())
+
+    # Тип уже создан вместе с таблицей vehicles
+    tariff_enum = postgresql.ENUM(
+        'STANDARD', 'COMFORT', 'BUSINESS', 'PREMIUM',
+        name='vehicletariff', create_type=False
+    )
+
+    # Таблицы могли быть созданы через Base.metadata.create_all при старте
+    if 'vehicle_daily_stats' not in tables:
+        op.create_table(
+            'vehicle_daily_stats',
+            sa.Column('vehicle_id', sa.Integer(), sa.ForeignKey('vehicles.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('day', sa.Date(), primary_key=True),
+            sa.Column('tariff', tariff_enum, nullable=False),
+            sa.Column('videos_played', sa.Integer(), nullable=False),
+            sa.Column('total_duration_seconds', sa.Float(), nullable=False),
+            sa.Column('prime_time_duration_seconds', sa.Float(), nullable=False),
+            sa.Column('earnings', sa.Float(), nullable=False),
+        )
+        op.create_index('ix_vehicle_daily_stats_day', 'vehicle_daily_stats', ['day'])
+
+    if 'video_daily_stats' not in tables:
+        op.create_table(
+            'video_daily_stats',
+            sa.Column('video_id', sa.Integer(), sa.ForeignKey('videos.id'), primary_key=True),
+            sa.Column('tariff', tariff_enum, primary_key=True),
+            sa.Column('day', sa.Date(), primary_key=True),
+            sa.Column('play_count', sa.Integer(), nullable=False),
+            sa.Column('total_duration', sa.Float(), nullable=False),
+            sa.Column('earnings', sa.Float(), nullable=False),
+        )
+        op.create_index('ix_video_daily_stats_day', 'video_daily_stats', ['day'])
+
+    # Составные индексы для выборок "автомобиль/видео + диапазон времени"
+    if not _index_exists(connection, 'ix_playback_logs_vehicle_played_at'):
+        op.create_index('ix_playback_logs_vehicle_played_at', 'playback_logs', ['vehicle_id', 'played_at'])
+    if not _index_exists(connection, 'ix_playback_logs_video_played_at'):
+        op.create_index('ix_playback_logs_video_played_at', 'playback_logs', ['video_id', 'played_at'])
+
+    # Заполнить агрегаты по уже накопленным логам
+    earnings_sql = (
+        f"l.duration_seconds * {BASE_RATE_PER_SECOND} * "
+        f"CASE WHEN l.is_prime_time THEN {float(settings.PRIME_TIME_MULTIPLIER)} ELSE 1 END"
+    )
+    op.execute(f"""
+        INSERT INTO vehicle_daily_stats
+            (vehicle_id, day, tariff, videos_played, total_duration_seconds,
+             prime_time_duration_seconds, earnings)
+        SELECT l.vehicle_id, l.played_at::date, v.tariff, COUNT(*),
+               SUM(l.duration_seconds),
+               SUM(CASE WHEN l.is_prime_time THEN l.duration_seconds ELSE 0 END),
+               SUM({earnings_sql})
+        FROM playback_logs l
+        JOIN vehicles v ON v.id = l.vehicle_id
+        GROUP BY l.vehicle_id, l.played_at::date, v.tariff
+        ON CONFLICT (vehicle_id, day) DO NOTHING
+    """)
+    op.execute(f"""
+        INSERT INTO video_daily_stats
+            (video_id, tariff, day, play_count, total_duration, earnings)
+        SELECT l.video_id, v.tariff, l.played_at::date, COUNT(*),
+               SUM(l.duration_seconds), SUM({earnings_sql})
+        FROM playback_logs l
+        JOIN vehicles v ON v.id = l.vehicle_id
+        GROUP BY l.video_id, v.tariff, l.played_at::date
+        ON CONFLICT (video_id, tariff, day) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_playback_logs_video_played_at', table_name='playback_logs')
+    op.drop_index('ix_playback_logs_vehicle_played_at', table_name='playback_logs')
+    op.drop_index('ix_video_daily_stats_day', table_name='video_daily_stats')
+    op.drop_table('video_daily_stats')
+    op.drop_index('ix_vehicle_daily_stats_day', table_name='vehicle_daily_stats')
+    op.drop_table('vehicle_daily_stats')
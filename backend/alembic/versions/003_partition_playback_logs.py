@@ -0,0 +1,119 @@
+"""partition playback_logs by month
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.services.partition_service import PartitionService
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Индексы, которые пересоздаются на родительской таблице
+# (на секционированной таблице они автоматически создаются на каждой секции)
+INDEXES = [
+    ('ix_playback_logs_id', ['id']),
+    ('ix_playback_logs_played_at', ['played_at']),
+    ('ix_playback_logs_vehicle_played_at', ['vehicle_id', 'played_at']),
+    ('ix_playback_logs_video_played_at', ['video_id', 'played_at']),
+]
+
+COLUMNS = "id, vehicle_id, video_id, session_id, played_at, duration_seconds, is_prime_time, completed, created_at"
+
+
+def _drop_indexes() -> None:
+    for name, _ in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    # Таблица уже секционирована (например, создана через create_all по новой модели)
+    if PartitionService.is_partitioned(connection):
+        PartitionService.ensure_partitions(connection)
+        return
+
+    sequence = connection.execute(sa.text(
+        "SELECT pg_get_serial_sequence('playback_logs', 'id')"
+    )).scalar() or 'playback_logs_id_seq'
+
+    # Отвязать последовательность, иначе она удалится вместе со старой таблицей
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    op.execute("ALTER TABLE playback_logs RENAME TO playback_logs_old")
+    op.execute("ALTER TABLE playback_logs_old RENAME CONSTRAINT playback_logs_pkey TO playback_logs_old_pkey")
+    _drop_indexes()
+
+    # Первичный ключ секционированной таблицы обязан включать ключ секционирования
+    op.execute(f"""
+        CREATE TABLE playback_logs (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            vehicle_id INTEGER NOT NULL REFERENCES vehicles (id),
+            video_id INTEGER NOT NULL REFERENCES videos (id),
+            session_id INTEGER REFERENCES vehicle_sessions (id),
+            played_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            duration_seconds DOUBLE PRECISION NOT NULL,
+            is_prime_time BOOLEAN,
+            completed BOOLEAN,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (id, played_at)
+        ) PARTITION BY RANGE (played_at)
+    """)
+
+    # Секции: от самого старого месяца с данными до текущего + N месяцев вперед
+    oldest = connection.execute(sa.text("SELECT MIN(played_at) FROM playback_logs_old")).scalar()
+    from_month = oldest.date() if oldest else datetime.utcnow().date()
+    PartitionService.ensure_partitions(connection, from_month=from_month)
+
+    for name, columns in INDEXES:
+        op.create_index(name, 'playback_logs', columns)
+
+    op.execute(f"INSERT INTO playback_logs ({COLUMNS}) SELECT {COLUMNS} FROM playback_logs_old")
+    op.execute("DROP TABLE playback_logs_old")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY playback_logs.id")
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if not PartitionService.is_partitioned(connection):
+        return
+
+    sequence = connection.execute(sa.text(
+        "SELECT pg_get_serial_sequence('playback_logs', 'id')"
+    )).scalar() or 'playback_logs_id_seq'
+
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    op.execute("ALTER TABLE playback_logs RENAME TO playback_logs_partitioned")
+    op.execute("ALTER TABLE playback_logs_partitioned RENAME CONSTRAINT playback_logs_pkey TO playback_logs_partitioned_pkey")
+    _drop_indexes()
+
+    op.execute(f"""
+        CREATE TABLE playback_logs (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}') PRIMARY KEY,
+            vehicle_id INTEGER NOT NULL REFERENCES vehicles (id),
+            video_id INTEGER NOT NULL REFERENCES videos (id),
+            session_id INTEGER REFERENCES vehicle_sessions (id),
+            played_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            duration_seconds DOUBLE PRECISION NOT NULL,
+            is_prime_time BOOLEAN,
+            completed BOOLEAN,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+    """)
+    op.execute(f"INSERT INTO playback_logs ({COLUMNS}) SELECT {COLUMNS} FROM playback_logs_partitioned")
+    # Удаляет родительскую таблицу вместе со всеми секциями
+    op.execute("DROP TABLE playback_logs_partitioned")
+
+    for name, columns in INDEXES:
+        op.create_index(name, 'playback_logs', columns)
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY playback_logs.id")
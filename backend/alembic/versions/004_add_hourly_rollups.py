@@ -0,0 +1,73 @@
+"""add hourly rollups for contract fulfillment
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    tables = set(sa.inspect(connection).get_table_names())
+
+    tariff_enum = postgresql.ENUM(
+        'STANDARD', 'COMFORT', 'BUSINESS', 'PREMIUM',
+        name='vehicletariff', create_type=False
+    )
+
+    if 'vehicle_hourly_activity' not in tables:
+        op.create_table(
+            'vehicle_hourly_activity',
+            sa.Column('vehicle_id', sa.Integer(), sa.ForeignKey('vehicles.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('hour', sa.DateTime(timezone=True), primary_key=True),
+            sa.Column('tariff', tariff_enum, nullable=False),
+            sa.Column('plays', sa.Integer(), nullable=False),
+        )
+        op.create_index('ix_vehicle_hourly_activity_hour_tariff', 'vehicle_hourly_activity', ['hour', 'tariff'])
+
+    if 'video_hourly_stats' not in tables:
+        op.create_table(
+            'video_hourly_stats',
+            sa.Column('video_id', sa.Integer(), sa.ForeignKey('videos.id'), primary_key=True),
+            sa.Column('tariff', tariff_enum, primary_key=True),
+            sa.Column('hour', sa.DateTime(timezone=True), primary_key=True),
+            sa.Column('play_count', sa.Integer(), nullable=False),
+        )
+        op.create_index('ix_video_hourly_stats_hour', 'video_hourly_stats', ['hour'])
+
+    # Заполнить агрегаты по уже накопленным логам
+    op.execute("""
+        INSERT INTO vehicle_hourly_activity (vehicle_id, hour, tariff, plays)
+        SELECT l.vehicle_id, date_trunc('hour', l.played_at), v.tariff, COUNT(*)
+        FROM playback_logs l
+        JOIN vehicles v ON v.id = l.vehicle_id
+        GROUP BY l.vehicle_id, date_trunc('hour', l.played_at), v.tariff
+        ON CONFLICT (vehicle_id, hour) DO NOTHING
+    """)
+    op.execute("""
+        INSERT INTO video_hourly_stats (video_id, tariff, hour, play_count)
+        SELECT l.video_id, v.tariff, date_trunc('hour', l.played_at), COUNT(*)
+        FROM playback_logs l
+        JOIN vehicles v ON v.id = l.vehicle_id
+        GROUP BY l.video_id, v.tariff, date_trunc('hour', l.played_at)
+        ON CONFLICT (video_id, tariff, hour) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_video_hourly_stats_hour', table_name='video_hourly_stats')
+    op.drop_table('video_hourly_stats')
+    op.drop_index('ix_vehicle_hourly_activity_hour_tariff', table_name='vehicle_hourly_activity')
+    op.drop_table('vehicle_hourly_activity')
@@ -0,0 +1,89 @@
+"""add rate cards and earnings ledger
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Ставка по умолчанию на момент миграции (AnalyticsService.BASE_RATE_PER_SECOND)
+BASE_RATE_PER_SECOND = 100
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    tables = set(sa.inspect(connection).get_table_names())
+
+    tariff_enum = postgresql.ENUM(
+        'STANDARD', 'COMFORT', 'BUSINESS', 'PREMIUM',
+        name='vehicletariff', create_type=False
+    )
+
+    if 'rate_cards' not in tables:
+        op.create_table(
+            'rate_cards',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('tariff', tariff_enum, nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('start_hour', sa.Integer(), nullable=False),
+            sa.Column('end_hour', sa.Integer(), nullable=False),
+            sa.Column('rate_per_second', sa.Float(), nullable=False),
+            sa.Column('effective_from', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_rate_cards_id', 'rate_cards', ['id'])
+        op.create_index('ix_rate_cards_tariff_effective_from', 'rate_cards', ['tariff', 'effective_from'])
+
+    if 'earnings_ledger' not in tables:
+        op.create_table(
+            'earnings_ledger',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('playback_log_id', sa.Integer(), nullable=False, unique=True),
+            sa.Column('vehicle_id', sa.Integer(), sa.ForeignKey('vehicles.id'), nullable=False),
+            sa.Column('video_id', sa.Integer(), sa.ForeignKey('videos.id'), nullable=False),
+            sa.Column('earned_at', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('duration_seconds', sa.Float(), nullable=False),
+            sa.Column('rate_card_id', sa.Integer(), sa.ForeignKey('rate_cards.id'), nullable=True),
+            sa.Column('rate_per_second', sa.Float(), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_earnings_ledger_id', 'earnings_ledger', ['id'])
+        op.create_index('ix_earnings_ledger_vehicle_earned_at', 'earnings_ledger', ['vehicle_id', 'earned_at'])
+
+    # Начисления по уже накопленным логам - по прежней формуле (ставка по умолчанию)
+    rate_sql = (
+        f"{float(BASE_RATE_PER_SECOND)} * "
+        f"CASE WHEN l.is_prime_time THEN {float(settings.PRIME_TIME_MULTIPLIER)} ELSE 1 END"
+    )
+    op.execute(f"""
+        INSERT INTO earnings_ledger
+            (playback_log_id, vehicle_id, video_id, earned_at, duration_seconds,
+             rate_card_id, rate_per_second, amount)
+        SELECT l.id, l.vehicle_id, l.video_id, l.played_at, l.duration_seconds,
+               NULL, {rate_sql}, l.duration_seconds * {rate_sql}
+        FROM playback_logs l
+        ON CONFLICT (playback_log_id) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_earnings_ledger_vehicle_earned_at', table_name='earnings_ledger')
+    op.drop_index('ix_earnings_ledger_id', table_name='earnings_ledger')
+    op.drop_table('earnings_ledger')
+    op.drop_index('ix_rate_cards_tariff_effective_from', table_name='rate_cards')
+    op.drop_index('ix_rate_cards_id', table_name='rate_cards')
+    op.drop_table('rate_cards')
@@ -0,0 +1,46 @@
+"""add incremental played counters to vehicle_sessions
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    columns = {c['name'] for c in sa.inspect(connection).get_columns('vehicle_sessions')}
+
+    if 'total_played_seconds' not in columns:
+        op.add_column(
+            'vehicle_sessions',
+            sa.Column('total_played_seconds', sa.Float(), nullable=True, server_default='0')
+        )
+
+    # Счетчики сессий по уже накопленным логам (однократный проход)
+    op.execute("""
+        UPDATE vehicle_sessions s
+        SET videos_played = agg.plays,
+            total_played_seconds = agg.played_seconds
+        FROM (
+            SELECT session_id, COUNT(*) AS plays, SUM(duration_seconds) AS played_seconds
+            FROM playback_logs
+            WHERE session_id IS NOT NULL
+            GROUP BY session_id
+        ) agg
+        WHERE s.id = agg.session_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('vehicle_sessions', 'total_played_seconds')
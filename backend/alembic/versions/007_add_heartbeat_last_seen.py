@@ -0,0 +1,39 @@
+"""add last_seen_at for heartbeats and open sessions index
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    if 'last_seen_at' not in {c['name'] for c in inspector.get_columns('vehicles')}:
+        op.add_column('vehicles', sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=True))
+
+    if 'last_seen_at' not in {c['name'] for c in inspector.get_columns('vehicle_sessions')}:
+        op.add_column('vehicle_sessions', sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=True))
+
+    if 'ix_vehicle_sessions_open' not in {i['name'] for i in inspector.get_indexes('vehicle_sessions')}:
+        op.create_index(
+            'ix_vehicle_sessions_open', 'vehicle_sessions', ['start_time'],
+            postgresql_where=sa.text('end_time IS NULL')
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_vehicle_sessions_open', table_name='vehicle_sessions')
+    op.drop_column('vehicle_sessions', 'last_seen_at')
+    op.drop_column('vehicles', 'last_seen_at')
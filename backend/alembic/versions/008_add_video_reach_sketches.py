@@ -0,0 +1,109 @@
+"""add HyperLogLog reach sketches per video
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.hll import HyperLogLog
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько скетчей копить перед вставкой при заполнении
+BACKFILL_BATCH = 500
+
+
+def _backfill(connection) -> None:
+    """
+    Построить скетчи по уже накопленным логам.
+
+    Читаются только уникальные тройки (video_id, день, vehicle_id) по порядку,
+    так что в памяти живут скетчи одного видео за один месяц.
+    """
+    daily_table = sa.table(
+        'video_reach_daily',
+        sa.column('video_id', sa.Integer), sa.column('day', sa.Date), sa.column('registers', sa.LargeBinary)
+    )
+    monthly_table = sa.table(
+        'video_reach_monthly',
+        sa.column('video_id', sa.Integer), sa.column('month', sa.Date), sa.column('registers', sa.LargeBinary)
+    )
+
+    rows = connection.execution_options(stream_results=True, yield_per=10_000).execute(sa.text("""
+        SELECT DISTINCT video_id, played_at::date AS day, vehicle_id
+        FROM playback_logs
+        ORDER BY video_id, day
+    """))
+
+    daily_batch, monthly_batch = [], []
+    current_day_key, day_sketch = None, None
+    current_month_key, month_sketch = None, None
+
+    def flush(force: bool = False) -> None:
+        if daily_batch and (force or len(daily_batch) >= BACKFILL_BATCH):
+            connection.execute(daily_table.insert(), daily_batch)
+            daily_batch.clear()
+        if monthly_batch and (force or len(monthly_batch) >= BACKFILL_BATCH):
+            connection.execute(monthly_table.insert(), monthly_batch)
+            monthly_batch.clear()
+
+    for video_id, day, vehicle_id in rows:
+        day_key = (video_id, day)
+        month_key = (video_id, day.replace(day=1))
+        if day_key != current_day_key:
+            if day_sketch is not None:
+                daily_batch.append({"video_id": current_day_key[0], "day": current_day_key[1],
+                                    "registers": day_sketch.to_bytes()})
+            current_day_key, day_sketch = day_key, HyperLogLog()
+        if month_key != current_month_key:
+            if month_sketch is not None:
+                monthly_batch.append({"video_id": current_month_key[0], "month": current_month_key[1],
+                                      "registers": month_sketch.to_bytes()})
+            current_month_key, month_sketch = month_key, HyperLogLog()
+        day_sketch.add(vehicle_id)
+        month_sketch.add(vehicle_id)
+        flush()
+
+    if day_sketch is not None:
+        daily_batch.append({"video_id": current_day_key[0], "day": current_day_key[1],
+                            "registers": day_sketch.to_bytes()})
+        monthly_batch.append({"video_id": current_month_key[0], "month": current_month_key[1],
+                              "registers": month_sketch.to_bytes()})
+    flush(force=True)
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    tables = set(sa.inspect(connection).get_table_names())
+
+    if 'video_reach_daily' not in tables:
+        op.create_table(
+            'video_reach_daily',
+            sa.Column('video_id', sa.Integer(), sa.ForeignKey('videos.id'), primary_key=True),
+            sa.Column('day', sa.Date(), primary_key=True),
+            sa.Column('registers', sa.LargeBinary(), nullable=False),
+        )
+    if 'video_reach_monthly' not in tables:
+        op.create_table(
+            'video_reach_monthly',
+            sa.Column('video_id', sa.Integer(), sa.ForeignKey('videos.id'), primary_key=True),
+            sa.Column('month', sa.Date(), primary_key=True),
+            sa.Column('registers', sa.LargeBinary(), nullable=False),
+        )
+
+    if connection.execute(sa.text("SELECT NOT EXISTS (SELECT 1 FROM video_reach_daily)")).scalar():
+        _backfill(connection)
+
+
+def downgrade() -> None:
+    op.drop_table('video_reach_monthly')
+    op.drop_table('video_reach_daily')
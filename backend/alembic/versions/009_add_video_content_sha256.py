@@ -0,0 +1,32 @@
+"""add content_sha256 to videos
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    if 'content_sha256' not in {c['name'] for c in inspector.get_columns('videos')}:
+        op.add_column('videos', sa.Column('content_sha256', sa.String(length=64), nullable=True))
+
+    if 'ix_videos_content_sha256' not in {i['name'] for i in inspector.get_indexes('videos')}:
+        op.create_index('ix_videos_content_sha256', 'videos', ['content_sha256'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_videos_content_sha256', table_name='videos')
+    op.drop_column('videos', 'content_sha256')
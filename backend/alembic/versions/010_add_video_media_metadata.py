@@ -0,0 +1,55 @@
+"""add media metadata and probe status to videos
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '010'
+down_revision: Union[str, None] = '009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {c['name'] for c in inspector.get_columns('videos')}
+
+    probe_status_enum = postgresql.ENUM('PENDING', 'DONE', 'FAILED', name='mediaprobestatus')
+    probe_status_enum.create(bind, checkfirst=True)
+
+    for name, column_type in (
+        ('video_codec', sa.String(length=32)),
+        ('width', sa.Integer()),
+        ('height', sa.Integer()),
+        ('bit_rate', sa.Integer()),
+        ('probed_at', sa.DateTime(timezone=True)),
+    ):
+        if name not in columns:
+            op.add_column('videos', sa.Column(name, column_type, nullable=True))
+
+    if 'probe_status' not in columns:
+        # Уже загруженные видео с длительностью считаются разобранными,
+        # без длительности - попадут в очередь разбора после деплоя
+        op.add_column('videos', sa.Column(
+            'probe_status',
+            postgresql.ENUM('PENDING', 'DONE', 'FAILED', name='mediaprobestatus', create_type=False),
+            nullable=False,
+            server_default='PENDING'
+        ))
+        op.execute("UPDATE videos SET probe_status = 'DONE' WHERE duration IS NOT NULL")
+        op.alter_column('videos', 'probe_status', server_default=None)
+
+
+def downgrade() -> None:
+    for name in ('probe_status', 'probed_at', 'bit_rate', 'height', 'width', 'video_codec'):
+        op.drop_column('videos', name)
+    postgresql.ENUM(name='mediaprobestatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,34 @@
+"""add media_blobs for content-addressed video storage
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '011'
+down_revision: Union[str, None] = '010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    if 'media_blobs' not in inspector.get_table_names():
+        op.create_table(
+            'media_blobs',
+            sa.Column('sha256', sa.String(length=64), primary_key=True),
+            sa.Column('size', sa.BigInteger(), nullable=False),
+            sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('media_blobs')
@@ -0,0 +1,70 @@
+"""add HLS renditions and transcode status to videos
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '012'
+down_revision: Union[str, None] = '011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {c['name'] for c in inspector.get_columns('videos')}
+
+    transcode_status_enum = postgresql.ENUM('PENDING', 'DONE', 'FAILED', 'SKIPPED', name='transcodestatus')
+    transcode_status_enum.create(bind, checkfirst=True)
+
+    if 'hls_path' not in columns:
+        op.add_column('videos', sa.Column('hls_path', sa.String(length=1000), nullable=True))
+
+    if 'transcode_status' not in columns:
+        op.add_column('videos', sa.Column(
+            'transcode_status',
+            postgresql.ENUM('PENDING', 'DONE', 'FAILED', 'SKIPPED', name='transcodestatus', create_type=False),
+            nullable=False,
+            server_default='PENDING'
+        ))
+        # Перекодируются только файлы из хранилища /media; старые загрузки - в исходном качестве
+        op.execute(
+            "UPDATE videos SET transcode_status = 'SKIPPED' "
+            "WHERE content_sha256 IS NULL OR file_path NOT LIKE '/media/%'"
+        )
+        op.alter_column('videos', 'transcode_status', server_default=None)
+
+    if 'video_renditions' not in inspector.get_table_names():
+        op.create_table(
+            'video_renditions',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('video_id', sa.Integer(), sa.ForeignKey('videos.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('name', sa.String(length=32), nullable=False),
+            sa.Column('width', sa.Integer(), nullable=False),
+            sa.Column('height', sa.Integer(), nullable=False),
+            sa.Column('bandwidth', sa.Integer(), nullable=False),
+            sa.Column('average_bandwidth', sa.Integer(), nullable=False),
+            sa.Column('codecs', sa.String(length=64), nullable=True),
+            sa.Column('playlist_path', sa.String(length=1000), nullable=False),
+            sa.Column('file_path', sa.String(length=1000), nullable=False),
+            sa.Column('file_size', sa.BigInteger(), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        )
+        op.create_index('ix_video_renditions_id', 'video_renditions', ['id'])
+        op.create_index('ix_video_renditions_video_id', 'video_renditions', ['video_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('video_renditions')
+    op.drop_column('videos', 'transcode_status')
+    op.drop_column('videos', 'hls_path')
+    postgresql.ENUM(name='transcodestatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,35 @@
+"""add unique (tariff, version, start_hour) to rate cards
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '014'
+down_revision: Union[str, None] = '013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    indexes = {i['name'] for i in inspector.get_indexes('rate_cards')}
+
+    if 'uq_rate_cards_tariff_version_start_hour' not in indexes:
+        op.create_index(
+            'uq_rate_cards_tariff_version_start_hour',
+            'rate_cards',
+            ['tariff', 'version', 'start_hour'],
+            unique=True
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_rate_cards_tariff_version_start_hour', table_name='rate_cards')
@@ -0,0 +1,47 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.metrics import request_metrics
+from app.core.security import password_hasher
+from app.db.pool import pool_stats
+
+# Служебные эндпоинты для эксплуатации (не попадают в OpenAPI-схему)
+router = APIRouter(prefix="/internal", include_in_schema=False)
+
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)) -> None:
+    """
+    Требовать INTERNAL_API_TOKEN в заголовке X-Internal-Token.
+
+    Без настроенного токена эндпоинты закрыты (404): загрузка пулов и очередей
+    подсказывает, когда проще всего исчерпать их запросами.
+    """
+    expected = settings.INTERNAL_API_TOKEN
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not (x_internal_token and secrets.compare_digest(x_internal_token, expected)):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal token")
+
+
+@router.get("/db-pool", dependencies=[Depends(require_internal_token)])
+def get_db_pool_stats():
+    """Состояние пулов соединений: занято, overflow, гистограмма ожидания checkout"""
+    return pool_stats()
+
+
+@router.get("/password-hasher", dependencies=[Depends(require_internal_token)])
+def get_password_hasher_stats():
+    """Очередь пула хеширования паролей: ожидают, выполняются, отказы, время ожидания"""
+    return password_hasher.stats()
+
+
+@router.get("/metrics", dependencies=[Depends(require_internal_token)], response_class=PlainTextResponse)
+def get_request_metrics():
+    """Метрики запросов по маршрутам в формате Prometheus"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,113 @@
+import mimetypes
+import os
+import re
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from app.core.config import settings
+from app.core.media_response import MediaFileResponse
+from app.services.media_storage_service import MEDIA_URL_PREFIX, MediaStorageService
+
+# Раздача видеофайлов (вне /api/v1): /media - хранилище по SHA-256, /uploads/videos - старые загрузки
+router = APIRouter(tags=["media"])
+
+# Содержимое по URL с SHA-256 никогда не меняется: кешировать "навсегда"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_HLS_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+_HLS_LADDER = re.compile(r"^[0-9a-f]{10}$")
+_HLS_FILE = re.compile(r"^[a-z0-9]+\.(m3u8|mp4)$")
+_HLS_MEDIA_TYPES = {"m3u8": "application/vnd.apple.mpegurl", "mp4": "video/mp4"}
+
+
+def _accel_redirect(path: str) -> Optional[str]:
+    """Внутренний URL nginx для файла, если включен MEDIA_ACCEL_REDIRECT_PREFIX"""
+    prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX
+    if not prefix:
+        return None
+    relative = os.path.relpath(path, settings.MEDIA_ACCEL_REDIRECT_ROOT).replace(os.sep, "/")
+    return f"{prefix.rstrip('/')}/{relative}"
+
+
+def _media_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+@router.api_route(f"{MEDIA_URL_PREFIX}/{{name}}", methods=["GET", "HEAD"])
+def get_media(name: str):
+    """Файл видео по неизменяемому URL /media/<sha256>.<ext> (Range, ETag = SHA-256)"""
+    content_sha256 = MediaStorageService.parse_public_name(name)
+    if content_sha256 is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    blob_path = MediaStorageService.blob_path(content_sha256)
+    try:
+        stat_result = os.stat(blob_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    return MediaFileResponse(
+        blob_path,
+        stat_result,
+        media_type=_media_type(name),
+        etag=f'"{content_sha256}"',
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+        accel_redirect=_accel_redirect(blob_path)
+    )
+
+
+@router.api_route(f"{MEDIA_URL_PREFIX}/hls/{{content_sha256}}/{{ladder}}/{{name}}", methods=["GET", "HEAD"])
+def get_hls_file(content_sha256: str, ladder: str, name: str):
+    """
+    Плейлисты и fMP4-файлы лестницы качеств HLS.
+
+    Каталог лестницы публикуется один раз целиком и не меняется (идентификатор
+    лестницы - хеш параметров кодирования), поэтому кешируется так же навсегда.
+    """
+    if not (_HLS_SHA256.match(content_sha256) and _HLS_LADDER.match(ladder) and _HLS_FILE.match(name)):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    local_path = os.path.join(MediaStorageService.hls_dir(content_sha256), ladder, name)
+    try:
+        stat_result = os.stat(local_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    return MediaFileResponse(
+        local_path,
+        stat_result,
+        media_type=_HLS_MEDIA_TYPES[name.rsplit(".", 1)[1]],
+        etag=f'"{ladder}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+        accel_redirect=_accel_redirect(local_path)
+    )
+
+
+@router.api_route("/uploads/videos/{filename}", methods=["GET", "HEAD"])
+def get_legacy_upload(filename: str):
+    """
+    Видео, загруженные до хранилища /media.
+
+    Имя файла может быть перезаписано новой загрузкой, поэтому кеш короткий,
+    а ETag (mtime + размер) позволяет дешево перепроверить файл.
+    """
+    if filename != os.path.basename(filename) or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    local_path = os.path.join(settings.UPLOAD_DIR, filename)
+    try:
+        stat_result = os.stat(local_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not os.path.isfile(local_path):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    return MediaFileResponse(
+        local_path,
+        stat_result,
+        media_type=_media_type(filename),
+        etag=f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        cache_control=f"public, max-age={settings.LEGACY_MEDIA_MAX_AGE_SECONDS}",
+        accel_redirect=_accel_redirect(local_path)
+    )
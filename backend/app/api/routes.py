@@ -1,108 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse
+from app.core.media_response import MediaFileResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, timedelta, date
 import json
 import os
-import shutil
-import subprocess
+import re
+import uuid
 import logging
 
-from app.db.database import get_db
-from app.models.models import Vehicle, Video, Playlist, VehicleTariff, VideoType
+from app.db.database import get_db, get_async_db
+from app.models.models import Vehicle, Video, Playlist, VehicleTariff, VideoType, VideoDailyStats, MediaProbeStatus
 from app.schemas.schemas import (
     VehicleCreate, VehicleResponse, VehicleLogin, VehicleUpdate, Token,
     VideoCreate, VideoResponse, VideoUpdate,
     SessionStart, SessionResponse, SessionEnd,
-    PlaybackLogCreate, PlaybackLogResponse,
-    PlaylistResponse, VehicleAnalytics, ContractVideoItem, FillerVideoItem
+    PlaybackLogCreate, PlaybackLogResponse, PlaybackLogBatch, PlaybackLogBatchResponse,
+    PlaylistResponse, VehicleAnalytics,
+    FleetVehiclePage, FleetVideoPage, FleetTariffTotals, FulfillmentReport,
+    RateCardCreate, RateCardVersionResponse, OnlineFleet, OnlineTariffCount, VideoReach,
+    UploadSessionCreate, UploadSessionStatus, UploadSessionComplete, MediaManifestResponse, DepotBundleIndex
+)
+from app.core.security import (
+    password_needs_rehash, password_hasher, PasswordHasherBusy,
+    create_access_token, decode_access_token
 )
-from app.core.security import verify_password, get_password_hash, create_access_token, decode_access_token
 from app.core.config import settings
 from app.services.playlist_service import PlaylistService
 from app.services.analytics_service import AnalyticsService
+from app.services.fleet_analytics_service import FleetAnalyticsService
+from app.services.export_service import ExportService
+from app.services.fulfillment_service import FulfillmentService
+from app.services.rate_card_service import RateCardService, RateCardVersionConflict
+from app.services.presence_service import presence_tracker
+from app.services.live_stats_service import live_stats_hub
+from app.services.reach_service import ReachService
+from app.services.vehicle_identity_cache import VehicleIdentity, VehicleIdentityCache
+from app.services.upload_service import UploadService, UploadTooLarge, UploadMalformed
+from app.services.media_probe_service import MediaProbeQueue, media_probe_queue, quick_probe, local_video_path
+from app.services.media_storage_service import MediaStorageService
+from app.services.transcode_service import media_transcode_queue
+from app.services.media_manifest_service import MediaManifestService
+from app.services.depot_bundle_service import DepotBundleService, DepotBundleBusy
+from app.services.resumable_upload_service import (
+    ResumableUploadService, UploadNotFound, UploadOffsetMismatch, UploadChecksumMismatch
+)
 
 router = APIRouter()
 security = HTTPBearer()
 logger = logging.getLogger(__name__)
 
 
-def get_video_duration(file_path: str) -> Optional[float]:
-    """
-    Извлечь длительность видео из файла используя ffprobe.
-    
-    Args:
-        file_path: Путь к видео файлу
-        
-    Returns:
-        Длительность в секундах или None если не удалось извлечь
-    """
-    try:
-        # Проверяем доступность ffprobe
-        # В некоторых системах ffprobe может быть в /usr/bin/ffprobe
-        ffprobe_paths = ['ffprobe', '/usr/bin/ffprobe', '/usr/local/bin/ffprobe']
-        ffprobe_cmd = None
-        
-        for path in ffprobe_paths:
-            try:
-                result = subprocess.run(
-                    [path, '-version'],
-                    capture_output=True,
-                    timeout=5
-                )
-                if result.returncode == 0:
-                    ffprobe_cmd = path
-                    break
-            except (FileNotFoundError, subprocess.TimeoutExpired):
-                continue
-        
-        if not ffprobe_cmd:
-            logger.warning("ffprobe не найден. Установите ffmpeg для автоматического извлечения длительности видео.")
-            return None
-        
-        # Используем ffprobe для извлечения длительности
-        # Команда: ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 <file>
-        result = subprocess.run(
-            [
-                ffprobe_cmd,
-                '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                file_path
-            ],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0 and result.stdout.strip():
-            try:
-                duration = float(result.stdout.strip())
-                return duration if duration > 0 else None
-            except ValueError:
-                logger.warning(f"Не удалось распарсить длительность для {file_path}: {result.stdout}")
-                return None
-        else:
-            logger.warning(f"Не удалось извлечь длительность для {file_path}: {result.stderr}")
-            return None
-    except subprocess.TimeoutExpired:
-        logger.error(f"Таймаут при извлечении длительности для {file_path}")
-        return None
-    except Exception as e:
-        logger.error(f"Ошибка при извлечении длительности для {file_path}: {e}")
-        return None
-
-
 # ============ AUTH ============
 
-def get_current_vehicle(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> Vehicle:
-    """Получить текущий автомобиль из токена"""
-    token = credentials.credentials
-    payload = decode_access_token(token)
+def _token_vehicle_id(credentials: HTTPAuthorizationCredentials) -> int:
+    """ID автомобиля из подписанного токена (без обращения к БД)"""
+    payload = decode_access_token(credentials.credentials)
     
     if not payload:
         raise HTTPException(
@@ -114,7 +72,10 @@ def get_current_vehicle(
     if not vehicle_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
-    vehicle = db.query(Vehicle).filter(Vehicle.id == int(vehicle_id)).first()
+    return int(vehicle_id)
+
+
+def _ensure_active_vehicle(vehicle):
     if not vehicle:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vehicle not found")
     
@@ -124,13 +85,81 @@ def get_current_vehicle(
     return vehicle
 
 
+def _identity_query(vehicle_id: int):
+    return select(Vehicle.id, Vehicle.tariff, Vehicle.is_active).where(Vehicle.id == vehicle_id)
+
+
+def get_current_vehicle(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> VehicleIdentity:
+    """Получить текущий автомобиль из токена (тариф и статус - из кеша)"""
+    vehicle_id = _token_vehicle_id(credentials)
+    identity = VehicleIdentityCache.get(vehicle_id)
+    if identity is None:
+        row = db.execute(_identity_query(vehicle_id)).first()
+        if row is not None:
+            identity = VehicleIdentity(*row)
+            VehicleIdentityCache.set(identity)
+    return _ensure_active_vehicle(identity)
+
+
+async def get_current_vehicle_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> VehicleIdentity:
+    """
+    Получить текущий автомобиль из токена (асинхронная сессия).
+    
+    При попадании в память воркера соединение с БД не берется: AsyncSession
+    подключается лениво, при первом запросе.
+    """
+    vehicle_id = _token_vehicle_id(credentials)
+    identity = VehicleIdentityCache.get_local(vehicle_id)
+    if identity is None:
+        # Redis-клиент синхронный - не блокировать цикл событий
+        identity = await run_in_threadpool(VehicleIdentityCache.get, vehicle_id)
+    if identity is None:
+        row = (await db.execute(_identity_query(vehicle_id))).first()
+        if row is not None:
+            identity = VehicleIdentity(*row)
+            await run_in_threadpool(VehicleIdentityCache.set, identity)
+    return _ensure_active_vehicle(identity)
+
+
+def get_token_vehicle_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> int:
+    """
+    ID автомобиля только из подписи токена, без обращения к БД.
+    
+    Для сверхчастых вызовов (heartbeat): деактивация автомобиля здесь
+    не проверяется, она действует на остальные эндпоинты.
+    """
+    return _token_vehicle_id(credentials)
+
+
+async def _offload_password_hashing(coro):
+    """Выполнить bcrypt в пуле процессов; при перегрузке - 503 вместо ожидания"""
+    try:
+        return await coro
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, retry later",
+            headers={"Retry-After": "5"}
+        )
+
+
 @router.post("/auth/register", response_model=VehicleResponse)
-def register_vehicle(vehicle: VehicleCreate, db: Session = Depends(get_db)):
+async def register_vehicle(vehicle: VehicleCreate, db: AsyncSession = Depends(get_async_db)):
     """Регистрация нового автомобиля"""
     # Проверить существование
-    existing = db.query(Vehicle).filter(
-        (Vehicle.login == vehicle.login) | (Vehicle.car_number == vehicle.car_number)
-    ).first()
+    existing = (await db.execute(
+        select(Vehicle.id).where(
+            (Vehicle.login == vehicle.login) | (Vehicle.car_number == vehicle.car_number)
+        )
+    )).first()
     
     if existing:
         raise HTTPException(
@@ -141,7 +170,7 @@ def register_vehicle(vehicle: VehicleCreate, db: Session = Depends(get_db)):
     # Создать автомобиль
     new_vehicle = Vehicle(
         login=vehicle.login,
-        hashed_password=get_password_hash(vehicle.password),
+        hashed_password=await _offload_password_hashing(password_hasher.hash(vehicle.password)),
         car_number=vehicle.car_number,
         tariff=vehicle.tariff,
         driver_name=vehicle.driver_name,
@@ -149,18 +178,22 @@ def register_vehicle(vehicle: VehicleCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_vehicle)
-    db.commit()
-    db.refresh(new_vehicle)
+    await db.commit()
+    await db.refresh(new_vehicle)
     
     return new_vehicle
 
 
 @router.post("/auth/login", response_model=Token)
-def login_vehicle(credentials: VehicleLogin, db: Session = Depends(get_db)):
+async def login_vehicle(credentials: VehicleLogin, db: AsyncSession = Depends(get_async_db)):
     """Авторизация автомобиля"""
-    vehicle = db.query(Vehicle).filter(Vehicle.login == credentials.login).first()
+    vehicle = (await db.execute(
+        select(Vehicle).where(Vehicle.login == credentials.login)
+    )).scalar_one_or_none()
     
-    if not vehicle or not verify_password(credentials.password, vehicle.hashed_password):
+    if not vehicle or not await _offload_password_hashing(
+        password_hasher.verify(credentials.password, vehicle.hashed_password)
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect login or password"
@@ -172,16 +205,31 @@ def login_vehicle(credentials: VehicleLogin, db: Session = Depends(get_db)):
             detail="Vehicle is inactive"
         )
     
-    # Создать токен
+    # Хеш со старым BCRYPT_ROUNDS пересчитывается прозрачно, пока пароль известен
+    if password_needs_rehash(vehicle.hashed_password):
+        try:
+            vehicle.hashed_password = await password_hasher.hash(credentials.password)
+            await db.commit()
+        except PasswordHasherBusy:
+            # Не повод отказывать во входе - пересчитаем при следующем
+            pass
+    
+    # Создать токен; первый запрос устройства после входа не пойдет в БД за авторизацией
     access_token = create_access_token(data={"sub": str(vehicle.id)})
+    await run_in_threadpool(
+        VehicleIdentityCache.set, VehicleIdentity(vehicle.id, vehicle.tariff, vehicle.is_active)
+    )
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.get("/auth/me", response_model=VehicleResponse)
-def get_current_vehicle_info(current_vehicle: Vehicle = Depends(get_current_vehicle)):
+async def get_current_vehicle_info(
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle_async),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Получить информацию о текущем автомобиле"""
-    return current_vehicle
+    return _ensure_active_vehicle(await db.get(Vehicle, current_vehicle.id))
 
 
 # ============ VEHICLES (Admin) ============
@@ -216,13 +264,12 @@ def get_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
     return vehicle
 
 
-@router.put("/vehicles/{vehicle_id}", response_model=VehicleResponse)
-def update_vehicle(
+def _apply_vehicle_update(
+    db: Session,
     vehicle_id: int,
     vehicle_update: VehicleUpdate,
-    db: Session = Depends(get_db)
-):
-    """Обновить автомобиль"""
+    hashed_password: Optional[str]
+) -> Vehicle:
     vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehicle not found")
@@ -247,14 +294,34 @@ def update_vehicle(
     vehicle.phone = vehicle_update.phone
     
     # Обновить пароль только если указан новый
-    if vehicle_update.password:
-        vehicle.hashed_password = get_password_hash(vehicle_update.password)
+    if hashed_password:
+        vehicle.hashed_password = hashed_password
     
     db.commit()
     db.refresh(vehicle)
     return vehicle
 
 
+@router.put("/vehicles/{vehicle_id}", response_model=VehicleResponse)
+async def update_vehicle(
+    vehicle_id: int,
+    vehicle_update: VehicleUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Обновить автомобиль"""
+    # bcrypt - в пуле процессов и до транзакции, как при регистрации
+    hashed_password = None
+    if vehicle_update.password:
+        hashed_password = await _offload_password_hashing(password_hasher.hash(vehicle_update.password))
+    
+    vehicle = await db.run_sync(
+        lambda sync_db: _apply_vehicle_update(sync_db, vehicle_id, vehicle_update, hashed_password)
+    )
+    # Redis-клиент синхронный - в пуле потоков
+    await run_in_threadpool(VehicleIdentityCache.invalidate, vehicle_id)
+    return vehicle
+
+
 @router.delete("/vehicles/{vehicle_id}")
 def delete_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
     """Удалить автомобиль"""
@@ -264,67 +331,236 @@ def delete_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
     
     db.delete(vehicle)
     db.commit()
+    VehicleIdentityCache.invalidate(vehicle_id)
     return {"message": "Vehicle deleted successfully"}
 
 
 # ============ VIDEOS ============
 
-@router.post("/videos", response_model=VideoResponse)
+# Тело разбирается вручную из потока (UploadService.save_multipart) - схема формы для /docs
+_UPLOAD_VIDEO_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["title", "video_type", "tariffs", "file"],
+                    "properties": {
+                        "title": {"type": "string"},
+                        "video_type": {"type": "string", "enum": [t.value for t in VideoType]},
+                        "tariffs": {"type": "string", "description": 'JSON: ["standard", "comfort"]'},
+                        "plays_per_hour": {"type": "integer"},
+                        "priority": {"type": "integer", "default": 0},
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/videos", response_model=VideoResponse, openapi_extra=_UPLOAD_VIDEO_OPENAPI)
 async def upload_video(
-    title: str = Form(...),
-    video_type: VideoType = Form(...),
-    tariffs: str = Form(...),  # JSON string: ["standard", "comfort"]
-    plays_per_hour: int = Form(None),
-    priority: int = Form(0),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Загрузка видео"""
-    # Создать директорию если не существует
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    """
+    Загрузка видео (multipart/form-data: title, video_type, tariffs, plays_per_hour, priority, file).
     
-    # Сохранить файл на диск
-    local_file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-    with open(local_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    Форма разбирается из потока запроса: файл пишется на диск один раз, кусками
+    через aiofiles, MAX_VIDEO_SIZE_MB проверяется по мере приема (413 сразу при
+    превышении), SHA-256 - в том же проходе. Метаданные извлекаются в фоне -
+    загрузка не задерживает остальные запросы воркера.
+    """
+    local_file_path = os.path.join(settings.UPLOAD_INCOMING_DIR, f"{uuid.uuid4().hex}.upload")
     
-    # Получить размер файла
-    file_size = os.path.getsize(local_file_path)
+    # Сохранить файл на диск
+    try:
+        UploadService.check_declared_size(request.headers.get("content-length"))
+        fields, filename, file_size, content_sha256 = await UploadService.save_multipart(
+            request.headers, request.stream(), local_file_path
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except UploadMalformed as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
-    # Извлечь длительность видео
-    duration = get_video_duration(local_file_path)
-    if duration is None:
-        logger.warning(f"Не удалось автоматически извлечь длительность для {file.filename}. "
-                      f"Видео будет создано без длительности. "
-                      f"Установите ffmpeg или обновите длительность вручную через API.")
+    try:
+        form = VideoCreate(
+            title=fields.get("title"),
+            video_type=fields.get("video_type"),
+            tariffs=json.loads(fields.get("tariffs") or "null"),
+            plays_per_hour=fields.get("plays_per_hour") or None,
+            priority=fields.get("priority") or 0
+        )
+    except ValueError as e:
+        os.remove(local_file_path)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    
+    return await _create_uploaded_video(
+        db, os.path.basename(filename), local_file_path, file_size, content_sha256,
+        title=form.title,
+        video_type=form.video_type,
+        tariffs=form.tariffs,
+        plays_per_hour=form.plays_per_hour,
+        priority=form.priority
+    )
+
+
+async def _create_uploaded_video(
+    db: AsyncSession,
+    filename: str,
+    local_file_path: str,
+    file_size: int,
+    content_sha256: str,
+    title: str,
+    video_type: VideoType,
+    tariffs: List[str],
+    plays_per_hour: Optional[int],
+    priority: int
+) -> Video:
+    """
+    Общий хвост обычной и возобновляемой загрузки: файл в хранилище, метаданные и запись видео.
     
-    # Парсить тарифы
-    tariffs_list = json.loads(tariffs)
-    tariffs_str = ",".join(tariffs_list)
+    local_file_path - временный файл загрузки; он переносится в контентно-адресуемое
+    хранилище (или удаляется, если такое содержимое уже есть). MP4/MOV разбираются
+    сразу встроенным парсером (читает только moov); остальные контейнеры уходят
+    в фоновую очередь ffprobe (probe_status=pending до окончания). Разобранное
+    видео ставится в очередь перекодирования в лестницу качеств HLS.
+    """
+    try:
+        blob_path = await MediaStorageService.acquire(db, local_file_path, content_sha256, file_size)
+        media_info = await run_in_threadpool(quick_probe, blob_path)
+    except BaseException:
+        await db.rollback()
+        if os.path.exists(local_file_path):
+            os.remove(local_file_path)
+        raise
     
-    # Путь для клиента: /uploads/videos/filename
-    client_path = f"/uploads/videos/{file.filename}"
+    # Тарифы
+    tariffs_str = ",".join(t.value if isinstance(t, VehicleTariff) else t for t in tariffs)
     
     # Создать запись видео
     video = Video(
         title=title,
-        filename=file.filename,
-        file_path=client_path,  # URL путь для клиентов
+        filename=filename,
+        # Неизменяемый URL для клиентов: /media/<sha256>.<ext>
+        file_path=MediaStorageService.public_url(content_sha256, filename),
         file_size=file_size,
-        duration=duration,  # Длительность в секундах (может быть None)
+        content_sha256=content_sha256,
+        probe_status=MediaProbeStatus.PENDING,
         video_type=video_type,
         plays_per_hour=plays_per_hour,
         tariffs=tariffs_str,
         priority=priority
     )
     
+    if media_info is not None:
+        MediaProbeQueue.apply(video, media_info)
+    
     db.add(video)
-    db.commit()
-    db.refresh(video)
+    await db.commit()
+    await db.refresh(video)
+    if media_info is None:
+        media_probe_queue.enqueue(video.id)
+    elif video.probe_status == MediaProbeStatus.DONE:
+        media_transcode_queue.enqueue(video.id)
     
     return video
 
 
+# Возобновляемая загрузка: POST /videos/uploads -> PUT кусков -> POST .../complete.
+# После обрыва клиент запрашивает GET /videos/uploads/{id} и продолжает с offset.
+
+@router.post("/videos/uploads", response_model=UploadSessionStatus, status_code=status.HTTP_201_CREATED)
+async def create_video_upload(data: UploadSessionCreate):
+    """Начать возобновляемую загрузку видео"""
+    try:
+        return await ResumableUploadService.create(data)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+
+@router.get("/videos/uploads/{upload_id}", response_model=UploadSessionStatus)
+async def get_video_upload(upload_id: str):
+    """Состояние загрузки: сколько байт уже принято"""
+    try:
+        return await ResumableUploadService.get_status(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@router.put("/videos/uploads/{upload_id}", response_model=UploadSessionStatus)
+async def put_video_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int,
+    x_chunk_sha256: str = Header(..., pattern="^[0-9a-fA-F]{64}$")
+):
+    """
+    Принять кусок (тело запроса - сырые байты) начиная с offset.
+    
+    Кусок проверяется по заголовку X-Chunk-SHA256 до записи. Если offset не
+    совпадает с принятым на сервере - 409 с актуальным смещением в X-Upload-Offset.
+    """
+    try:
+        return await ResumableUploadService.write_chunk(upload_id, offset, x_chunk_sha256, request.stream())
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadOffsetMismatch as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers={"X-Upload-Offset": str(e.offset)}
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except UploadChecksumMismatch as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@router.post("/videos/uploads/{upload_id}/complete", response_model=VideoResponse)
+async def complete_video_upload(
+    upload_id: str,
+    data: UploadSessionComplete,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Завершить загрузку: проверить файл и создать видео (как POST /videos)"""
+    try:
+        filename, local_file_path, file_size, content_sha256 = await ResumableUploadService.finalize(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadOffsetMismatch as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload is incomplete: {e}",
+            headers={"X-Upload-Offset": str(e.offset)}
+        )
+    except UploadChecksumMismatch as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    
+    return await _create_uploaded_video(
+        db, filename, local_file_path, file_size, content_sha256,
+        title=data.title,
+        video_type=data.video_type,
+        tariffs=data.tariffs,
+        plays_per_hour=data.plays_per_hour,
+        priority=data.priority
+    )
+
+
+@router.delete("/videos/uploads/{upload_id}")
+async def abort_video_upload(upload_id: str):
+    """Отменить загрузку и удалить принятые куски"""
+    try:
+        await ResumableUploadService.abort(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"message": "Upload aborted"}
+
+
 @router.get("/videos", response_model=List[VideoResponse])
 def get_videos(
     tariff: VehicleTariff = None,
@@ -396,16 +632,17 @@ def delete_video(video_id: int, db: Session = Depends(get_db)):
     Удалить видео.
     
     Если видео использовалось (есть playback_logs), выполняется soft delete (деактивация).
-    Если видео не использовалось, выполняется физическое удаление + удаление файла.
+    Если видео не использовалось, выполняется физическое удаление; файл из хранилища
+    удаляется вместе с последним видео, которое на него ссылается.
     """
     video = db.query(Video).filter(Video.id == video_id).first()
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Проверить наличие playback_logs
-    from app.models.models import PlaybackLog
-    has_playback_logs = db.query(PlaybackLog).filter(
-        PlaybackLog.video_id == video_id
+    # Проверить наличие воспроизведений по дневным агрегатам:
+    # это точечный поиск по первичному ключу вместо обхода всех секций playback_logs
+    has_playback_logs = db.query(VideoDailyStats.video_id).filter(
+        VideoDailyStats.video_id == video_id
     ).first() is not None
     
     if has_playback_logs:
@@ -419,16 +656,26 @@ def delete_video(video_id: int, db: Session = Depends(get_db)):
         }
     else:
         # Hard delete - физическое удаление видео и файла
-        local_path = os.path.join(settings.UPLOAD_DIR, video.filename)
-        if os.path.exists(local_path):
-            try:
-                os.remove(local_path)
-            except Exception as e:
-                # Не останавливать удаление если файл не удалился
-                print(f"Warning: Could not delete file {local_path}: {e}")
+        content_sha256 = MediaStorageService.video_sha256(video)
+        last_reference = False
+        if content_sha256:
+            # Строка media_blobs заблокирована до commit: параллельная загрузка того же файла ждет
+            last_reference = MediaStorageService.release(db, content_sha256)
+        else:
+            # Видео, загруженное до хранилища: файл в UPLOAD_DIR принадлежит только ему
+            local_path = local_video_path(video)
+            if os.path.exists(local_path):
+                try:
+                    os.remove(local_path)
+                except Exception as e:
+                    # Не останавливать удаление если файл не удалился
+                    print(f"Warning: Could not delete file {local_path}: {e}")
         
         db.delete(video)
         db.commit()
+        if last_reference:
+            # Файл удаляется только после commit: при откате ссылка осталась бы без файла
+            MediaStorageService.purge(db, content_sha256)
         return {"message": "Video deleted successfully (hard delete)"}
 
 
@@ -448,42 +695,16 @@ def _get_base_url(request: Request) -> str:
 
 def _build_playlist_response(db: Session, playlist: Playlist, request: Request) -> PlaylistResponse:
     """Построить PlaylistResponse из объекта Playlist"""
-    # Построить временную шкалу плейлиста
-    base_url = _get_base_url(request)
-    contract_videos, filler_videos = PlaylistService.build_playlist_timeline(db, playlist, base_url)
-    
-    # Получить упорядоченную последовательность видео
-    try:
-        video_sequence = json.loads(playlist.video_sequence)
-    except (json.JSONDecodeError, TypeError):
-        video_sequence = []
-    
-    return PlaylistResponse(
-        id=playlist.id,
-        vehicle_id=playlist.vehicle_id,
-        tariff=playlist.tariff,
-        contract_videos=[ContractVideoItem(**item) for item in contract_videos],
-        filler_videos=[FillerVideoItem(**item) for item in filler_videos],
-        video_sequence=video_sequence,
-        total_duration=3600.0,  # 1 час
-        valid_from=playlist.valid_from,
-        valid_until=playlist.valid_until,
-        created_at=playlist.created_at
-    )
+    return PlaylistService.build_playlist_response(db, playlist, _get_base_url(request))
 
 
-@router.get("/playlists/current", response_model=PlaylistResponse)
-def get_current_playlist(
-    request: Request,
-    current_vehicle: Vehicle = Depends(get_current_vehicle),
-    db: Session = Depends(get_db)
-):
-    """Получить текущий плейлист для автомобиля"""
+def _resolve_current_playlist(db: Session, vehicle: VehicleIdentity) -> Playlist:
+    """Активный плейлист автомобиля (индивидуальный или по тарифу), при необходимости - новый"""
     # Ищем сначала индивидуальный плейлист, потом общий по тарифу
     playlist = PlaylistService.get_active_playlist(
         db, 
-        current_vehicle.tariff, 
-        current_vehicle.id
+        vehicle.tariff, 
+        vehicle.id
     )
     
     # Проверить, что плейлист имеет непустую последовательность
@@ -501,19 +722,61 @@ def get_current_playlist(
         # Создать новый плейлист по тарифу (без vehicle_id)
         playlist = PlaylistService.create_playlist(
             db, 
-            current_vehicle.tariff,
+            vehicle.tariff,
             vehicle_id=None,  # Общий плейлист по тарифу
             hours=24
         )
     
-    return _build_playlist_response(db, playlist, request)
+    return playlist
+
+
+def _current_playlist_response(db: Session, vehicle: VehicleIdentity, request: Request) -> PlaylistResponse:
+    return _build_playlist_response(db, _resolve_current_playlist(db, vehicle), request)
+
+
+def _media_manifest(db: Session, vehicle: VehicleIdentity, request: Request, max_height: int) -> MediaManifestResponse:
+    current = _resolve_current_playlist(db, vehicle)
+    next_playlist = PlaylistService.get_next_playlist(db, current)
+    return MediaManifestService.build(db, vehicle.id, current, next_playlist, _get_base_url(request), max_height)
+
+
+@router.get("/playlists/current", response_model=PlaylistResponse)
+async def get_current_playlist(
+    request: Request,
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получить текущий плейлист для автомобиля"""
+    return await db.run_sync(
+        lambda sync_db: _current_playlist_response(sync_db, current_vehicle, request)
+    )
+
+
+@router.get("/playlists/current/manifest", response_model=MediaManifestResponse)
+async def get_media_manifest(
+    request: Request,
+    max_height: int = 720,
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Манифест синхронизации медиа для текущего и следующего плейлиста.
+    
+    Каждый нужный файл - один раз, с SHA-256, размером и секундой первого
+    воспроизведения, в порядке воспроизведения. Устройство сверяет его с
+    локальным кешем и докачивает только недостающее до смены часа/плейлиста.
+    max_height - максимальная высота качества HLS, которое воспроизводит устройство.
+    """
+    return await db.run_sync(
+        lambda sync_db: _media_manifest(sync_db, current_vehicle, request, max_height)
+    )
 
 
 @router.post("/playlists/regenerate", response_model=PlaylistResponse)
 def regenerate_playlist(
     request: Request,
     hours: int = 24,
-    current_vehicle: Vehicle = Depends(get_current_vehicle),
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle),
     db: Session = Depends(get_db)
 ):
     """Принудительно сгенерировать новый плейлист по тарифу"""
@@ -643,55 +906,120 @@ def admin_regenerate_playlist_by_tariff(
 
 # ============ SESSIONS ============
 
+# Горячие эндпоинты устройств работают на AsyncSession: ожидание БД не держит
+# поток из пула, а сервисы переиспользуются через db.run_sync (тот же код,
+# ввод-вывод идет через asyncpg в цикле событий).
+
 @router.post("/sessions/start", response_model=SessionResponse)
-def start_session(
-    current_vehicle: Vehicle = Depends(get_current_vehicle),
-    db: Session = Depends(get_db)
+async def start_session(
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Начать сессию работы"""
-    session = AnalyticsService.start_session(db, current_vehicle.id)
+    vehicle_id = current_vehicle.id
+    session = await db.run_sync(lambda sync_db: AnalyticsService.start_session(sync_db, vehicle_id))
+    presence_tracker.heartbeat(vehicle_id, session.id)
     return session
 
 
 @router.post("/sessions/end", response_model=SessionResponse)
-def end_session(
+async def end_session(
     session_id: int,
-    current_vehicle: Vehicle = Depends(get_current_vehicle),
-    db: Session = Depends(get_db)
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Завершить сессию работы"""
-    session = AnalyticsService.end_session(db, session_id)
-    return session
+    try:
+        return await db.run_sync(lambda sync_db: AnalyticsService.end_session(sync_db, session_id))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.post("/sessions/heartbeat", status_code=status.HTTP_204_NO_CONTENT)
+async def session_heartbeat(
+    session_id: Optional[int] = None,
+    vehicle_id: int = Depends(get_token_vehicle_id)
+):
+    """
+    Heartbeat устройства (рекомендуемый интервал - 30 секунд).
+    
+    Обновляет только last-seen в памяти воркера; в Redis и БД он попадает
+    пачкой раз в HEARTBEAT_FLUSH_INTERVAL_SECONDS. Сессии без heartbeat дольше
+    SESSION_STALE_AFTER_SECONDS закрываются автоматически.
+    """
+    presence_tracker.heartbeat(vehicle_id, session_id)
 
 
 # ============ PLAYBACK LOGS ============
 
 @router.post("/playback", response_model=PlaybackLogResponse)
-def log_playback(
+async def log_playback(
     log_data: PlaybackLogCreate,
     session_id: int = None,
-    current_vehicle: Vehicle = Depends(get_current_vehicle),
-    db: Session = Depends(get_db)
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Записать лог воспроизведения видео"""
-    log = AnalyticsService.log_playback(
-        db,
-        vehicle_id=current_vehicle.id,
-        video_id=log_data.video_id,
-        duration_seconds=log_data.duration_seconds,
-        session_id=session_id,
-        completed=log_data.completed
-    )
+    vehicle_id, tariff = current_vehicle.id, current_vehicle.tariff
+    try:
+        log = await db.run_sync(lambda sync_db: AnalyticsService.log_playback(
+            sync_db,
+            vehicle_id=vehicle_id,
+            video_id=log_data.video_id,
+            duration_seconds=log_data.duration_seconds,
+            session_id=session_id,
+            completed=log_data.completed,
+            tariff=tariff,
+            played_at=log_data.played_at
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Redis-клиент синхронный - не внутри run_sync (цикл событий), а в пуле потоков
+    await run_in_threadpool(AnalyticsService.invalidate_closed_days, vehicle_id, [log])
+    presence_tracker.heartbeat(vehicle_id, session_id)
     return log
 
 
+@router.post("/playback/batch", response_model=PlaybackLogBatchResponse)
+async def log_playback_batch(
+    batch: PlaybackLogBatch,
+    session_id: int = None,
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Записать пачку логов воспроизведения одной транзакцией
+    (например, накопленных устройством офлайн).
+    """
+    if len(batch.logs) > settings.PLAYBACK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch is limited to {settings.PLAYBACK_BATCH_MAX_SIZE} logs"
+        )
+    vehicle_id, tariff = current_vehicle.id, current_vehicle.tariff
+    try:
+        logs = await db.run_sync(lambda sync_db: AnalyticsService.log_playback_batch(
+            sync_db,
+            vehicle_id=vehicle_id,
+            entries=batch.logs,
+            session_id=session_id,
+            tariff=tariff
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Redis-клиент синхронный - не внутри run_sync (цикл событий), а в пуле потоков
+    await run_in_threadpool(AnalyticsService.invalidate_closed_days, vehicle_id, logs)
+    presence_tracker.heartbeat(vehicle_id, session_id)
+    return PlaybackLogBatchResponse(accepted=len(logs))
+
+
 # ============ ANALYTICS ============
 
 @router.get("/analytics/me", response_model=VehicleAnalytics)
 def get_my_analytics(
     start_date: date = None,
     end_date: date = None,
-    current_vehicle: Vehicle = Depends(get_current_vehicle),
+    current_vehicle: VehicleIdentity = Depends(get_current_vehicle),
     db: Session = Depends(get_db)
 ):
     """Получить аналитику для текущего автомобиля"""
@@ -733,3 +1061,294 @@ def get_vehicle_analytics_by_id(
     )
     
     return analytics
+
+
+# ============ FLEET ANALYTICS (Admin) ============
+
+def _default_period(start_date: Optional[date], end_date: Optional[date]):
+    """Период по умолчанию - последние 30 дней"""
+    if not start_date:
+        start_date = date.today() - timedelta(days=30)
+    if not end_date:
+        end_date = date.today()
+    return start_date, end_date
+
+
+@router.get("/analytics/fleet/vehicles", response_model=FleetVehiclePage)
+def get_fleet_vehicle_totals(
+    start_date: date = None,
+    end_date: date = None,
+    tariff: VehicleTariff = None,
+    sort_by: str = "earnings",
+    order: str = "desc",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Итоги по автомобилям всего парка за период.
+    
+    Keyset-пагинация: передайте next_cursor из ответа, чтобы получить следующую страницу.
+    """
+    start_date, end_date = _default_period(start_date, end_date)
+    try:
+        return FleetAnalyticsService.get_vehicle_totals(
+            db, start_date, end_date,
+            sort_by=sort_by, order=order, limit=limit, cursor=cursor, tariff=tariff
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/analytics/fleet/videos", response_model=FleetVideoPage)
+def get_fleet_video_totals(
+    start_date: date = None,
+    end_date: date = None,
+    tariff: VehicleTariff = None,
+    sort_by: str = "play_count",
+    order: str = "desc",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Итоги по видео по всему парку за период (keyset-пагинация)"""
+    start_date, end_date = _default_period(start_date, end_date)
+    try:
+        return FleetAnalyticsService.get_video_totals(
+            db, start_date, end_date,
+            sort_by=sort_by, order=order, limit=limit, cursor=cursor, tariff=tariff
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/analytics/fleet/tariffs", response_model=List[FleetTariffTotals])
+def get_fleet_tariff_totals(
+    start_date: date = None,
+    end_date: date = None,
+    sort_by: str = "earnings",
+    order: str = "desc",
+    db: Session = Depends(get_db)
+):
+    """Итоги по тарифам за период"""
+    start_date, end_date = _default_period(start_date, end_date)
+    try:
+        return FleetAnalyticsService.get_tariff_totals(
+            db, start_date, end_date, sort_by=sort_by, order=order
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+
+@router.get("/analytics/fleet/online", response_model=OnlineFleet)
+def get_online_fleet(db: Session = Depends(get_db)):
+    """
+    Автомобили онлайн (heartbeat за ONLINE_WINDOW_SECONDS) по тарифам.
+    
+    Данные - из Redis (общие для всех воркеров); без Redis - по vehicles.last_seen_at,
+    который отстает на интервал сброса heartbeat'ов.
+    """
+    counts = presence_tracker.online_counts(db)
+    return OnlineFleet(
+        total=sum(counts.values()),
+        by_tariff=[
+            OnlineTariffCount(tariff=tariff, online=counts.get(tariff, 0))
+            for tariff in VehicleTariff
+        ]
+    )
+
+
+@router.get("/analytics/videos/{video_id}/reach", response_model=VideoReach)
+def get_video_reach(
+    video_id: int,
+    start_date: date = None,
+    end_date: date = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Охват видео: сколько разных автомобилей его показали за период.
+    
+    Оценка по HyperLogLog-скетчам (дни и месяцы объединяются без чтения
+    playback_logs): стандартная ошибка ~1.6%, интервал [lower_bound, upper_bound] ~95%.
+    """
+    start_date, end_date = _default_period(start_date, end_date)
+    try:
+        return ReachService.get_video_reach(db, video_id, start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/analytics/live")
+async def stream_live_stats():
+    """
+    Server-Sent Events: живые счетчики раз в LIVE_STATS_PUSH_INTERVAL_SECONDS
+    (показы в минуту по тарифам, активные автомобили, топ видео).
+    
+    Счетчики берутся из кольцевых буферов в памяти, которые наполняет прием логов;
+    снимок строится один раз на тик для всех подписчиков, БД не используется.
+    """
+    async def events():
+        async for snapshot in live_stats_hub.subscribe():
+            yield f"data: {snapshot.model_dump_json()}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/reports/contracts/fulfillment", response_model=FulfillmentReport)
+def get_contract_fulfillment(
+    start_date: date = None,
+    end_date: date = None,
+    video_id: Optional[int] = None,
+    tariff: VehicleTariff = None,
+    tolerance: float = 0.0,
+    include_hours: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Выполнение контрактов: фактические показы против plays_per_hour * активные автомобили.
+    
+    Для каждого контракта - итоги по тарифам и список недовыполненных часов.
+    """
+    start_date, end_date = _default_period(start_date, end_date)
+    try:
+        return FulfillmentService.get_contract_fulfillment(
+            db, start_date, end_date,
+            video_id=video_id, tariff=tariff, tolerance=tolerance, include_hours=include_hours
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+# ============ RATE CARDS (Admin) ============
+
+@router.get("/rate-cards", response_model=List[RateCardVersionResponse])
+def list_rate_cards(
+    tariff: VehicleTariff = None,
+    db: Session = Depends(get_db)
+):
+    """Все версии карт ставок (новые первыми)"""
+    return RateCardService.list_versions(db, tariff)
+
+
+@router.post("/rate-cards", response_model=RateCardVersionResponse)
+def create_rate_card(
+    card: RateCardCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Создать новую версию карты ставок тарифа.
+    
+    Части суток должны покрывать 0-24 ч без пропусков. Версия вступает в силу
+    с effective_from - не раньше, чем через RATE_CARD_CACHE_TTL_SECONDS; уже начисленный
+    заработок не пересчитывается.
+    """
+    try:
+        return RateCardService.create_version(db, card)
+    except RateCardVersionConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+# ============ EXPORT (Admin) ============
+
+@router.get("/export/playback-logs")
+def export_playback_logs(
+    month: Optional[str] = None,
+    start_date: date = None,
+    end_date: date = None,
+    format: str = "csv",
+):
+    """
+    Потоковая выгрузка логов воспроизведения (с автомобилем и видео) для биллинга.
+    
+    Период: month=YYYY-MM или start_date/end_date (включительно).
+    Форматы: csv, csv.gz, parquet (zstd), arrow (IPC stream, zstd).
+    """
+    try:
+        if month:
+            start, end = ExportService.month_range(month)
+            label = month
+        elif start_date and end_date:
+            start, end = ExportService.date_range(start_date, end_date)
+            label = f"{start_date.isoformat()}_{end_date.isoformat()}"
+        else:
+            raise ValueError("Specify month or both start_date and end_date")
+        stream = ExportService.stream_export(start, end, fmt=format)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    
+    media_type, extension = ExportService.FORMATS[format]
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="playback_logs_{label}.{extension}"'}
+    )
+
+
+# ============ DEPOT BUNDLES (Admin) ============
+
+@router.post("/depot/bundles/{tariff}/build", response_model=DepotBundleIndex)
+def build_depot_bundle(
+    tariff: VehicleTariff,
+    hours: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Собрать пакет депо тарифа: плейлисты на hours (DEPOT_BUNDLE_HOURS) вперед и их медиа.
+    
+    Неизмененные файлы переносятся из предыдущего пакета; если состав не изменился,
+    возвращается оглавление предыдущего. То же делает python build_depot_bundle.py.
+    """
+    try:
+        return DepotBundleService.build(db, tariff, hours)
+    except DepotBundleBusy:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Bundle is already being built")
+
+
+@router.get("/depot/bundles/{tariff}", response_model=DepotBundleIndex)
+def get_depot_bundle_index(tariff: VehicleTariff):
+    """Оглавление последнего пакета: файлы со смещением в архиве, размером и SHA-256"""
+    index = DepotBundleService.load_index(tariff)
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Bundle not built yet")
+    return index
+
+
+@router.api_route("/depot/bundles/{tariff}/archive", methods=["GET", "HEAD"])
+def get_depot_bundle_archive(tariff: VehicleTariff, bundle_id: Optional[str] = None):
+    """
+    Архив пакета (tar) с Range и ETag = bundle_id.
+    
+    Прерванная загрузка продолжается с Range + If-Range; если пакет успели
+    пересобрать, If-Range не совпадет и придет новый архив целиком. bundle_id -
+    конкретный пакет (текущий или предыдущий, пока он не удален).
+    """
+    if bundle_id is None:
+        index = DepotBundleService.load_index(tariff)
+        if index is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Bundle not built yet")
+        bundle_id = index.bundle_id
+    elif not re.fullmatch(r"[0-9a-f]{32}", bundle_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Bundle not found")
+
+    archive_path = DepotBundleService.archive_path(tariff, bundle_id)
+    try:
+        stat_result = os.stat(archive_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Bundle not found")
+
+    return MediaFileResponse(
+        archive_path,
+        stat_result,
+        media_type="application/x-tar",
+        etag=f'"{bundle_id}"',
+        cache_control="no-cache"
+    )
@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Потокобезопасный in-process кеш с TTL и ограничением размера (LRU).
+
+    Живет в памяти одного воркера; для согласованности между воркерами
+    используется Redis (см. get_redis), а TTL ограничивает устаревание.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at < now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Вернуть только найденные (и не просроченные) ключи"""
+        result = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                result[key] = value
+        return result
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ============ REDIS ============
+
+_redis_client = None
+_redis_lock = threading.Lock()
+_redis_disabled_until = 0.0
+
+# Пауза после ошибки Redis, чтобы не ждать таймаут на каждом запросе
+REDIS_RETRY_AFTER_SECONDS = 30.0
+
+
+def get_redis():
+    """
+    Общий клиент Redis или None, если Redis отключен или недавно был недоступен.
+
+    Redis здесь - ускоритель, а не источник истины: при ошибке вызывающий код
+    должен вызвать mark_redis_failed() и продолжить работу без него.
+    """
+    global _redis_client
+
+    if not settings.REDIS_ENABLED or time.monotonic() < _redis_disabled_until:
+        return None
+
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                try:
+                    import redis
+                except ImportError:
+                    logger.warning("redis package is not installed, Redis cache disabled")
+                    return None
+                _redis_client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                )
+    return _redis_client
+
+
+def mark_redis_failed(error: Exception) -> None:
+    """Временно отключить Redis после ошибки соединения/таймаута"""
+    global _redis_disabled_until
+    _redis_disabled_until = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+    logger.warning("Redis unavailable, skipping for %.0fs: %s", REDIS_RETRY_AFTER_SECONDS, error)
@@ -0,0 +1,97 @@
+import hashlib
+import math
+from typing import Iterable, Optional, Tuple
+
+# 2^12 регистров по байту: 4 КБ на скетч, стандартная ошибка 1.04 / sqrt(4096) ~ 1.6%
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_STANDARD_ERROR = 1.04 / math.sqrt(HLL_REGISTERS)
+
+_VALUE_BITS = 64 - HLL_PRECISION
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+# Ранг не превышает 64 - p + 1 < 128, поэтому у каждого байта свободен старший бит
+_HIGH_BITS = int.from_bytes(b"\x80" * HLL_REGISTERS, "big")
+_ALL_BITS = (1 << (8 * HLL_REGISTERS)) - 1
+
+
+def hll_position(value) -> Tuple[int, int]:
+    """
+    Регистр и ранг значения: (индекс регистра, число ведущих нулей + 1).
+
+    Хеш - 64 бита blake2b от str(value), поэтому позиция одинакова во всех
+    процессах и между запусками (в отличие от встроенного hash()).
+    """
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    h = int.from_bytes(digest, "big")
+    index = h >> _VALUE_BITS
+    rank = _VALUE_BITS - (h & _VALUE_MASK).bit_length() + 1
+    return index, rank
+
+
+class HyperLogLog:
+    """
+    HyperLogLog (Flajolet et al.) с линейным подсчетом для малых множеств.
+
+    Скетчи объединяются поэлементным максимумом регистров, поэтому дневные
+    скетчи можно складывать в любой диапазон без повторного чтения событий.
+    """
+
+    __slots__ = ("registers",)
+
+    def __init__(self, registers: Optional[bytes] = None) -> None:
+        if registers is None:
+            self.registers = bytearray(HLL_REGISTERS)
+        else:
+            if len(registers) != HLL_REGISTERS:
+                raise ValueError(f"HyperLogLog expects {HLL_REGISTERS} registers, got {len(registers)}")
+            self.registers = bytearray(registers)
+
+    def add(self, value) -> None:
+        index, rank = hll_position(value)
+        if self.registers[index] < rank:
+            self.registers[index] = rank
+
+    @staticmethod
+    def _max_packed(a: int, b: int) -> int:
+        """
+        Побайтовый максимум двух скетчей, упакованных в целые (SWAR).
+
+        (a | 0x80..) - b не дает заемов между байтами, и старший бит байта
+        остается установленным ровно там, где a >= b. Все операции - над
+        длинными целыми в C, поэтому объединение 4 КБ занимает микросекунды.
+        """
+        ge = (((a | _HIGH_BITS) - b) & _HIGH_BITS) >> 7
+        mask = ge * 0xFF
+        return (a & mask) | (b & (_ALL_BITS ^ mask))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        merged = self._max_packed(
+            int.from_bytes(self.registers, "big"),
+            int.from_bytes(other.registers, "big")
+        )
+        self.registers = bytearray(merged.to_bytes(HLL_REGISTERS, "big"))
+
+    @classmethod
+    def union(cls, sketches: Iterable[bytes]) -> "HyperLogLog":
+        """Объединить сериализованные скетчи"""
+        packed = 0
+        for raw in sketches:
+            if len(raw) != HLL_REGISTERS:
+                raise ValueError(f"HyperLogLog expects {HLL_REGISTERS} registers, got {len(raw)}")
+            packed = cls._max_packed(packed, int.from_bytes(raw, "big"))
+        return cls(packed.to_bytes(HLL_REGISTERS, "big"))
+
+    def estimate(self) -> float:
+        m = HLL_REGISTERS
+        registers = self.registers
+        zeros = registers.count(0)
+        raw = _ALPHA * m * m / sum(registers.count(r) * 2.0 ** -r for r in set(registers))
+        if raw <= 2.5 * m and zeros:
+            # Малые множества: линейный подсчет точнее
+            return m * math.log(m / zeros)
+        return raw
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
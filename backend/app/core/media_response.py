@@ -0,0 +1,235 @@
+import os
+import secrets
+from email.utils import formatdate
+from typing import List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+# Больше диапазонов в одном запросе не обслуживается: отдается весь файл (RFC 9110 это разрешает)
+MAX_RANGES = 16
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Диапазоны из заголовка Range: [(start, end)] включительно, отсортированные, пересекающиеся слиты.
+
+    Returns:
+        None - заголовок не разобран (отдается весь файл),
+        [] - ни один диапазон не попадает в файл (416)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    parsed = 0
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not sep or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+            return None
+        parsed += 1
+
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                continue
+            ranges.append((start, min(end, size - 1)))
+        else:
+            # bytes=-N: последние N байт
+            suffix = int(last)
+            if suffix and size:
+                ranges.append((max(size - suffix, 0), size - 1))
+
+    if not parsed:
+        return None
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match: слабое сравнение, * совпадает с любым"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class MediaFileResponse(Response):
+    """
+    Отдача видеофайла с диапазонами и условными запросами.
+
+    - Range: один диапазон - 206 с Content-Range, несколько - multipart/byteranges,
+      вне файла - 416; If-Range с другим ETag/датой - весь файл.
+    - If-None-Match по ETag - 304 без тела.
+    - Тело без копирования через воркер, если сервер умеет: http.response.pathsend
+      (весь файл) или http.response.zerocopy (sendfile по диапазонам); иначе - чтение
+      кусками в пуле потоков.
+    - accel_redirect: тело отдает фронтовой nginx (X-Accel-Redirect на internal
+      location, там же sendfile и Range), приложение отвечает только заголовками.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        stat_result: os.stat_result,
+        media_type: str,
+        etag: str,
+        cache_control: str,
+        accel_redirect: Optional[str] = None
+    ) -> None:
+        self.path = path
+        self.stat_result = stat_result
+        self.media_type = media_type
+        self.etag = etag
+        self.cache_control = cache_control
+        self.accel_redirect = accel_redirect
+        self.status_code = 200
+        self.background = None
+        self.raw_headers = []
+
+    def _validators(self) -> List[Tuple[bytes, bytes]]:
+        return [
+            (b"etag", self.etag.encode("latin-1")),
+            (b"last-modified", formatdate(self.stat_result.st_mtime, usegmt=True).encode("latin-1")),
+            (b"cache-control", self.cache_control.encode("latin-1")),
+            (b"accept-ranges", b"bytes"),
+        ]
+
+    def _if_range_matches(self, if_range: Optional[str]) -> bool:
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith(('"', "W/")):
+            # If-Range - только сильное сравнение
+            return if_range == self.etag
+        return if_range == formatdate(self.stat_result.st_mtime, usegmt=True)
+
+    async def __call__(self, scope, receive, send) -> None:
+        request_headers = Headers(scope=scope)
+        headers = self._validators()
+        size = self.stat_result.st_size
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, self.etag):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        content_type = self.media_type.encode("latin-1")
+        if self.accel_redirect is not None:
+            headers += [(b"content-type", content_type), (b"x-accel-redirect", self.accel_redirect.encode("latin-1"))]
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if range_header and self._if_range_matches(request_headers.get("if-range")):
+            ranges = parse_range(range_header, size)
+            if ranges is not None and len(ranges) > MAX_RANGES:
+                ranges = None
+
+        if ranges == []:
+            headers += [(b"content-range", f"bytes */{size}".encode("latin-1")), (b"content-length", b"0")]
+            await send({"type": "http.response.start", "status": 416, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # Части тела: (префикс, (start, end) или None)
+        parts: List[Tuple[bytes, Optional[Tuple[int, int]]]]
+        if not ranges:
+            status_code = 200
+            headers.append((b"content-type", content_type))
+            parts = [(b"", (0, size - 1) if size else None)]
+            content_length = size
+        elif len(ranges) == 1:
+            status_code = 206
+            start, end = ranges[0]
+            headers += [
+                (b"content-type", content_type),
+                (b"content-range", f"bytes {start}-{end}/{size}".encode("latin-1")),
+            ]
+            parts = [(b"", ranges[0])]
+            content_length = end - start + 1
+        else:
+            status_code = 206
+            boundary = secrets.token_hex(16)
+            headers.append((b"content-type", f"multipart/byteranges; boundary={boundary}".encode("latin-1")))
+            parts = []
+            for index, (start, end) in enumerate(ranges):
+                part_header = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                # Между частями - CRLF после данных предыдущей
+                parts.append(((b"\r\n" if index else b"") + part_header, (start, end)))
+            parts.append((f"\r\n--{boundary}--\r\n".encode("latin-1"), None))
+            content_length = sum(len(prefix) + (r[1] - r[0] + 1 if r else 0) for prefix, r in parts)
+
+        headers.append((b"content-length", str(content_length).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if status_code == 200 and size and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+
+        if "http.response.zerocopy" in extensions:
+            await self._send_zerocopy(send, parts)
+        else:
+            await self._send_chunks(send, parts)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_zerocopy(self, send, parts) -> None:
+        with open(self.path, "rb") as f:
+            for prefix, byte_range in parts:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                if byte_range is not None:
+                    start, end = byte_range
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": f,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True,
+                    })
+
+    async def _send_chunks(self, send, parts) -> None:
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            for prefix, byte_range in parts:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                if byte_range is None:
+                    continue
+                start, end = byte_range
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining:
+                    chunk = await f.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
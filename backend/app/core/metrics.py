@@ -0,0 +1,196 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Границы корзин латентности запроса, секунды (как у клиентов Prometheus по умолчанию)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Корзины числа SQL-запросов на HTTP-запрос (N+1 видно по хвосту)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+# Маршрут, не найденный роутером: путь в метку не попадает (иначе неограниченная кардинальность)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class _RequestSql:
+    """SQL текущего HTTP-запроса (общий для потоков и greenlet'ов запроса)"""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+
+_current_sql: ContextVar[Optional[_RequestSql]] = ContextVar("request_sql", default=None)
+
+
+class _RouteStats:
+    __slots__ = ("latency_counts", "latency_sum", "sql_counts", "sql_statements", "sql_seconds", "statuses")
+
+    def __init__(self) -> None:
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.sql_counts = [0] * (len(SQL_COUNT_BUCKETS) + 1)
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+
+
+class RequestMetrics:
+    """
+    Метрики HTTP-запросов по шаблону маршрута (метод + путь вида /videos/{video_id}).
+
+    Запись - несколько операций со словарем и bisect под блокировкой, без
+    аллокаций строк на запрос: десятки микросекунд на запрос даже с учетом
+    событий SQLAlchemy. Отдается в текстовом формате Prometheus (render).
+    """
+
+    def __init__(self) -> None:
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, seconds: float, sql: _RequestSql) -> None:
+        key = (method, route)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = _RouteStats()
+            stats.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.latency_sum += seconds
+            stats.sql_counts[bisect.bisect_left(SQL_COUNT_BUCKETS, sql.count)] += 1
+            stats.sql_statements += sql.count
+            stats.sql_seconds += sql.seconds
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    @staticmethod
+    def _histogram(lines: List[str], name: str, labels: str, bounds, counts, total) -> None:
+        cumulative = 0
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        with self._lock:
+            routes = {
+                key: (
+                    list(s.latency_counts), s.latency_sum, list(s.sql_counts),
+                    s.sql_statements, s.sql_seconds, dict(s.statuses)
+                )
+                for key, s in self._routes.items()
+            }
+
+        latency = [
+            "# HELP http_request_duration_seconds HTTP request latency by route template",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        requests = [
+            "# HELP http_requests_total HTTP requests by route template and status",
+            "# TYPE http_requests_total counter",
+        ]
+        sql_per_request = [
+            "# HELP http_request_sql_statements SQL statements executed per HTTP request",
+            "# TYPE http_request_sql_statements histogram",
+        ]
+        sql_seconds = [
+            "# HELP http_request_sql_seconds_total Time spent in SQL statements by route template",
+            "# TYPE http_request_sql_seconds_total counter",
+        ]
+
+        for (method, route), (lat_counts, lat_sum, sql_counts, sql_total, sql_time, statuses) in sorted(routes.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            self._histogram(latency, "http_request_duration_seconds", labels, LATENCY_BUCKETS, lat_counts, lat_sum)
+            self._histogram(sql_per_request, "http_request_sql_statements", labels, SQL_COUNT_BUCKETS, sql_counts, sql_total)
+            sql_seconds.append(f"http_request_sql_seconds_total{{{labels}}} {sql_time}")
+            for status, count in sorted(statuses.items()):
+                requests.append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+
+        return "\n".join(latency + requests + sql_per_request + sql_seconds) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_metrics = RequestMetrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_sql.get() is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sql = _current_sql.get()
+    started = getattr(context, "_metrics_started", None)
+    if sql is not None and started is not None:
+        sql.count += 1
+        sql.seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Считать SQL-запросы движка в метриках текущего HTTP-запроса"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: латентность, статус и SQL каждого HTTP-запроса.
+
+    Чистый ASGI (не BaseHTTPMiddleware): не оборачивает тело ответа в отдельную
+    задачу и не ломает потоковые ответы (SSE). Шаблон маршрута берется из
+    scope["route"], который выставляет роутер FastAPI.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sql = _RequestSql()
+        token = _current_sql.set(sql)
+        root_path = scope.get("root_path", "")
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_sql.reset(token)
+            self.metrics.observe(scope["method"], _route_template(scope, root_path), status_code, elapsed, sql)
+
+
+def _route_template(scope, root_path: str) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path_format", None) or route.path
+    mounted = scope.get("root_path", "")
+    if mounted != root_path:
+        # Смонтированное приложение (StaticFiles): путь монтирования без имени файла
+        return f"{mounted}/{{path}}"
+    return UNMATCHED_ROUTE
@@ -0,0 +1,208 @@
+import os
+import struct
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+# Коробки верхнего уровня, с которых может начинаться MP4/MOV
+_TOP_LEVEL_TYPES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"uuid"}
+
+# moov обычно десятки-сотни КБ; больше - повод не читать файл в память
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+# Коды sample entry -> имена кодеков как у ffprobe
+_CODECS = {
+    b"avc1": "h264", b"avc3": "h264",
+    b"hvc1": "hevc", b"hev1": "hevc",
+    b"av01": "av1",
+    b"vp08": "vp8", b"vp09": "vp9",
+    b"mp4v": "mpeg4",
+    b"apch": "prores", b"apcn": "prores", b"apcs": "prores", b"apco": "prores", b"ap4h": "prores",
+    b"jpeg": "mjpeg", b"mjpa": "mjpeg",
+}
+
+
+class Mp4Info(NamedTuple):
+    duration: Optional[float]  # секунды
+    video_codec: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    bit_rate: Optional[int]  # средний по файлу, бит/с
+    codec_tag: Optional[str] = None  # RFC 6381 (avc1.4d401f) - для CODECS в плейлистах HLS
+    has_audio: bool = False
+
+
+def _file_boxes(f: BinaryIO, file_size: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Коробки верхнего уровня: (тип, смещение данных, размер данных). Читаются только заголовки."""
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+
+def _boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """Дочерние коробки внутри прочитанного буфера: (тип, начало данных, конец данных)"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _child(data: bytes, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for child_type, child_start, child_end in _boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _time_box(data: bytes, start: int) -> Tuple[int, int]:
+    """(timescale, duration) из mvhd/mdhd - у обоих одинаковое начало"""
+    version = data[start]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, start + 12)
+    return timescale, duration
+
+
+def _seconds(timescale: int, duration: int) -> Optional[float]:
+    # 0 и "все единицы" - длительность неизвестна (фрагментированный файл)
+    if not timescale or not duration or duration in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return None
+    return duration / timescale
+
+
+def _handler(data: bytes, trak_start: int, trak_end: int) -> Optional[bytes]:
+    """Тип дорожки из mdia/hdlr: b"vide", b"soun", ..."""
+    mdia = _child(data, trak_start, trak_end, b"mdia")
+    if mdia is None:
+        return None
+    hdlr = _child(data, mdia[0], mdia[1], b"hdlr")
+    if hdlr is None:
+        return None
+    return data[hdlr[0] + 8:hdlr[0] + 12]
+
+
+def _avc_codec_tag(data: bytes, entry_type: bytes, entry_start: int, entry_end: int) -> Optional[str]:
+    """avc1.PPCCLL из avcC (VisualSampleEntry - 78 байт перед дочерними коробками)"""
+    if entry_type not in (b"avc1", b"avc3"):
+        return None
+    avcc = _child(data, entry_start + 78, entry_end, b"avcC")
+    if avcc is None or avcc[0] + 4 > avcc[1]:
+        return None
+    profile, compatibility, level = data[avcc[0] + 1:avcc[0] + 4]
+    return f"{entry_type.decode()}.{profile:02x}{compatibility:02x}{level:02x}"
+
+
+def _video_track(data: bytes, trak_start: int, trak_end: int) -> Optional[Tuple[Optional[float], Optional[str], Optional[int], Optional[int], Optional[str]]]:
+    """(длительность, кодек, ширина, высота, RFC 6381) видеодорожки; None - дорожка не видео"""
+    if _handler(data, trak_start, trak_end) != b"vide":
+        return None
+    mdia = _child(data, trak_start, trak_end, b"mdia")
+
+    duration = None
+    mdhd = _child(data, mdia[0], mdia[1], b"mdhd")
+    if mdhd is not None:
+        duration = _seconds(*_time_box(data, mdhd[0]))
+
+    codec, width, height, codec_tag = None, None, None, None
+    stbl = None
+    minf = _child(data, mdia[0], mdia[1], b"minf")
+    if minf is not None:
+        stbl = _child(data, minf[0], minf[1], b"stbl")
+    stsd = _child(data, stbl[0], stbl[1], b"stsd") if stbl is not None else None
+    if stsd is not None:
+        # stsd: версия/флаги (4) + число записей (4), затем первая VisualSampleEntry
+        for entry_type, entry_start, entry_end in _boxes(data, stsd[0] + 8, stsd[1]):
+            codec = _CODECS.get(entry_type, entry_type.decode("latin-1").strip())
+            if entry_start + 28 <= entry_end:
+                width, height = struct.unpack_from(">HH", data, entry_start + 24)
+            codec_tag = _avc_codec_tag(data, entry_type, entry_start, entry_end)
+            break
+
+    if not width or not height:
+        # Запасной вариант - размеры из tkhd (16.16 с фиксированной точкой)
+        tkhd = _child(data, trak_start, trak_end, b"tkhd")
+        if tkhd is not None:
+            dims_at = tkhd[0] + (88 if data[tkhd[0]] == 1 else 76)
+            if dims_at + 8 <= tkhd[1]:
+                w, h = struct.unpack_from(">II", data, dims_at)
+                width, height = w >> 16, h >> 16
+
+    return duration, codec, width or None, height or None, codec_tag
+
+
+def parse_mp4(path: str) -> Optional[Mp4Info]:
+    """
+    Длительность, кодек и размеры видео из коробок moov/mvhd и trak/mdhd MP4/MOV.
+
+    Читаются только заголовки коробок верхнего уровня (seek) и сама moov, поэтому
+    время не зависит от размера файла. None - файл не MP4/MOV или moov не найдена.
+    """
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            moov = None
+            for index, (box_type, data_start, data_size) in enumerate(_file_boxes(f, file_size)):
+                if index == 0 and box_type not in _TOP_LEVEL_TYPES:
+                    return None
+                if box_type == b"moov":
+                    if data_size > MAX_MOOV_BYTES:
+                        return None
+                    f.seek(data_start)
+                    moov = f.read(data_size)
+                    break
+    except (OSError, struct.error):
+        return None
+    if moov is None:
+        return None
+
+    try:
+        duration = None
+        mvhd = _child(moov, 0, len(moov), b"mvhd")
+        if mvhd is not None:
+            duration = _seconds(*_time_box(moov, mvhd[0]))
+
+        codec, width, height, codec_tag = None, None, None, None
+        has_audio = False
+        video_found = False
+        for box_type, start, end in _boxes(moov):
+            if box_type != b"trak":
+                continue
+            if _handler(moov, start, end) == b"soun":
+                has_audio = True
+                continue
+            if video_found:
+                continue
+            track = _video_track(moov, start, end)
+            if track is not None:
+                video_found = True
+                track_duration, codec, width, height, codec_tag = track
+                if duration is None:
+                    duration = track_duration
+    except (struct.error, IndexError):
+        return None
+
+    bit_rate = int(file_size * 8 / duration) if duration else None
+    return Mp4Info(duration, codec, width, height, bit_rate, codec_tag, has_audio)
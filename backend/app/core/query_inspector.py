@@ -0,0 +1,196 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+# Списки IN разной длины - одна и та же форма запроса
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*,?)+\)", re.IGNORECASE)
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+|\?")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Форма SQL-запроса без значений: литералы и параметры заменены на ?,
+    списки IN любой длины сведены к IN (?). Одинаковые формы в одном запросе - кандидаты в N+1.
+    """
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _POSTCOMPILE.sub("(?)", normalized)
+    normalized = _IN_LIST.sub("IN (?)", normalized)
+    normalized = _PARAMETER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class QueryTrace:
+    """SQL-запросы одной единицы работы (HTTP-запроса или блока count_queries)"""
+
+    def __init__(self) -> None:
+        self.fingerprints: Counter = Counter()
+        self.statements = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, statement: str, seconds: float) -> None:
+        shape = fingerprint(statement)
+        with self._lock:
+            self.fingerprints[shape] += 1
+            self.statements += 1
+            self.seconds += seconds
+
+    def repeated(self, threshold: int) -> List[tuple]:
+        """Формы, выполненные threshold и более раз: [(fingerprint, count)]"""
+        with self._lock:
+            return [(shape, count) for shape, count in self.fingerprints.most_common() if count >= threshold]
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Блок выполнил больше SQL-запросов, чем разрешено"""
+
+
+_request_trace: ContextVar[Optional[QueryTrace]] = ContextVar("query_trace", default=None)
+
+# Активные блоки count_queries: учитывают запросы из любых потоков
+# (TestClient выполняет приложение в отдельном потоке со своим контекстом)
+_collectors: List[QueryTrace] = []
+_collectors_lock = threading.Lock()
+_explaining = threading.local()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._inspector_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_explaining, "active", False):
+        return
+    started = getattr(context, "_inspector_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    trace = _request_trace.get()
+    if trace is not None:
+        trace.add(statement, elapsed)
+    if _collectors:
+        with _collectors_lock:
+            collectors = list(_collectors)
+        for collector in collectors:
+            collector.add(statement, elapsed)
+
+    if settings.QUERY_INSPECTOR_ENABLED and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms):\n%s\nPlan:\n%s",
+            elapsed * 1000, statement, _explain(conn, statement, parameters, executemany)
+        )
+
+
+def _explain(conn, statement: str, parameters, executemany: bool) -> str:
+    """План запроса (без ANALYZE - запрос повторно не выполняется)"""
+    if executemany:
+        return "(executemany - plan skipped)"
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        prefix = "EXPLAIN "
+    elif dialect == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        return f"(EXPLAIN is not supported for {dialect})"
+
+    _explaining.active = True
+    try:
+        # Отдельный курсор того же соединения и той же транзакции: тот же снимок и параметры
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return "\n".join(" | ".join(str(value) for value in row) for row in cursor.fetchall())
+        finally:
+            cursor.close()
+    except Exception as e:
+        return f"(EXPLAIN failed: {e})"
+    finally:
+        _explaining.active = False
+
+
+def install(engine: Engine) -> None:
+    """Подключить инспектор к движку (повторный вызов ничего не меняет)"""
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryTrace]:
+    """Собрать SQL-запросы, выполненные внутри блока (всеми потоками процесса)"""
+    trace = QueryTrace()
+    with _collectors_lock:
+        _collectors.append(trace)
+    try:
+        yield trace
+    finally:
+        with _collectors_lock:
+            _collectors.remove(trace)
+
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[QueryTrace]:
+    """
+    Упасть с QueryBudgetExceeded, если блок выполнил больше max_queries запросов.
+
+        with query_budget(3):
+            client.get("/api/v1/analytics/me", headers=auth)
+    """
+    with count_queries() as trace:
+        yield trace
+    if trace.statements > max_queries:
+        shapes = "\n".join(f"  {count}x {shape}" for shape, count in trace.fingerprints.most_common())
+        raise QueryBudgetExceeded(
+            f"Expected at most {max_queries} SQL statements, got {trace.statements}:\n{shapes}"
+        )
+
+
+class QueryInspectorMiddleware:
+    """
+    ASGI middleware для разработки и staging: N+1 в пределах HTTP-запроса.
+
+    Если одна форма запроса выполнилась N_PLUS_ONE_THRESHOLD и более раз,
+    пишет предупреждение с маршрутом и формой запроса.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = QueryTrace()
+        token = _request_trace.set(trace)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_trace.reset(token)
+            repeated = trace.repeated(settings.N_PLUS_ONE_THRESHOLD)
+            if repeated:
+                route = scope.get("route")
+                path = getattr(route, "path", None) or scope.get("path")
+                for shape, count in repeated:
+                    logger.warning(
+                        "Possible N+1 in %s %s: %d of %d statements have the same shape: %s",
+                        scope["method"], path, count, trace.statements, shape
+                    )
@@ -1,5 +1,10 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
+import asyncio
+import multiprocessing
+import threading
+import time
 import bcrypt
 from jose import JWTError, jwt
 from app.core.config import settings
@@ -25,13 +30,127 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
-def get_password_hash(password: str) -> str:
+def get_password_hash(password: str, rounds: Optional[int] = None) -> str:
     """Хеширование пароля (обрезается до 72 байт)."""
     password_bytes = _to_bcrypt_password(password)
-    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds=12))
+    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS))
     return hashed.decode("utf-8")
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Хеш создан с другим cost factor, чем BCRYPT_ROUNDS ($2b$<rounds>$...)"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь на хеширование переполнена или ожидание слишком долгое"""
+
+
+class PasswordHasher:
+    """
+    bcrypt в отдельном пуле процессов с собственным лимитом параллелизма.
+
+    Массовый вход (пересменка) не занимает пул потоков, обслуживающий
+    остальные запросы: одновременно выполняется не больше PASSWORD_HASH_WORKERS
+    хеширований, остальные ждут в очереди (не длиннее PASSWORD_HASH_QUEUE_LIMIT
+    и не дольше PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS, иначе PasswordHasherBusy).
+    """
+
+    def __init__(self, workers: int, queue_limit: int, queue_timeout: float) -> None:
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: fork процесса с потоками и циклом событий небезопасен
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        if self.waiting >= self.queue_limit:
+            self.rejected += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PasswordHasherBusy("Timed out waiting for password hashing slot")
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        waited = started_at - queued_at
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.run_seconds_total += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        # rounds передаются явно: настройки дочернего процесса читаются при его запуске
+        return await self._run(get_password_hash, password, settings.BCRYPT_ROUNDS)
+
+    def stats(self) -> dict:
+        """Метрики очереди (для /internal/password-hasher)"""
+        return {
+            "workers": self.workers,
+            "rounds": settings.BCRYPT_ROUNDS,
+            "queue_limit": self.queue_limit,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "run_seconds_total": round(self.run_seconds_total, 6),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS
+)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Создание JWT токена"""
     to_encode = data.copy()
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Union
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+TaskFunc = Union[Callable[[], None], Callable[[], Awaitable[None]]]
+
+
+async def _run_periodically(name: str, interval_seconds: float, func: TaskFunc) -> None:
+    """
+    Выполнять func каждые interval_seconds секунд: синхронную - в пуле потоков,
+    корутину - в цикле событий (ей нужны его объекты, например asyncio.Lock).
+    """
+    while True:
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func()
+            else:
+                await run_in_threadpool(func)
+        except Exception:
+            # Фоновая задача не должна умирать из-за одной ошибки (например, БД недоступна)
+            logger.exception("Background task %s failed", name)
+        await asyncio.sleep(interval_seconds)
+
+
+class PeriodicTasks:
+    """Набор периодических фоновых задач, живущих вместе с приложением (lifespan)"""
+
+    def __init__(self) -> None:
+        self._tasks: List[asyncio.Task] = []
+
+    def every(self, interval_seconds: float, func: TaskFunc, name: str = None) -> None:
+        """Запустить периодическую задачу (вызывать из lifespan при старте)"""
+        name = name or getattr(func, "__qualname__", repr(func))
+        task = asyncio.create_task(_run_periodically(name, interval_seconds, func), name=name)
+        self._tasks.append(task)
+
+    async def stop(self) -> None:
+        """Остановить все задачи (вызывать из lifespan при завершении)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+periodic_tasks = PeriodicTasks()
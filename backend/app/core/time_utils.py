@@ -0,0 +1,13 @@
+from datetime import datetime, timezone
+
+
+def as_utc_naive(value: datetime) -> datetime:
+    """
+    Привести время к наивному UTC.
+
+    Время в БД хранится как timestamptz, а сервер пишет datetime.utcnow()
+    (наивное); для сравнения их нужно привести к одному виду.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -1,11 +1,75 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.db.pool import SyncPool, AsyncPool
 
-engine = create_engine(settings.DATABASE_URL)
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _is_postgres(url: str) -> bool:
+    return url.startswith(("postgresql", "postgres://"))
+
+
+def _sync_connect_args() -> dict:
+    if not _is_postgres(settings.DATABASE_URL) or settings.DB_PGBOUNCER_MODE:
+        return {}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        return {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+
+def _async_connect_args() -> dict:
+    if not _is_postgres(settings.async_database_url):
+        return {}
+    if settings.DB_PGBOUNCER_MODE:
+        # В transaction pooling соседние транзакции идут через разные серверные
+        # соединения - prepared statements asyncpg там не найдутся
+        return {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        return {"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}}
+    return {}
+
+
+def _set_local_statement_timeout(connection) -> None:
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+
+
+# Синхронный движок: скрипты (seed_test_data.py и др.), фоновые задачи, обычные роуты
+engine = create_engine(
+    settings.DATABASE_URL,
+    poolclass=SyncPool,
+    connect_args=_sync_connect_args(),
+    **_pool_options()
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок (asyncpg): горячие эндпоинты устройств не занимают пул потоков
+async_engine = create_async_engine(
+    settings.async_database_url,
+    poolclass=AsyncPool,
+    connect_args=_async_connect_args(),
+    **_pool_options()
+)
+# expire_on_commit=False: после commit атрибуты не перечитываются лениво (в async это невозможно)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+if settings.DB_PGBOUNCER_MODE and settings.DB_STATEMENT_TIMEOUT_MS and _is_postgres(settings.DATABASE_URL):
+    # Параметры сессии через PgBouncer утекли бы к другим клиентам - только на транзакцию
+    event.listen(engine, "begin", _set_local_statement_timeout)
+    event.listen(async_engine.sync_engine, "begin", _set_local_statement_timeout)
+
 Base = declarative_base()
 
 
@@ -16,3 +80,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency для получения асинхронной сессии БД"""
+    async with AsyncSessionLocal() as db:
+        yield db
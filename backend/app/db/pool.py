@@ -0,0 +1,106 @@
+import bisect
+import threading
+import time
+from typing import Dict, List, Type
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolWaitStats:
+    """
+    Статистика ожидания соединения из пула одного движка.
+
+    Время ожидания checkout копится в гистограмме с фиксированными корзинами
+    (как histogram в Prometheus): по ней видно, хватает ли pool_size/max_overflow.
+    """
+
+    # Верхние границы корзин, миллисекунды (последняя корзина - +Inf)
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.pool: Pool = None
+        self._lock = threading.Lock()
+        self._counts: List[int] = [0] * (len(self.BUCKETS_MS) + 1)
+        self._sum_ms = 0.0
+        self._timeouts = 0
+
+    def observe(self, wait_seconds: float, timed_out: bool = False) -> None:
+        wait_ms = wait_seconds * 1000.0
+        with self._lock:
+            self._counts[bisect.bisect_left(self.BUCKETS_MS, wait_ms)] += 1
+            self._sum_ms += wait_ms
+            if timed_out:
+                self._timeouts += 1
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        with self._lock:
+            counts = list(self._counts)
+            sum_ms = self._sum_ms
+            timeouts = self._timeouts
+
+        cumulative, buckets = 0, []
+        for bound, count in zip(list(self.BUCKETS_MS) + ["+Inf"], counts):
+            cumulative += count
+            buckets.append({"le_ms": bound, "count": cumulative})
+
+        stats = {
+            "name": self.name,
+            "pool_class": type(pool).__name__ if pool is not None else None,
+            "checkouts": cumulative,
+            "checkout_timeouts": timeouts,
+            "wait_ms_sum": round(sum_ms, 3),
+            "wait_ms_histogram": buckets,
+        }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # overflow() отрицателен, пока пул не заполнен до pool_size
+                "overflow": max(pool.overflow(), 0),
+            })
+        return stats
+
+
+def instrumented_pool_class(base: Type[QueuePool], stats: PoolWaitStats) -> Type[QueuePool]:
+    """
+    Подкласс QueuePool/AsyncAdaptedQueuePool, замеряющий время checkout.
+
+    Статистика привязана к классу, а не к экземпляру: при пересоздании пула
+    (engine.dispose, invalidate) SQLAlchemy создает новый экземпляр того же класса.
+    """
+
+    class InstrumentedPool(base):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            stats.pool = self
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                stats.observe(time.perf_counter() - started, timed_out=True)
+                raise
+            stats.observe(time.perf_counter() - started)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    InstrumentedPool.__qualname__ = InstrumentedPool.__name__
+    return InstrumentedPool
+
+
+sync_pool_stats = PoolWaitStats("sync")
+async_pool_stats = PoolWaitStats("async")
+
+SyncPool = instrumented_pool_class(QueuePool, sync_pool_stats)
+AsyncPool = instrumented_pool_class(AsyncAdaptedQueuePool, async_pool_stats)
+
+
+def pool_stats() -> Dict[str, dict]:
+    """Текущая статистика пулов обоих движков"""
+    return {stats.name: stats.snapshot() for stats in (sync_pool_stats, async_pool_stats)}
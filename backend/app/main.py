@@ -1,13 +1,25 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+import logging
 import os
 import time
 
 from app.api.routes import router
+from app.api.internal import router as internal_router
+from app.api.media import router as media_router
 from app.core.config import settings
-from app.db.database import engine, Base
+from app.db.database import engine, async_engine, Base
+from app.core.tasks import periodic_tasks
+from app.core.security import password_hasher
+from app.core.metrics import MetricsMiddleware, instrument_engine
+from app.core import query_inspector
+from app.services.partition_service import PartitionService
+from app.services.presence_service import presence_tracker
+from app.services.live_stats_service import live_stats_hub
+from app.services.resumable_upload_service import ResumableUploadService
+from app.services.media_probe_service import media_probe_queue
+from app.services.transcode_service import media_transcode_queue
 
 
 def init_db():
@@ -15,6 +27,9 @@ def init_db():
     for attempt in range(10):
         try:
             Base.metadata.create_all(bind=engine)
+            # Секции playback_logs на текущий и ближайшие месяцы
+            with engine.begin() as connection:
+                PartitionService.ensure_partitions(connection)
             return
         except Exception as e:
             if attempt < 9:
@@ -27,12 +42,48 @@ def init_db():
 async def lifespan(app: FastAPI):
     # Startup: ждём БД и создаём таблицы
     init_db()
+    periodic_tasks.every(
+        settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+        PartitionService.run_maintenance,
+        name="playback_logs_partitions"
+    )
+    periodic_tasks.every(
+        settings.HEARTBEAT_FLUSH_INTERVAL_SECONDS,
+        presence_tracker.flush,
+        name="presence_flush"
+    )
+    periodic_tasks.every(
+        settings.SESSION_SWEEP_INTERVAL_SECONDS,
+        presence_tracker.sweep,
+        name="stale_sessions_sweep"
+    )
+    periodic_tasks.every(
+        3600,
+        ResumableUploadService.purge_expired,
+        name="resumable_uploads_purge"
+    )
+    live_stats_hub.start()
+    # Разобранное видео сразу уходит на перекодирование
+    media_probe_queue.next_stage = media_transcode_queue
+    media_probe_queue.start()
+    media_transcode_queue.start()
     yield
-    # Shutdown (при необходимости)
-
-
-# Создать директорию для загрузок
+    # Shutdown: остановить фоновые задачи и сбросить накопленные heartbeat'ы
+    await live_stats_hub.stop()
+    await media_probe_queue.stop()
+    await media_transcode_queue.stop()
+    await periodic_tasks.stop()
+    try:
+        presence_tracker.flush()
+    except Exception:
+        logging.getLogger(__name__).exception("Failed to flush heartbeats on shutdown")
+    password_hasher.shutdown()
+    await async_engine.dispose()
+
+
+# Создать директории для загрузок
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+os.makedirs(settings.MEDIA_STORE_DIR, exist_ok=True)
 
 app = FastAPI(
     title="Billboard Mobile API",
@@ -50,13 +101,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Инспектор SQL (только разработка/staging)
+if settings.QUERY_INSPECTOR_ENABLED:
+    query_inspector.install(engine)
+    query_inspector.install(async_engine.sync_engine)
+    app.add_middleware(query_inspector.QueryInspectorMiddleware)
+
+# Метрики запросов; добавляется последним, чтобы быть внешним слоем и учитывать CORS
+if settings.METRICS_ENABLED:
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+    app.add_middleware(MetricsMiddleware)
+
 # Подключить роуты
 app.include_router(router, prefix="/api/v1")
-
-# Статические файлы (для видео)
-# Монтируем /uploads/videos на директорию ./uploads/videos
-if os.path.exists(settings.UPLOAD_DIR):
-    app.mount("/uploads/videos", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads_videos")
+app.include_router(internal_router)
+# Видеофайлы: /media/<sha256>.<ext> и /uploads/videos/<filename> (Range, ETag, Cache-Control)
+app.include_router(media_router)
 
 
 @app.get("/")
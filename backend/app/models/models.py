@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Boolean, Date, DateTime, ForeignKey, Text, Index, LargeBinary, Enum as SQLEnum, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -19,6 +19,21 @@ class VideoType(str, enum.Enum):
     CONTRACT = "contract"    # Контрактное видео
 
 
+class MediaProbeStatus(str, enum.Enum):
+    """Разбор метаданных загруженного файла"""
+    PENDING = "pending"  # в очереди; duration пустая - в плейлисты не попадает
+    DONE = "done"
+    FAILED = "failed"    # файл не разобран - длительность указывается вручную
+
+
+class TranscodeStatus(str, enum.Enum):
+    """Перекодирование видео в лестницу HLS-качеств"""
+    PENDING = "pending"  # ждет разбора метаданных или очереди перекодирования
+    DONE = "done"
+    FAILED = "failed"    # клиенты получают только исходный файл
+    SKIPPED = "skipped"  # файл вне хранилища /media (загружен раньше) или перекодирование выключено
+
+
 class Vehicle(Base):
     """Модель автомобиля (пользователя системы)"""
     __tablename__ = "vehicles"
@@ -31,6 +46,8 @@ class Vehicle(Base):
     driver_name = Column(String(200))
     phone = Column(String(20))
     is_active = Column(Boolean, default=True)
+    # Последний heartbeat (пишется пачками из памяти, отстает на HEARTBEAT_FLUSH_INTERVAL_SECONDS)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -48,8 +65,22 @@ class Video(Base):
     filename = Column(String(500), nullable=False)
     file_path = Column(String(1000), nullable=False)
     file_size = Column(Integer)  # в байтах
+    content_sha256 = Column(String(64), index=True)  # hex, считается при загрузке
     duration = Column(Float)  # в секундах
     
+    # Метаданные файла (пишутся фоновым разбором после загрузки)
+    video_codec = Column(String(32))
+    width = Column(Integer)
+    height = Column(Integer)
+    bit_rate = Column(Integer)  # бит/с
+    probe_status = Column(SQLEnum(MediaProbeStatus), nullable=False, default=MediaProbeStatus.PENDING)
+    probed_at = Column(DateTime(timezone=True))
+    probe_claimed_at = Column(DateTime(timezone=True))  # воркер, разбирающий файл, захватил видео
+    
+    # Лестница качеств HLS (пишется фоновым перекодированием после разбора)
+    transcode_status = Column(SQLEnum(TranscodeStatus), nullable=False, default=TranscodeStatus.PENDING)
+    hls_path = Column(String(1000))  # URL master-плейлиста: /media/hls/<sha256>/<ladder>/master.m3u8
+    
     # Тип видео
     video_type = Column(SQLEnum(VideoType), nullable=False)
     
@@ -73,6 +104,51 @@ class Video(Base):
     # passive_deletes='all' - не устанавливать video_id=NULL при удалении Video
     # Используется soft delete в API, но если нужно hard delete - добавить cascade="all, delete"
     playback_logs = relationship("PlaybackLog", back_populates="video", passive_deletes='all')
+    renditions = relationship(
+        "VideoRendition", back_populates="video", cascade="all, delete-orphan",
+        order_by="VideoRendition.height"
+    )
+
+
+class MediaBlob(Base):
+    """
+    Файл видео в контентно-адресуемом хранилище (MEDIA_STORE_DIR/<sha[:2]>/<sha>).
+    
+    ref_count - число видео, ссылающихся на содержимое; файл удаляется вместе с последней ссылкой.
+    """
+    __tablename__ = "media_blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class VideoRendition(Base):
+    """
+    Качество видео из лестницы HLS: отдельный fMP4-файл с плейлистом по байтовым диапазонам.
+    
+    Файл целиком - тот же поток, что и сегменты HLS, поэтому устройство может
+    скачать в кеш одно подходящее качество вместо исходника.
+    """
+    __tablename__ = "video_renditions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False, index=True)
+    name = Column(String(32), nullable=False)  # например "480p"
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    bandwidth = Column(Integer, nullable=False)  # пиковый битрейт сегмента, бит/с (BANDWIDTH в master)
+    average_bandwidth = Column(Integer, nullable=False)  # бит/с по всему файлу
+    codecs = Column(String(64))  # CODECS для master-плейлиста
+    playlist_path = Column(String(1000), nullable=False)  # URL плейлиста качества
+    file_path = Column(String(1000), nullable=False)  # URL fMP4-файла качества
+    file_size = Column(BigInteger, nullable=False)
+    content_sha256 = Column(String(64))  # hex fMP4-файла; устройство сверяет с локальным кешем
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    video = relationship("Video", back_populates="renditions")
 
 
 class VehicleSession(Base):
@@ -85,25 +161,39 @@ class VehicleSession(Base):
     start_time = Column(DateTime(timezone=True), nullable=False)
     end_time = Column(DateTime(timezone=True), nullable=True)
     
-    # Метрики сессии
+    # Метрики сессии (videos_played и total_played_seconds накапливаются при приеме логов)
     total_duration_seconds = Column(Integer, default=0)
     videos_played = Column(Integer, default=0)
+    total_played_seconds = Column(Float, default=0.0, server_default="0")
+    
+    # Последний heartbeat в рамках сессии; по нему закрываются зависшие сессии
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relationships
     vehicle = relationship("Vehicle", back_populates="sessions")
+    
+    __table_args__ = (
+        # Открытые сессии - то, что просматривает чистильщик зависших сессий
+        Index("ix_vehicle_sessions_open", "start_time", postgresql_where=text("end_time IS NULL")),
+    )
 
 
 class PlaybackLog(Base):
-    """Лог воспроизведения видео"""
+    """
+    Лог воспроизведения видео.
+    
+    Таблица секционирована по месяцам (RANGE по played_at), поэтому
+    played_at входит в первичный ключ. Секции создает PartitionService.
+    """
     __tablename__ = "playback_logs"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     vehicle_id = Column(Integer, ForeignKey("vehicles.id"), nullable=False)
     video_id = Column(Integer, ForeignKey("videos.id"), nullable=False)
     session_id = Column(Integer, ForeignKey("vehicle_sessions.id"), nullable=True)
     
-    # Время воспроизведения
-    played_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    # Время воспроизведения (ключ секционирования)
+    played_at = Column(DateTime(timezone=True), primary_key=True, index=True)
     
     # Длительность воспроизведения (может отличаться от длительности видео)
     duration_seconds = Column(Float, nullable=False)
@@ -119,6 +209,55 @@ class PlaybackLog(Base):
     # Relationships
     vehicle = relationship("Vehicle", back_populates="playback_logs")
     video = relationship("Video", back_populates="playback_logs")
+    
+    __table_args__ = (
+        # Выборки по автомобилю/видео всегда идут с диапазоном по времени
+        Index("ix_playback_logs_vehicle_played_at", "vehicle_id", "played_at"),
+        Index("ix_playback_logs_video_played_at", "video_id", "played_at"),
+        {"postgresql_partition_by": "RANGE (played_at)"},
+    )
+
+
+class VehicleDailyStats(Base):
+    """
+    Дневной агрегат воспроизведений по автомобилю.
+    
+    Обновляется при записи каждого лога (upsert), поэтому отчеты по парку
+    читают десятки тысяч строк вместо сотен миллионов логов.
+    """
+    __tablename__ = "vehicle_daily_stats"
+    
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    
+    # Тариф автомобиля на момент первого воспроизведения за день
+    tariff = Column(SQLEnum(VehicleTariff), nullable=False)
+    
+    videos_played = Column(Integer, nullable=False, default=0)
+    total_duration_seconds = Column(Float, nullable=False, default=0)
+    prime_time_duration_seconds = Column(Float, nullable=False, default=0)
+    earnings = Column(Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_vehicle_daily_stats_day", "day"),
+    )
+
+
+class VideoDailyStats(Base):
+    """Дневной агрегат воспроизведений по видео в разрезе тарифа"""
+    __tablename__ = "video_daily_stats"
+    
+    video_id = Column(Integer, ForeignKey("videos.id"), primary_key=True)
+    tariff = Column(SQLEnum(VehicleTariff), primary_key=True)
+    day = Column(Date, primary_key=True)
+    
+    play_count = Column(Integer, nullable=False, default=0)
+    total_duration = Column(Float, nullable=False, default=0)
+    earnings = Column(Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_video_daily_stats_day", "day"),
+    )
 
 
 class Playlist(Base):
@@ -137,3 +276,113 @@ class Playlist(Base):
     valid_until = Column(DateTime(timezone=True), nullable=False)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class VehicleHourlyActivity(Base):
+    """
+    Почасовая активность автомобиля: автомобиль считается активным в часе,
+    если за этот час было хотя бы одно воспроизведение.
+    """
+    __tablename__ = "vehicle_hourly_activity"
+    
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    tariff = Column(SQLEnum(VehicleTariff), nullable=False)
+    plays = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_vehicle_hourly_activity_hour_tariff", "hour", "tariff"),
+    )
+
+
+class VideoHourlyStats(Base):
+    """Почасовое количество воспроизведений видео в разрезе тарифа"""
+    __tablename__ = "video_hourly_stats"
+    
+    video_id = Column(Integer, ForeignKey("videos.id"), primary_key=True)
+    tariff = Column(SQLEnum(VehicleTariff), primary_key=True)
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    play_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_video_hourly_stats_hour", "hour"),
+    )
+
+
+class VideoReachDaily(Base):
+    """
+    HyperLogLog-скетч уникальных автомобилей, показавших видео за день (UTC).
+    
+    Регистры (HLL_REGISTERS байт) обновляются при приеме лога; скетчи разных дней
+    объединяются поэлементным максимумом (см. app.core.hll).
+    """
+    __tablename__ = "video_reach_daily"
+    
+    video_id = Column(Integer, ForeignKey("videos.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    registers = Column(LargeBinary, nullable=False)
+
+
+class VideoReachMonthly(Base):
+    """Тот же скетч за календарный месяц: длинные диапазоны читают месяцы, а не дни"""
+    __tablename__ = "video_reach_monthly"
+    
+    video_id = Column(Integer, ForeignKey("videos.id"), primary_key=True)
+    month = Column(Date, primary_key=True)  # первое число месяца
+    registers = Column(LargeBinary, nullable=False)
+
+
+class RateCard(Base):
+    """
+    Ставка оплаты показа для тарифа в части суток (daypart).
+    
+    Версия карты - набор строк одного тарифа с общими version и effective_from,
+    покрывающий все 24 часа. Строки никогда не изменяются: новая ставка -
+    это новая версия, поэтому уже начисленный заработок не пересчитывается.
+    """
+    __tablename__ = "rate_cards"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tariff = Column(SQLEnum(VehicleTariff), nullable=False)
+    version = Column(Integer, nullable=False)
+    
+    # Часть суток [start_hour, end_hour) по UTC, как и праймтайм
+    start_hour = Column(Integer, nullable=False)
+    end_hour = Column(Integer, nullable=False)
+    
+    rate_per_second = Column(Float, nullable=False)  # сум за секунду показа
+    effective_from = Column(DateTime(timezone=True), nullable=False)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_rate_cards_tariff_effective_from", "tariff", "effective_from"),
+        Index("uq_rate_cards_tariff_version_start_hour", "tariff", "version", "start_hour", unique=True),
+    )
+
+
+class EarningsLedger(Base):
+    """
+    Журнал начислений: одна запись на лог воспроизведения, пишется один раз
+    при приеме лога по ставке, действовавшей в момент показа.
+    """
+    __tablename__ = "earnings_ledger"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # Без внешнего ключа: первичный ключ секционированной playback_logs - (id, played_at)
+    playback_log_id = Column(Integer, nullable=False, unique=True)
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id"), nullable=False)
+    video_id = Column(Integer, ForeignKey("videos.id"), nullable=False)
+    earned_at = Column(DateTime(timezone=True), nullable=False)
+    duration_seconds = Column(Float, nullable=False)
+    
+    # NULL - ставка по умолчанию (нет карты для тарифа)
+    rate_card_id = Column(Integer, ForeignKey("rate_cards.id"), nullable=True)
+    rate_per_second = Column(Float, nullable=False)
+    amount = Column(Float, nullable=False)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_earnings_ledger_vehicle_earned_at", "vehicle_id", "earned_at"),
+    )
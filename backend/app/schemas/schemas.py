@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import datetime
-from app.models.models import VehicleTariff, VideoType
+from typing import Dict, Optional, List
+from datetime import datetime, date
+from app.models.models import VehicleTariff, VideoType, MediaProbeStatus, TranscodeStatus
 
 
 # Bcrypt принимает пароль до 72 байт
@@ -26,6 +26,7 @@ class VehicleResponse(BaseModel):
     driver_name: Optional[str]
     phone: Optional[str]
     is_active: bool
+    last_seen_at: Optional[datetime] = None
     created_at: datetime
     
     class Config:
@@ -60,6 +61,29 @@ class VideoCreate(BaseModel):
     priority: int = 0
 
 
+# Возобновляемая загрузка видео
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=500)
+    size: int = Field(..., gt=0)  # в байтах
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")  # проверяется при завершении
+
+
+class UploadSessionStatus(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    offset: int  # сколько байт уже принято - следующий кусок начинается отсюда
+    chunk_max_bytes: int
+
+
+class UploadSessionComplete(BaseModel):
+    title: str
+    video_type: VideoType
+    plays_per_hour: Optional[int] = None
+    tariffs: List[VehicleTariff]
+    priority: int = 0
+
+
 class VideoUpdate(BaseModel):
     title: Optional[str] = None
     video_type: Optional[VideoType] = None
@@ -76,7 +100,15 @@ class VideoResponse(BaseModel):
     filename: str
     file_path: str
     file_size: Optional[int]
+    content_sha256: Optional[str] = None
     duration: Optional[float]
+    video_codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    bit_rate: Optional[int] = None
+    probe_status: Optional[MediaProbeStatus] = None
+    transcode_status: Optional[TranscodeStatus] = None
+    hls_path: Optional[str] = None
     video_type: VideoType
     plays_per_hour: Optional[int]
     tariffs: str
@@ -104,16 +136,53 @@ class SessionResponse(BaseModel):
     end_time: Optional[datetime]
     total_duration_seconds: int
     videos_played: int
+    total_played_seconds: float = 0.0
     
     class Config:
         from_attributes = True
 
 
+class OnlineTariffCount(BaseModel):
+    tariff: VehicleTariff
+    online: int
+
+
+class OnlineFleet(BaseModel):
+    total: int
+    by_tariff: List[OnlineTariffCount]
+
+
+class LiveVideoPlays(BaseModel):
+    video_id: int
+    plays: int
+
+
+class LiveStatsSnapshot(BaseModel):
+    """Снимок живых счетчиков за скользящее окно (tariff -> значение)"""
+    generated_at: datetime
+    window_seconds: int
+    plays_per_minute: Dict[str, float]
+    total_plays_per_minute: float
+    active_vehicles: int
+    active_vehicles_by_tariff: Dict[str, int]
+    top_videos: List[LiveVideoPlays]
+
+
 # Playback Log Schemas
 class PlaybackLogCreate(BaseModel):
     video_id: int
     duration_seconds: float
     completed: bool = True
+    # Время показа на устройстве (для логов, накопленных офлайн); None - время сервера
+    played_at: Optional[datetime] = None
+
+
+class PlaybackLogBatch(BaseModel):
+    logs: List[PlaybackLogCreate]
+
+
+class PlaybackLogBatchResponse(BaseModel):
+    accepted: int
 
 
 class PlaybackLogResponse(BaseModel):
@@ -129,7 +198,40 @@ class PlaybackLogResponse(BaseModel):
         from_attributes = True
 
 
+class VideoReach(BaseModel):
+    """
+    Приблизительный охват видео: уникальные автомобили за период (HyperLogLog).
+    [lower_bound, upper_bound] - интервал ~95% (+-2 стандартные ошибки).
+    """
+    video_id: int
+    start_date: date
+    end_date: date
+    unique_vehicles: int
+    relative_standard_error: float
+    lower_bound: int
+    upper_bound: int
+    sketches_merged: int
+
+
 # Playlist Schemas
+class VideoVariant(BaseModel):
+    """Качество видео из лестницы HLS"""
+    name: str          # например "480p"
+    width: int
+    height: int
+    bandwidth: int     # пиковый битрейт, бит/с
+    average_bandwidth: int
+    media_url: str     # fMP4-файл качества целиком (для офлайн-кеша)
+    playlist_url: str  # плейлист качества HLS
+
+
+class VideoMedia(BaseModel):
+    """Ссылки видео плейлиста - одна запись на видео, а не на каждый его показ"""
+    media_url: str     # исходник
+    hls_url: Optional[str] = None  # master-плейлист HLS, если лестница качеств готова
+    variants: List[VideoVariant] = []  # качества по возрастанию высоты
+
+
 class ContractVideoItem(BaseModel):
     """Контрактное видео с временными метками"""
     video_id: int
@@ -137,16 +239,16 @@ class ContractVideoItem(BaseModel):
     end_time: float    # Время окончания в секундах от начала часа (0-3600)
     duration: float    # Длительность в секундах
     frequency: int = 1  # Количество повторений этого видео в плейлисте
-    file_path: str      # Путь к файлу (например, /uploads/videos/filename.mp4)
-    media_url: str      # Полный URL для доступа к медиа файлу
+    file_path: str      # Путь к файлу (например, /media/<sha256>.mp4)
+    media_url: str      # Полный URL для доступа к медиа файлу (исходник)
 
 
 class FillerVideoItem(BaseModel):
     """Филлерное видео с информацией"""
     video_id: int
     duration: float    # Длительность в секундах
-    file_path: str     # Путь к файлу (например, /uploads/videos/filename.mp4)
-    media_url: str     # Полный URL для доступа к медиа файлу
+    file_path: str     # Путь к файлу (например, /media/<sha256>.mp4)
+    media_url: str     # Полный URL для доступа к медиа файлу (исходник)
 
 
 class PlaylistResponse(BaseModel):
@@ -157,6 +259,8 @@ class PlaylistResponse(BaseModel):
     contract_videos: List[ContractVideoItem]
     # Список филлеров с длительностью
     filler_videos: List[FillerVideoItem]
+    # Исходник и качества HLS по video_id (элементы выше ссылаются на них по video_id)
+    media: Dict[int, VideoMedia] = {}
     # Упорядоченная последовательность ID видео для воспроизведения
     video_sequence: List[int]
     # Общая длительность плейлиста в секундах (3600 для часового плейлиста)
@@ -169,6 +273,65 @@ class PlaylistResponse(BaseModel):
         from_attributes = True
 
 
+class MediaManifestFile(BaseModel):
+    """Файл, который нужен устройству для текущего или следующего плейлиста"""
+    url: str
+    path: str
+    sha256: Optional[str] = None  # None - файл вне хранилища /media, сверять по ETag
+    size: Optional[int] = None
+    variant: str                  # "source" или качество HLS ("480p")
+    video_ids: List[int]
+    playlist: str                 # "current" или "next" - где файл нужен впервые
+    first_needed_offset: float    # секунда первого воспроизведения в часовом цикле этого плейлиста
+
+
+class MediaManifestResponse(BaseModel):
+    """Манифест синхронизации медиа: файлы в порядке первого воспроизведения"""
+    vehicle_id: int
+    tariff: VehicleTariff
+    generated_at: datetime
+    current_playlist_id: int
+    current_valid_until: datetime
+    next_playlist_id: Optional[int] = None  # создается заранее перед сменой плейлиста
+    next_valid_from: Optional[datetime] = None
+    total_bytes: int
+    files: List[MediaManifestFile]
+
+
+class DepotBundleFile(BaseModel):
+    """Файл в архиве пакета депо"""
+    name: str                     # имя в tar
+    path: str                     # URL-путь на сервере (/media/..., у плейлистов - пусто)
+    offset: int                   # смещение данных в архиве (Range: bytes=offset-offset+size-1)
+    size: int
+    sha256: str
+    video_ids: List[int] = []
+    source_mtime_ns: Optional[int] = None  # для файлов вне хранилища /media: проверка изменения
+
+
+class DepotBundlePlaylist(BaseModel):
+    id: int
+    name: str                     # имя JSON (PlaylistResponse, URL медиа относительные) в архиве
+    valid_from: datetime
+    valid_until: datetime
+
+
+class DepotBundleIndex(BaseModel):
+    """Оглавление пакета депо; то же самое лежит последним файлом архива (index.json)"""
+    bundle_id: str
+    base_bundle_id: Optional[str] = None  # предыдущий пакет, из которого взяты неизмененные файлы
+    tariff: VehicleTariff
+    generated_at: datetime
+    valid_from: datetime
+    valid_until: datetime
+    max_height: int
+    playlists: List[DepotBundlePlaylist]
+    files: List[DepotBundleFile]
+    total_bytes: int
+    reused_bytes: int             # перенесено из предыдущего пакета
+    packed_bytes: int             # новые и измененные файлы
+
+
 # Analytics Schemas
 class DailyAnalytics(BaseModel):
     date: str
@@ -191,3 +354,108 @@ class VehicleAnalytics(BaseModel):
     daily_stats: List[DailyAnalytics]
     video_stats: List[VideoAnalytics]
     total_earnings: float
+
+
+# Fleet Analytics Schemas
+class FleetVehicleTotals(BaseModel):
+    vehicle_id: int
+    car_number: str
+    tariff: VehicleTariff
+    videos_played: int
+    total_duration_seconds: float
+    prime_time_duration_seconds: float
+    earnings: float
+
+
+class FleetVideoTotals(BaseModel):
+    video_id: int
+    video_title: str
+    video_type: VideoType
+    play_count: int
+    total_duration: float
+    earnings: float
+
+
+class FleetTariffTotals(BaseModel):
+    tariff: VehicleTariff
+    active_vehicles: int
+    videos_played: int
+    total_duration_seconds: float
+    prime_time_duration_seconds: float
+    earnings: float
+
+
+class FleetVehiclePage(BaseModel):
+    items: List[FleetVehicleTotals]
+    # Курсор для следующей страницы (None - страниц больше нет)
+    next_cursor: Optional[str] = None
+
+
+class FleetVideoPage(BaseModel):
+    items: List[FleetVideoTotals]
+    next_cursor: Optional[str] = None
+
+
+# Contract Fulfillment Schemas
+class ContractHourFulfillment(BaseModel):
+    hour: datetime
+    tariff: VehicleTariff
+    active_vehicles: int
+    promised: int
+    delivered: int
+    shortfall: int
+
+
+class ContractTariffFulfillment(BaseModel):
+    tariff: VehicleTariff
+    active_vehicle_hours: int
+    promised: int
+    delivered: int
+    fulfillment_rate: float
+    shortfall_hours: int
+
+
+class ContractFulfillment(BaseModel):
+    video_id: int
+    video_title: str
+    plays_per_hour: int
+    promised: int
+    delivered: int
+    fulfillment_rate: float  # delivered / promised (1.0 - обещание выполнено)
+    by_tariff: List[ContractTariffFulfillment]
+    shortfall_hours: List[ContractHourFulfillment]
+    # Все часы (только при include_hours=true)
+    hours: Optional[List[ContractHourFulfillment]] = None
+
+
+class FulfillmentReport(BaseModel):
+    start_date: date
+    end_date: date
+    tolerance: float
+    contracts: List[ContractFulfillment]
+
+
+# Rate Card Schemas
+class RateCardDaypart(BaseModel):
+    start_hour: int = Field(..., ge=0, le=23)
+    end_hour: int = Field(..., ge=1, le=24)
+    rate_per_second: float = Field(..., ge=0)
+
+
+class RateCardCreate(BaseModel):
+    tariff: VehicleTariff
+    # None - вступает в силу, как только все воркеры увидят новую версию
+    effective_from: Optional[datetime] = None
+    # Части суток должны без пересечений покрывать все 24 часа
+    dayparts: List[RateCardDaypart]
+
+
+class RateCardDaypartResponse(RateCardDaypart):
+    id: int
+
+
+class RateCardVersionResponse(BaseModel):
+    tariff: VehicleTariff
+    version: int
+    effective_from: datetime
+    dayparts: List[RateCardDaypartResponse]
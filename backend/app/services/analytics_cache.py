@@ -0,0 +1,134 @@
+import json
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+from app.core.cache import TTLCache, get_redis, mark_redis_failed
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsDayCache:
+    """
+    Кеш дневной аналитики автомобиля для закрытых (завершившихся) дней.
+
+    Значение - агрегаты одного дня: {"daily": {...} | None, "videos": {video_id: {...}}}.
+    Слои: in-process TTLCache -> Redis -> расчет в БД. Закрытый день не меняется,
+    поэтому инвалидация нужна только при позднем офлайн-логе за этот день
+    (invalidate удаляет ровно один ключ в обоих слоях; в других воркерах
+    in-process копия живет не дольше ANALYTICS_DAY_CACHE_LOCAL_TTL).
+
+    У каждого дня в Redis есть счетчик версии: invalidate его увеличивает, а
+    set_many пишет агрегат, только если версия не изменилась с момента чтения
+    в get_many. Иначе агрегат, посчитанный до позднего лога, вернулся бы в Redis
+    на ANALYTICS_DAY_CACHE_REDIS_TTL.
+    """
+
+    KEY_PREFIX = "analytics:day:v1"
+    VERSION_PREFIX = "analytics:day-version:v1"
+
+    # KEYS: [версия, значение]*, ARGV: [ttl, (ожидаемая версия, значение)*]
+    _SET_IF_VERSION = """
+for i = 1, #KEYS, 2 do
+    local current = redis.call('GET', KEYS[i]) or ''
+    if current == ARGV[i + 1] then
+        redis.call('SETEX', KEYS[i + 1], ARGV[1], ARGV[i + 2])
+    end
+end
+return 0
+"""
+
+    _local = TTLCache(
+        maxsize=settings.ANALYTICS_DAY_CACHE_MAX_ENTRIES,
+        ttl=settings.ANALYTICS_DAY_CACHE_LOCAL_TTL
+    )
+
+    @staticmethod
+    def key(vehicle_id: int, day: date) -> str:
+        return f"{AnalyticsDayCache.KEY_PREFIX}:{vehicle_id}:{day.isoformat()}"
+
+    @staticmethod
+    def version_key(vehicle_id: int, day: date) -> str:
+        return f"{AnalyticsDayCache.VERSION_PREFIX}:{vehicle_id}:{day.isoformat()}"
+
+    @staticmethod
+    def get_many(vehicle_id: int, days: Iterable[date]) -> Tuple[Dict[date, dict], Dict[date, str]]:
+        """
+        Вернуть закешированные дни (отсутствующие в результате нужно посчитать)
+        и версии дней, прочитанные из Redis, - их нужно передать в set_many.
+        """
+        keys = {AnalyticsDayCache.key(vehicle_id, day): day for day in days}
+        found = {keys[k]: v for k, v in AnalyticsDayCache._local.get_many(keys).items()}
+        versions: Dict[date, str] = {}
+
+        missing = [k for k, day in keys.items() if day not in found]
+        redis_client = get_redis() if missing else None
+        if redis_client is not None:
+            version_keys = [AnalyticsDayCache.version_key(vehicle_id, keys[k]) for k in missing]
+            try:
+                # Версия читается до расчета в БД: поздний лог после этого чтения ее изменит
+                values = redis_client.mget(missing + version_keys)
+            except Exception as e:
+                mark_redis_failed(e)
+                values = []
+            for k, raw, version in zip(missing, values, values[len(missing):]):
+                versions[keys[k]] = version.decode() if version is not None else ""
+                if raw is None:
+                    continue
+                payload = json.loads(raw)
+                AnalyticsDayCache._local.set(k, payload)
+                found[keys[k]] = payload
+
+        return found, versions
+
+    @staticmethod
+    def set_many(vehicle_id: int, payloads: Dict[date, dict], versions: Dict[date, str]) -> None:
+        """
+        Сохранить агрегаты закрытых дней в оба слоя.
+
+        В Redis пишутся только дни, версия которых не изменилась с get_many;
+        дни без прочитанной версии (Redis был недоступен) остаются только в памяти.
+        """
+        if not payloads:
+            return
+
+        for day, payload in payloads.items():
+            AnalyticsDayCache._local.set(AnalyticsDayCache.key(vehicle_id, day), payload)
+
+        checked = [day for day in payloads if day in versions]
+        redis_client = get_redis() if checked else None
+        if redis_client is None:
+            return
+        keys: List[str] = []
+        args: List = [settings.ANALYTICS_DAY_CACHE_REDIS_TTL]
+        for day in checked:
+            keys += [AnalyticsDayCache.version_key(vehicle_id, day), AnalyticsDayCache.key(vehicle_id, day)]
+            args += [versions[day], json.dumps(payloads[day], separators=(",", ":"))]
+        try:
+            redis_client.eval(AnalyticsDayCache._SET_IF_VERSION, len(keys), *keys, *args)
+        except Exception as e:
+            mark_redis_failed(e)
+
+    @staticmethod
+    def invalidate(vehicle_id: int, days: List[date]) -> None:
+        """Сбросить кеш конкретных дней (поздние офлайн-логи)"""
+        keys = [AnalyticsDayCache.key(vehicle_id, day) for day in days]
+        for k in keys:
+            AnalyticsDayCache._local.delete(k)
+
+        redis_client = get_redis()
+        if redis_client is None or not keys:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            for day in days:
+                version_key = AnalyticsDayCache.version_key(vehicle_id, day)
+                pipe.incr(version_key)
+                # Версия переживает любой агрегат, записанный до ее увеличения
+                pipe.expire(version_key, settings.ANALYTICS_DAY_CACHE_REDIS_TTL)
+            pipe.delete(*keys)
+            pipe.execute()
+        except Exception as e:
+            mark_redis_failed(e)
+            logger.warning("Failed to invalidate analytics cache for vehicle %s: %s", vehicle_id, days)
@@ -1,15 +1,28 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from datetime import datetime, date, timedelta
-from typing import List
-from app.models.models import PlaybackLog, Video, Vehicle, VehicleSession
-from app.schemas.schemas import DailyAnalytics, VideoAnalytics, VehicleAnalytics
+from sqlalchemy import func, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime, date, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from app.models.models import (
+    PlaybackLog, Video, Vehicle, VehicleSession, VehicleTariff,
+    VehicleDailyStats, VideoDailyStats, VehicleHourlyActivity, VideoHourlyStats,
+    EarningsLedger
+)
+from app.schemas.schemas import DailyAnalytics, VideoAnalytics, VehicleAnalytics, PlaybackLogCreate
 from app.core.config import settings
+from app.core.time_utils import as_utc_naive
+from app.services.analytics_cache import AnalyticsDayCache
+from app.services.rate_card_service import RateCardService
+from app.services.live_stats_service import live_stats
+from app.services.reach_service import ReachService
 
 
 class AnalyticsService:
     """Сервис аналитики"""
     
+    # Ставка по умолчанию (сум за секунду показа) для тарифов без карты ставок
+    BASE_RATE_PER_SECOND = 100
+    
     @staticmethod
     def is_prime_time(dt: datetime) -> bool:
         """Проверка на праймтайм"""
@@ -20,18 +33,118 @@ class AnalyticsService:
     def calculate_earnings(duration_seconds: float, is_prime_time: bool) -> float:
         """
         Расчет заработка
-        Базовая ставка: 100 сум за секунду (можно настроить)
+        Базовая ставка: BASE_RATE_PER_SECOND сум за секунду
         В праймтайм - умножается на коэффициент
         """
-        BASE_RATE_PER_SECOND = 100  # сум
-        
-        earnings = duration_seconds * BASE_RATE_PER_SECOND
+        earnings = duration_seconds * AnalyticsService.BASE_RATE_PER_SECOND
         
         if is_prime_time:
             earnings *= settings.PRIME_TIME_MULTIPLIER
         
         return earnings
     
+    @staticmethod
+    def rate_in_force(
+        db: Session,
+        tariff: VehicleTariff,
+        played_at: datetime
+    ) -> Tuple[Optional[int], float]:
+        """
+        Ставка за секунду, действовавшая в момент показа.
+        
+        Returns:
+            (rate_card_id, rate_per_second); rate_card_id=None - ставка по умолчанию
+        """
+        resolved = RateCardService.resolve_rate(db, tariff, played_at) if tariff else None
+        if resolved is not None:
+            return resolved
+        rate = AnalyticsService.calculate_earnings(1.0, AnalyticsService.is_prime_time(played_at))
+        return None, rate
+    
+    @staticmethod
+    def period_bounds(start_date: date, end_date: date) -> Tuple[datetime, datetime]:
+        """Полуоткрытый интервал [start_date 00:00, end_date + 1 день 00:00)"""
+        return (
+            datetime.combine(start_date, time.min),
+            datetime.combine(end_date + timedelta(days=1), time.min)
+        )
+    
+    @staticmethod
+    def _aggregate_days(
+        db: Session,
+        vehicle_id: int,
+        start_date: date,
+        end_date: date
+    ) -> Dict[date, dict]:
+        """
+        Посчитать агрегаты автомобиля по дням и видео одним GROUP BY в БД.
+        Заработок - сумма по журналу начислений (earnings_ledger), а не пересчет по ставке.
+        
+        Возвращает запись для КАЖДОГО дня периода (пустые дни - daily=None),
+        чтобы закрытые дни без воспроизведений тоже попадали в кеш.
+        """
+        period_start, period_end = AnalyticsService.period_bounds(start_date, end_date)
+        
+        day_col = func.date(PlaybackLog.played_at)
+        # Секунды округляются вниз для каждого лога (как int(duration_seconds))
+        whole_seconds = func.trunc(PlaybackLog.duration_seconds)
+        
+        rows = db.query(
+            day_col.label("day"),
+            PlaybackLog.video_id,
+            func.count().label("plays"),
+            func.sum(PlaybackLog.duration_seconds).label("duration"),
+            func.sum(whole_seconds).label("whole_seconds"),
+            func.sum(case((PlaybackLog.is_prime_time == True, whole_seconds), else_=0)).label("prime_seconds"),
+        ).filter(
+            PlaybackLog.vehicle_id == vehicle_id,
+            PlaybackLog.played_at >= period_start,
+            PlaybackLog.played_at < period_end
+        ).group_by(day_col, PlaybackLog.video_id).all()
+        
+        earned_day_col = func.date(EarningsLedger.earned_at)
+        earnings_by_day = {
+            (day if isinstance(day, date) else date.fromisoformat(str(day))): float(amount or 0)
+            for day, amount in db.query(
+                earned_day_col,
+                func.sum(EarningsLedger.amount)
+            ).filter(
+                EarningsLedger.vehicle_id == vehicle_id,
+                EarningsLedger.earned_at >= period_start,
+                EarningsLedger.earned_at < period_end
+            ).group_by(earned_day_col).all()
+        }
+        
+        payloads = {
+            start_date + timedelta(days=offset): {"daily": None, "videos": {}}
+            for offset in range((end_date - start_date).days + 1)
+        }
+        
+        for row in rows:
+            day = row.day if isinstance(row.day, date) else date.fromisoformat(str(row.day))
+            payload = payloads.setdefault(day, {"daily": None, "videos": {}})
+            
+            daily = payload["daily"]
+            if daily is None:
+                daily = payload["daily"] = {
+                    "date": day.isoformat(),
+                    "total_duration_seconds": 0,
+                    "videos_played": 0,
+                    "prime_time_duration_seconds": 0,
+                    "earnings": earnings_by_day.get(day, 0.0)
+                }
+            daily["total_duration_seconds"] += int(row.whole_seconds or 0)
+            daily["videos_played"] += row.plays
+            daily["prime_time_duration_seconds"] += int(row.prime_seconds or 0)
+            
+            # Ключи - строки: значение сериализуется в JSON для Redis
+            payload["videos"][str(row.video_id)] = {
+                "play_count": row.plays,
+                "total_duration": float(row.duration or 0)
+            }
+        
+        return payloads
+    
     @staticmethod
     def get_vehicle_analytics(
         db: Session, 
@@ -40,68 +153,65 @@ class AnalyticsService:
         end_date: date
     ) -> VehicleAnalytics:
         """
-        Получить аналитику для автомобиля за период
+        Получить аналитику для автомобиля за период.
+        
+        Закрытые дни (до сегодняшнего по UTC) берутся из AnalyticsDayCache и
+        считаются в БД только при промахе; текущий день всегда считается заново.
         """
         vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
         if not vehicle:
             raise ValueError("Vehicle not found")
         
-        # Получить логи за период
-        logs = db.query(PlaybackLog).filter(
-            and_(
-                PlaybackLog.vehicle_id == vehicle_id,
-                func.date(PlaybackLog.played_at) >= start_date,
-                func.date(PlaybackLog.played_at) <= end_date
-            )
-        ).all()
+        today = datetime.utcnow().date()
+        payloads: Dict[date, dict] = {}
         
-        # Группировать по дням
-        daily_stats = {}
-        video_stats = {}
+        # Закрытые дни - из кеша
+        closed_end = min(end_date, today - timedelta(days=1))
+        if start_date <= closed_end:
+            closed_days = [
+                start_date + timedelta(days=offset)
+                for offset in range((closed_end - start_date).days + 1)
+            ]
+            cached, versions = AnalyticsDayCache.get_many(vehicle_id, closed_days)
+            missing = [day for day in closed_days if day not in cached]
+            if missing:
+                computed = AnalyticsService._aggregate_days(db, vehicle_id, missing[0], missing[-1])
+                fresh = {day: computed[day] for day in missing}
+                AnalyticsDayCache.set_many(vehicle_id, fresh, versions)
+                cached.update(fresh)
+            payloads.update(cached)
         
-        for log in logs:
-            log_date = log.played_at.date()
-            day_key = log_date.isoformat()
-            
-            if day_key not in daily_stats:
-                daily_stats[day_key] = {
-                    'date': day_key,
-                    'total_duration_seconds': 0,
-                    'videos_played': 0,
-                    'prime_time_duration_seconds': 0,
-                    'earnings': 0
-                }
-            
-            daily_stats[day_key]['total_duration_seconds'] += int(log.duration_seconds)
-            daily_stats[day_key]['videos_played'] += 1
-            
-            if log.is_prime_time:
-                daily_stats[day_key]['prime_time_duration_seconds'] += int(log.duration_seconds)
-            
-            earnings = AnalyticsService.calculate_earnings(
-                log.duration_seconds, 
-                log.is_prime_time
-            )
-            daily_stats[day_key]['earnings'] += earnings
-            
-            # Статистика по видео
-            if log.video_id not in video_stats:
-                video = db.query(Video).filter(Video.id == log.video_id).first()
-                video_stats[log.video_id] = {
-                    'video_id': log.video_id,
-                    'video_title': video.title if video else 'Unknown',
-                    'play_count': 0,
-                    'total_duration': 0
-                }
-            
-            video_stats[log.video_id]['play_count'] += 1
-            video_stats[log.video_id]['total_duration'] += log.duration_seconds
+        # Текущий день (и будущие, если запрошены) - всегда живой расчет
+        live_start = max(start_date, today)
+        if live_start <= end_date:
+            payloads.update(AnalyticsService._aggregate_days(db, vehicle_id, live_start, end_date))
+        
+        daily_analytics = []
+        video_totals: Dict[int, dict] = {}
+        for day in sorted(payloads):
+            payload = payloads[day]
+            if payload["daily"] is not None:
+                daily_analytics.append(DailyAnalytics(**payload["daily"]))
+            for video_key, stats in payload["videos"].items():
+                totals = video_totals.setdefault(int(video_key), {"play_count": 0, "total_duration": 0.0})
+                totals["play_count"] += stats["play_count"]
+                totals["total_duration"] += stats["total_duration"]
+        
+        # Названия видео - одним запросом (название может меняться, поэтому не кешируется)
+        titles = dict(
+            db.query(Video.id, Video.title).filter(Video.id.in_(video_totals)).all()
+        ) if video_totals else {}
         
-        # Конвертировать в модели
-        daily_analytics = [DailyAnalytics(**stats) for stats in daily_stats.values()]
-        video_analytics = [VideoAnalytics(**stats) for stats in video_stats.values()]
+        video_analytics = [
+            VideoAnalytics(
+                video_id=video_id,
+                video_title=titles.get(video_id, 'Unknown'),
+                **totals
+            )
+            for video_id, totals in sorted(video_totals.items())
+        ]
         
-        total_earnings = sum(day['earnings'] for day in daily_stats.values())
+        total_earnings = sum(day.earnings for day in daily_analytics)
         
         return VehicleAnalytics(
             vehicle_id=vehicle_id,
@@ -118,29 +228,255 @@ class AnalyticsService:
         video_id: int,
         duration_seconds: float,
         session_id: int = None,
-        completed: bool = True
+        completed: bool = True,
+        tariff: Optional[VehicleTariff] = None,
+        played_at: Optional[datetime] = None
     ) -> PlaybackLog:
         """
-        Записать лог воспроизведения
-        """
-        now = datetime.utcnow()
-        is_prime = AnalyticsService.is_prime_time(now)
+        Записать лог воспроизведения, начисление в журнал и обновить агрегаты.
         
-        log = PlaybackLog(
-            vehicle_id=vehicle_id,
+        played_at - время показа с устройства (офлайн-логи, отправленные позже).
+        Если не указано - текущее время сервера.
+        """
+        entry = PlaybackLogCreate(
             video_id=video_id,
-            session_id=session_id,
-            played_at=now,
             duration_seconds=duration_seconds,
-            is_prime_time=is_prime,
-            completed=completed
+            completed=completed,
+            played_at=played_at
         )
+        log = AnalyticsService.log_playback_batch(
+            db, vehicle_id, [entry], session_id=session_id, tariff=tariff
+        )[0]
+        db.refresh(log)
+        return log
+    
+    @staticmethod
+    def log_playback_batch(
+        db: Session,
+        vehicle_id: int,
+        entries: List[PlaybackLogCreate],
+        session_id: Optional[int] = None,
+        tariff: Optional[VehicleTariff] = None
+    ) -> List[PlaybackLog]:
+        """
+        Записать пачку логов одной транзакцией.
+        
+        Начисление каждого лога считается один раз по ставке, действовавшей в момент
+        показа. Агрегаты и счетчики сессии обновляются по пачке целиком: дельты
+        суммируются в памяти, и на каждую таблицу уходит один UPSERT/UPDATE.
+        Если хотя бы один лог невалиден (ValueError), пачка не записывается.
+        """
+        now = datetime.utcnow()
+        
+        if tariff is None:
+            tariff = db.query(Vehicle.tariff).filter(Vehicle.id == vehicle_id).scalar()
         
-        db.add(log)
+        logs = []
+        for entry in entries:
+            played_at = AnalyticsService.normalize_played_at(entry.played_at, now)
+            logs.append(PlaybackLog(
+                vehicle_id=vehicle_id,
+                video_id=entry.video_id,
+                session_id=session_id,
+                played_at=played_at,
+                duration_seconds=entry.duration_seconds,
+                is_prime_time=AnalyticsService.is_prime_time(played_at),
+                completed=entry.completed
+            ))
+        if not logs:
+            return logs
+        
+        db.add_all(logs)
+        db.flush()  # нужны log.id для журнала начислений
+        
+        booked = []
+        for log in logs:
+            rate_card_id, rate = AnalyticsService.rate_in_force(db, tariff, log.played_at)
+            amount = log.duration_seconds * rate
+            db.add(EarningsLedger(
+                playback_log_id=log.id,
+                vehicle_id=vehicle_id,
+                video_id=log.video_id,
+                earned_at=log.played_at,
+                duration_seconds=log.duration_seconds,
+                rate_card_id=rate_card_id,
+                rate_per_second=rate,
+                amount=amount
+            ))
+            booked.append((log, amount))
+        
+        AnalyticsService._update_rollups(db, booked, tariff)
+        ReachService.record(db, vehicle_id, ((log.video_id, log.played_at.date()) for log in logs))
+        if session_id is not None:
+            AnalyticsService._update_session_counters(
+                db, session_id, vehicle_id,
+                videos=len(logs),
+                played_seconds=sum(log.duration_seconds for log in logs)
+            )
         db.commit()
-        db.refresh(log)
         
-        return log
+        # Живые счетчики дашборда (память воркера, без БД) - по времени показа, а не приема
+        live_stats.record(
+            ((vehicle_id, log.video_id, log.played_at.replace(tzinfo=timezone.utc).timestamp()) for log in logs),
+            tariff
+        )
+        
+        # Кеш закрытых дней сбрасывает вызывающий (invalidate_closed_days): Redis-клиент
+        # синхронный, а этот код выполняется и внутри AsyncSession.run_sync в цикле событий
+        return logs
+    
+    @staticmethod
+    def invalidate_closed_days(vehicle_id: int, logs: List[PlaybackLog]) -> None:
+        """Поздние логи за уже закрытые дни - сбросить кеш только этих дней (обращение к Redis)"""
+        today = datetime.utcnow().date()
+        closed_days = sorted({log.played_at.date() for log in logs if log.played_at.date() < today})
+        if closed_days:
+            AnalyticsDayCache.invalidate(vehicle_id, closed_days)
+    
+    @staticmethod
+    def normalize_played_at(played_at: Optional[datetime], now: datetime) -> datetime:
+        """
+        Привести время показа с устройства к наивному UTC.
+        
+        Время из будущего (часы устройства спешат) обрезается до now;
+        слишком старые логи отклоняются - их месяц может быть уже отсоединен.
+        """
+        if played_at is None:
+            return now
+        played_at = as_utc_naive(played_at)
+        if played_at > now:
+            return now
+        if now - played_at > timedelta(days=settings.OFFLINE_PLAYBACK_MAX_AGE_DAYS):
+            raise ValueError(
+                f"played_at is older than {settings.OFFLINE_PLAYBACK_MAX_AGE_DAYS} days"
+            )
+        return played_at
+    
+    @staticmethod
+    def _update_rollups(
+        db: Session,
+        booked: List[Tuple[PlaybackLog, float]],
+        tariff: VehicleTariff
+    ) -> None:
+        """
+        Инкрементально обновить дневные и почасовые агрегаты
+        в той же транзакции, что и сами логи.
+        
+        Дельты пачки суммируются по ключу агрегата, поэтому на таблицу
+        выполняется один многострочный UPSERT (ключи сортируются, чтобы
+        параллельные пачки блокировали строки в одном порядке).
+        """
+        vehicle_daily: Dict[tuple, list] = {}
+        video_daily: Dict[tuple, list] = {}
+        vehicle_hourly: Dict[tuple, int] = {}
+        video_hourly: Dict[tuple, int] = {}
+        
+        for log, earnings in booked:
+            day = log.played_at.date()
+            hour = log.played_at.replace(minute=0, second=0, microsecond=0)
+            duration = log.duration_seconds
+            prime_duration = duration if log.is_prime_time else 0.0
+            
+            totals = vehicle_daily.setdefault((log.vehicle_id, day), [0, 0.0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += prime_duration
+            totals[3] += earnings
+            
+            totals = video_daily.setdefault((log.video_id, day), [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += earnings
+            
+            vehicle_hourly[(log.vehicle_id, hour)] = vehicle_hourly.get((log.vehicle_id, hour), 0) + 1
+            video_hourly[(log.video_id, hour)] = video_hourly.get((log.video_id, hour), 0) + 1
+        
+        vehicle_stmt = pg_insert(VehicleDailyStats).values([
+            {
+                "vehicle_id": vehicle_id,
+                "day": day,
+                "tariff": tariff,
+                "videos_played": plays,
+                "total_duration_seconds": duration,
+                "prime_time_duration_seconds": prime_duration,
+                "earnings": earnings,
+            }
+            for (vehicle_id, day), (plays, duration, prime_duration, earnings) in sorted(vehicle_daily.items())
+        ])
+        vehicle_stmt = vehicle_stmt.on_conflict_do_update(
+            index_elements=[VehicleDailyStats.vehicle_id, VehicleDailyStats.day],
+            set_={
+                "videos_played": VehicleDailyStats.videos_played + vehicle_stmt.excluded.videos_played,
+                "total_duration_seconds": VehicleDailyStats.total_duration_seconds
+                + vehicle_stmt.excluded.total_duration_seconds,
+                "prime_time_duration_seconds": VehicleDailyStats.prime_time_duration_seconds
+                + vehicle_stmt.excluded.prime_time_duration_seconds,
+                "earnings": VehicleDailyStats.earnings + vehicle_stmt.excluded.earnings,
+            }
+        )
+        db.execute(vehicle_stmt)
+        
+        video_stmt = pg_insert(VideoDailyStats).values([
+            {
+                "video_id": video_id,
+                "tariff": tariff,
+                "day": day,
+                "play_count": plays,
+                "total_duration": duration,
+                "earnings": earnings,
+            }
+            for (video_id, day), (plays, duration, earnings) in sorted(video_daily.items())
+        ])
+        video_stmt = video_stmt.on_conflict_do_update(
+            index_elements=[VideoDailyStats.video_id, VideoDailyStats.tariff, VideoDailyStats.day],
+            set_={
+                "play_count": VideoDailyStats.play_count + video_stmt.excluded.play_count,
+                "total_duration": VideoDailyStats.total_duration + video_stmt.excluded.total_duration,
+                "earnings": VideoDailyStats.earnings + video_stmt.excluded.earnings,
+            }
+        )
+        db.execute(video_stmt)
+        
+        activity_stmt = pg_insert(VehicleHourlyActivity).values([
+            {"vehicle_id": vehicle_id, "hour": hour, "tariff": tariff, "plays": plays}
+            for (vehicle_id, hour), plays in sorted(vehicle_hourly.items())
+        ])
+        activity_stmt = activity_stmt.on_conflict_do_update(
+            index_elements=[VehicleHourlyActivity.vehicle_id, VehicleHourlyActivity.hour],
+            set_={"plays": VehicleHourlyActivity.plays + activity_stmt.excluded.plays}
+        )
+        db.execute(activity_stmt)
+        
+        video_hourly_stmt = pg_insert(VideoHourlyStats).values([
+            {"video_id": video_id, "tariff": tariff, "hour": hour, "play_count": plays}
+            for (video_id, hour), plays in sorted(video_hourly.items())
+        ])
+        video_hourly_stmt = video_hourly_stmt.on_conflict_do_update(
+            index_elements=[VideoHourlyStats.video_id, VideoHourlyStats.tariff, VideoHourlyStats.hour],
+            set_={"play_count": VideoHourlyStats.play_count + video_hourly_stmt.excluded.play_count}
+        )
+        db.execute(video_hourly_stmt)
+    
+    @staticmethod
+    def _update_session_counters(
+        db: Session,
+        session_id: int,
+        vehicle_id: int,
+        videos: int,
+        played_seconds: float
+    ) -> None:
+        """Прибавить показы пачки к счетчикам сессии (только сессии этого автомобиля)"""
+        db.query(VehicleSession).filter(
+            VehicleSession.id == session_id,
+            VehicleSession.vehicle_id == vehicle_id
+        ).update(
+            {
+                VehicleSession.videos_played: func.coalesce(VehicleSession.videos_played, 0) + videos,
+                VehicleSession.total_played_seconds:
+                    func.coalesce(VehicleSession.total_played_seconds, 0.0) + played_seconds,
+            },
+            synchronize_session=False
+        )
     
     @staticmethod
     def start_session(db: Session, vehicle_id: int) -> VehicleSession:
@@ -156,23 +492,22 @@ class AnalyticsService:
     
     @staticmethod
     def end_session(db: Session, session_id: int) -> VehicleSession:
-        """Завершить сессию работы автомобиля"""
+        """
+        Завершить сессию работы автомобиля.
+        
+        videos_played и total_played_seconds уже накоплены при приеме логов,
+        поэтому закрытие не читает playback_logs.
+        """
         session = db.query(VehicleSession).filter(VehicleSession.id == session_id).first()
         if not session:
             raise ValueError("Session not found")
         
         session.end_time = datetime.utcnow()
         
-        # Рассчитать метрики
-        duration = (session.end_time - session.start_time).total_seconds()
+        # Длительность сессии
+        duration = (session.end_time - as_utc_naive(session.start_time)).total_seconds()
         session.total_duration_seconds = int(duration)
         
-        # Подсчитать видео
-        videos_count = db.query(PlaybackLog).filter(
-            PlaybackLog.session_id == session_id
-        ).count()
-        session.videos_played = videos_count
-        
         db.commit()
         db.refresh(session)
         return session
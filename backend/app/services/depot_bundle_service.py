@@ -0,0 +1,332 @@
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import tarfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.time_utils import as_utc_naive
+from app.models.models import Playlist, VehicleTariff
+from app.schemas.schemas import DepotBundleFile, DepotBundleIndex, DepotBundlePlaylist
+from app.services.media_manifest_service import MediaManifestService
+from app.services.media_storage_service import MediaStorageService
+from app.services.playlist_service import PlaylistService
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.json"
+
+_COPY_CHUNK = 1024 * 1024
+# Защита от бесконечной цепочки, если плейлисты создаются на очень короткий срок
+_MAX_PLAYLISTS = 48
+
+
+class DepotBundleBusy(RuntimeError):
+    """Пакет тарифа уже собирается другим процессом"""
+
+
+@dataclass
+class _Member:
+    name: str
+    path: str
+    size: int
+    sha256: Optional[str]
+    data: Optional[bytes] = None           # содержимое в памяти (JSON плейлиста)
+    source: Optional[str] = None           # локальный файл медиа
+    reuse_offset: Optional[int] = None     # смещение данных в предыдущем архиве
+    video_ids: List[int] = field(default_factory=list)
+    source_mtime_ns: Optional[int] = None
+
+
+def _tar_header(name: str, size: int, mtime: int) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+def _tar_padding(size: int) -> bytes:
+    remainder = size % tarfile.BLOCKSIZE
+    return b"\0" * (tarfile.BLOCKSIZE - remainder) if remainder else b""
+
+
+def _copy(src: BinaryIO, dst: BinaryIO, offset: int, count: int, digest=None) -> None:
+    """
+    Скопировать count байт src с offset в конец dst (оба файла без буферизации).
+
+    Без подсчета хеша копирует ядро (copy_file_range), данные не проходят через процесс.
+    """
+    if digest is None and hasattr(os, "copy_file_range"):
+        try:
+            while count:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), count, offset_src=offset)
+                if not copied:
+                    break
+                offset += copied
+                count -= copied
+        except OSError:
+            # Файловая система не поддерживает - дочитываем обычным способом
+            pass
+
+    src.seek(offset)
+    while count:
+        chunk = src.read(min(_COPY_CHUNK, count))
+        if not chunk:
+            break
+        if digest is not None:
+            digest.update(chunk)
+        dst.write(chunk)
+        count -= len(chunk)
+
+    if count:
+        raise OSError(f"{src.name} changed while packing ({count} bytes short)")
+
+
+class DepotBundleService:
+    """
+    Пакеты синхронизации в депо: плейлисты тарифа на DEPOT_BUNDLE_HOURS вперед и
+    все их медиа одним tar-архивом (без сжатия - видео уже сжато).
+
+    Оглавление (index.json) хранится рядом с архивом и последним файлом в нем:
+    для каждого файла - смещение данных, размер и SHA-256. Архив раздается с
+    Range и ETag = bundle_id, поэтому прерванную загрузку можно продолжить, а
+    устройство, у которого уже есть часть файлов, скачивает по оглавлению только
+    недостающие диапазоны.
+
+    Сборка инкрементальная: неизмененные файлы (тот же путь, для файлов вне
+    хранилища - те же mtime и размер) переносятся из предыдущего архива вместе с
+    контрольными суммами и идут в его порядке, заново читаются и хешируются
+    только новые файлы - они оказываются в конце архива. Если состав не
+    изменился, остается предыдущий пакет.
+    """
+
+    @staticmethod
+    def bundle_dir(tariff: VehicleTariff) -> str:
+        return os.path.join(settings.DEPOT_BUNDLE_DIR, tariff.value)
+
+    @staticmethod
+    def archive_path(tariff: VehicleTariff, bundle_id: str) -> str:
+        return os.path.join(DepotBundleService.bundle_dir(tariff), f"{bundle_id}.tar")
+
+    @staticmethod
+    def load_index(tariff: VehicleTariff) -> Optional[DepotBundleIndex]:
+        """Оглавление последнего собранного пакета тарифа"""
+        index_path = os.path.join(DepotBundleService.bundle_dir(tariff), INDEX_NAME)
+        try:
+            with open(index_path, "rb") as f:
+                return DepotBundleIndex.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning("Broken depot bundle index %s: %s", index_path, e)
+            return None
+
+    @staticmethod
+    def _playlists(db: Session, tariff: VehicleTariff, hours: int) -> List[Playlist]:
+        """Плейлисты тарифа от текущего до now + hours; недостающие следующие создаются"""
+        current = PlaylistService.get_active_playlist(db, tariff)
+        if current is None:
+            current = PlaylistService.create_playlist(db, tariff, vehicle_id=None, hours=24)
+
+        horizon = datetime.utcnow() + timedelta(hours=hours)
+        playlists = [current]
+        while as_utc_naive(playlists[-1].valid_until) < horizon and len(playlists) < _MAX_PLAYLISTS:
+            next_playlist = PlaylistService.get_next_playlist(db, playlists[-1], lead_seconds=hours * 3600)
+            if next_playlist is None:
+                break
+            playlists.append(next_playlist)
+        return playlists
+
+    @staticmethod
+    def _media_members(
+        db: Session,
+        playlists: List[Playlist],
+        max_height: int,
+        previous: Optional[DepotBundleIndex]
+    ) -> List[_Member]:
+        reusable: Dict[str, DepotBundleFile] = {f.path: f for f in previous.files if f.path} if previous else {}
+        files = MediaManifestService.collect_files(db, [(str(p.id), p) for p in playlists], "", max_height)
+
+        reused: List[_Member] = []
+        packed: List[_Member] = []
+        for file in files:
+            source = MediaStorageService.local_path(file.path)
+            try:
+                stat_result = os.stat(source) if source else None
+            except FileNotFoundError:
+                stat_result = None
+            if stat_result is None:
+                logger.warning("Depot bundle: media file %s is missing, skipped", file.path)
+                continue
+
+            # Файлы хранилища неизменяемы (SHA-256 в пути), остальные сверяются по mtime и размеру
+            member = _Member(
+                name=file.path.lstrip("/"),
+                path=file.path,
+                size=stat_result.st_size,
+                sha256=file.sha256,
+                source=source,
+                video_ids=list(file.video_ids),
+                source_mtime_ns=None if file.sha256 else stat_result.st_mtime_ns
+            )
+            old = reusable.get(file.path)
+            if (
+                old is not None
+                and old.size == member.size
+                and old.source_mtime_ns == member.source_mtime_ns
+                and (member.sha256 is None or old.sha256 == member.sha256)
+            ):
+                member.sha256 = old.sha256
+                member.reuse_offset = old.offset
+                reused.append(member)
+            else:
+                packed.append(member)
+
+        reused.sort(key=lambda member: member.reuse_offset)
+        return reused + packed
+
+    @staticmethod
+    def _bundle_id(tariff: VehicleTariff, max_height: int, members: List[_Member]) -> str:
+        digest = hashlib.sha256(f"{tariff.value}:{max_height}".encode())
+        for member in members:
+            digest.update(f"\n{member.name}:{member.size}:{member.sha256}".encode())
+        return digest.hexdigest()[:32]
+
+    @staticmethod
+    def build(db: Session, tariff: VehicleTariff, hours: Optional[int] = None) -> DepotBundleIndex:
+        """
+        Собрать пакет тарифа (блокирующая операция, для CLI и пула потоков).
+
+        Raises:
+            DepotBundleBusy: пакет этого тарифа уже собирается
+        """
+        bundle_dir = DepotBundleService.bundle_dir(tariff)
+        os.makedirs(bundle_dir, exist_ok=True)
+        with open(os.path.join(bundle_dir, ".lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise DepotBundleBusy(tariff.value)
+            return DepotBundleService._build_locked(db, tariff, hours or settings.DEPOT_BUNDLE_HOURS)
+
+    @staticmethod
+    def _build_locked(db: Session, tariff: VehicleTariff, hours: int) -> DepotBundleIndex:
+        started = time.monotonic()
+        max_height = settings.DEPOT_BUNDLE_MAX_HEIGHT
+        bundle_dir = DepotBundleService.bundle_dir(tariff)
+
+        previous = DepotBundleService.load_index(tariff)
+        previous_archive = DepotBundleService.archive_path(tariff, previous.bundle_id) if previous else None
+        if previous_archive is not None and not os.path.exists(previous_archive):
+            previous, previous_archive = None, None
+        if previous is not None and previous.max_height != max_height:
+            previous, previous_archive = None, None
+
+        playlists = DepotBundleService._playlists(db, tariff, hours)
+        members = DepotBundleService._media_members(db, playlists, max_height, previous)
+        playlist_entries = []
+        for playlist in playlists:
+            data = PlaylistService.build_playlist_response(db, playlist, "").model_dump_json().encode()
+            name = f"playlists/{playlist.id}.json"
+            members.append(_Member(name=name, path="", size=len(data), sha256=hashlib.sha256(data).hexdigest(), data=data))
+            playlist_entries.append(DepotBundlePlaylist(
+                id=playlist.id,
+                name=name,
+                valid_from=playlist.valid_from,
+                valid_until=playlist.valid_until
+            ))
+
+        if previous is not None and all(member.sha256 for member in members):
+            if DepotBundleService._bundle_id(tariff, max_height, members) == previous.bundle_id:
+                logger.info("Depot bundle %s is up to date (%s)", tariff.value, previous.bundle_id)
+                return previous
+
+        mtime = int(time.time())
+        files: List[DepotBundleFile] = []
+        reused_bytes = packed_bytes = 0
+        tmp_path = os.path.join(bundle_dir, "building.tar.tmp")
+        try:
+            with open(tmp_path, "wb", buffering=0) as out, \
+                    (open(previous_archive, "rb", buffering=0) if previous_archive else contextlib.nullcontext()) as prev:
+                for member in members:
+                    out.write(_tar_header(member.name, member.size, mtime))
+                    offset = out.tell()
+                    if member.data is not None:
+                        out.write(member.data)
+                    elif member.reuse_offset is not None:
+                        _copy(prev, out, member.reuse_offset, member.size)
+                        reused_bytes += member.size
+                    else:
+                        digest = hashlib.sha256() if member.sha256 is None else None
+                        with open(member.source, "rb", buffering=0) as src:
+                            _copy(src, out, 0, member.size, digest)
+                        if digest is not None:
+                            member.sha256 = digest.hexdigest()
+                        packed_bytes += member.size
+                    out.write(_tar_padding(member.size))
+                    files.append(DepotBundleFile(
+                        name=member.name,
+                        path=member.path,
+                        offset=offset,
+                        size=member.size,
+                        sha256=member.sha256,
+                        video_ids=member.video_ids,
+                        source_mtime_ns=member.source_mtime_ns
+                    ))
+
+                bundle_id = DepotBundleService._bundle_id(tariff, max_height, members)
+                if previous is not None and bundle_id == previous.bundle_id:
+                    # Новые файлы по хешу совпали с прежними - пакет не изменился
+                    return previous
+
+                index = DepotBundleIndex(
+                    bundle_id=bundle_id,
+                    base_bundle_id=previous.bundle_id if previous else None,
+                    tariff=tariff,
+                    generated_at=datetime.utcnow(),
+                    valid_from=playlists[0].valid_from,
+                    valid_until=playlists[-1].valid_until,
+                    max_height=max_height,
+                    playlists=playlist_entries,
+                    files=files,
+                    total_bytes=sum(member.size for member in members),
+                    reused_bytes=reused_bytes,
+                    packed_bytes=packed_bytes
+                )
+                index_data = index.model_dump_json().encode()
+                out.write(_tar_header(INDEX_NAME, len(index_data), mtime))
+                out.write(index_data)
+                out.write(_tar_padding(len(index_data)))
+                out.write(b"\0" * (2 * tarfile.BLOCKSIZE))
+                os.fsync(out.fileno())
+
+            os.replace(tmp_path, DepotBundleService.archive_path(tariff, bundle_id))
+            index_tmp = os.path.join(bundle_dir, f"{INDEX_NAME}.tmp")
+            with open(index_tmp, "wb") as f:
+                f.write(index_data)
+            os.replace(index_tmp, os.path.join(bundle_dir, INDEX_NAME))
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+
+        # Предыдущий архив остается для уже начатых загрузок, более старые удаляются
+        keep = {f"{bundle_id}.tar", f"{previous.bundle_id}.tar" if previous else None}
+        for name in os.listdir(bundle_dir):
+            if name.endswith(".tar") and name not in keep:
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(bundle_dir, name))
+
+        logger.info(
+            "Built depot bundle %s %s: %d files, %.1f MB packed, %.1f MB reused in %.1fs",
+            tariff.value, bundle_id, len(files),
+            packed_bytes / 1024 / 1024, reused_bytes / 1024 / 1024, time.monotonic() - started
+        )
+        return index
@@ -0,0 +1,247 @@
+from sqlalchemy import select
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, List, Optional, Sequence, Tuple
+import csv
+import io
+import zlib
+from app.db.database import SessionLocal
+from app.models.models import PlaybackLog, Vehicle, Video
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Файлоподобный приемник для pyarrow: копит записанные байты,
+    чтобы генератор мог отдавать их клиенту порциями.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportService:
+    """
+    Потоковая выгрузка playback_logs (с данными автомобиля и видео) для биллинга.
+
+    Строки читаются серверным курсором (stream_results + yield_per) пачками по
+    chunk_size и сразу сериализуются, поэтому потребление памяти не зависит от
+    объема месяца - держится только одна пачка.
+    """
+
+    FORMATS = {
+        "csv": ("text/csv", "csv"),
+        "csv.gz": ("application/gzip", "csv.gz"),
+        "parquet": ("application/vnd.apache.parquet", "parquet"),
+        "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    }
+
+    COLUMNS = [
+        "log_id", "played_at", "vehicle_id", "car_number", "tariff",
+        "video_id", "video_title", "video_type", "session_id",
+        "duration_seconds", "is_prime_time", "completed",
+    ]
+
+    DEFAULT_CHUNK_SIZE = 50_000
+
+    @staticmethod
+    def month_range(month: str) -> Tuple[datetime, datetime]:
+        """'2026-09' -> [2026-09-01 00:00, 2026-10-01 00:00)"""
+        try:
+            start = datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            raise ValueError("month must be in YYYY-MM format")
+        next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start, next_month
+
+    @staticmethod
+    def date_range(start_date: date, end_date: date) -> Tuple[datetime, datetime]:
+        """Полуоткрытый интервал по датам включительно"""
+        if end_date < start_date:
+            raise ValueError("end_date must not be before start_date")
+        return (
+            datetime.combine(start_date, time.min),
+            datetime.combine(end_date + timedelta(days=1), time.min)
+        )
+
+    @staticmethod
+    def iter_row_chunks(
+        start: datetime,
+        end: datetime,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[Sequence[tuple]]:
+        """
+        Пачки строк выгрузки за [start, end).
+
+        Генератор открывает собственную сессию: при потоковой отдаче ответа
+        сессия запроса (get_db) к этому моменту уже закрыта.
+        """
+        stmt = (
+            select(
+                PlaybackLog.id,
+                PlaybackLog.played_at,
+                PlaybackLog.vehicle_id,
+                Vehicle.car_number,
+                Vehicle.tariff,
+                PlaybackLog.video_id,
+                Video.title,
+                Video.video_type,
+                PlaybackLog.session_id,
+                PlaybackLog.duration_seconds,
+                PlaybackLog.is_prime_time,
+                PlaybackLog.completed,
+            )
+            .join(Vehicle, Vehicle.id == PlaybackLog.vehicle_id)
+            .join(Video, Video.id == PlaybackLog.video_id)
+            .where(PlaybackLog.played_at >= start, PlaybackLog.played_at < end)
+            .execution_options(stream_results=True, yield_per=chunk_size)
+        )
+
+        db = SessionLocal()
+        try:
+            result = db.execute(stmt)
+            for partition in result.partitions():
+                yield [
+                    (
+                        row[0], row[1], row[2], row[3], row[4].value,
+                        row[5], row[6], row[7].value, row[8],
+                        row[9], row[10], row[11],
+                    )
+                    for row in partition
+                ]
+        finally:
+            db.close()
+
+    @staticmethod
+    def stream_csv(chunks: Iterator[Sequence[tuple]], gzip: bool = False) -> Iterator[bytes]:
+        """CSV с заголовком; при gzip=True - потоковое gzip-сжатие"""
+        compressor = zlib.compressobj(wbits=31) if gzip else None
+
+        def encode(rows: Sequence[tuple], header: bool = False) -> bytes:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if header:
+                writer.writerow(ExportService.COLUMNS)
+            writer.writerows(
+                (row[0], row[1].isoformat(), *row[2:]) for row in rows
+            )
+            data = buffer.getvalue().encode("utf-8")
+            return compressor.compress(data) if compressor else data
+
+        yield encode([], header=True)
+        for rows in chunks:
+            yield encode(rows)
+        if compressor:
+            yield compressor.flush()
+
+    @staticmethod
+    def _arrow_schema():
+        import pyarrow as pa
+
+        return pa.schema([
+            ("log_id", pa.int64()),
+            ("played_at", pa.timestamp("us", tz="UTC")),
+            ("vehicle_id", pa.int32()),
+            ("car_number", pa.string()),
+            ("tariff", pa.string()),
+            ("video_id", pa.int32()),
+            ("video_title", pa.string()),
+            ("video_type", pa.string()),
+            ("session_id", pa.int32()),
+            ("duration_seconds", pa.float64()),
+            ("is_prime_time", pa.bool_()),
+            ("completed", pa.bool_()),
+        ])
+
+    @staticmethod
+    def _to_record_batch(rows: Sequence[tuple], schema):
+        import pyarrow as pa
+
+        columns = list(zip(*rows)) if rows else [[] for _ in schema]
+        return pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+
+    @staticmethod
+    def require_pyarrow() -> None:
+        """Проверить наличие pyarrow до начала потоковой отдачи"""
+        try:
+            import pyarrow  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet/Arrow export requires pyarrow (pip install pyarrow)")
+
+    @staticmethod
+    def stream_parquet(chunks: Iterator[Sequence[tuple]], compression: str = "zstd") -> Iterator[bytes]:
+        """Parquet: одна группа строк на пачку, байты отдаются сразу после записи группы"""
+        import pyarrow.parquet as pq
+
+        schema = ExportService._arrow_schema()
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression=compression)
+        try:
+            for rows in chunks:
+                writer.write_batch(ExportService._to_record_batch(rows, schema))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def stream_arrow(chunks: Iterator[Sequence[tuple]], compression: Optional[str] = "zstd") -> Iterator[bytes]:
+        """Arrow IPC stream с сжатием буферов"""
+        import pyarrow as pa
+
+        schema = ExportService._arrow_schema()
+        sink = _ChunkSink()
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        writer = pa.ipc.new_stream(sink, schema, options=options)
+        try:
+            for rows in chunks:
+                writer.write_batch(ExportService._to_record_batch(rows, schema))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def stream_export(
+        start: datetime,
+        end: datetime,
+        fmt: str = "csv",
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """Выгрузка за [start, end) в указанном формате"""
+        if fmt not in ExportService.FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(ExportService.FORMATS)}")
+        if fmt in ("parquet", "arrow"):
+            ExportService.require_pyarrow()
+
+        chunks = ExportService.iter_row_chunks(start, end, chunk_size)
+        if fmt == "csv":
+            return ExportService.stream_csv(chunks)
+        if fmt == "csv.gz":
+            return ExportService.stream_csv(chunks, gzip=True)
+        if fmt == "parquet":
+            return ExportService.stream_parquet(chunks)
+        return ExportService.stream_arrow(chunks)
@@ -0,0 +1,208 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, tuple_, distinct
+from datetime import date
+from typing import Any, List, Optional, Tuple
+import base64
+import json
+from app.models.models import (
+    Vehicle, Video, VehicleTariff, VehicleDailyStats, VideoDailyStats
+)
+from app.schemas.schemas import (
+    FleetVehicleTotals, FleetVideoTotals, FleetTariffTotals,
+    FleetVehiclePage, FleetVideoPage
+)
+
+
+class FleetAnalyticsService:
+    """
+    Аналитика по всему парку.
+
+    Все отчеты строятся в БД по дневным агрегатам (vehicle_daily_stats,
+    video_daily_stats), а не по сырым playback_logs. Постраничная выдача -
+    keyset-пагинация по паре (значение сортировки, id): страница N стоит
+    столько же, сколько первая, и не "плывет" при вставке новых строк.
+    """
+
+    VEHICLE_SORT_FIELDS = ("earnings", "videos_played", "total_duration_seconds", "vehicle_id")
+    VIDEO_SORT_FIELDS = ("play_count", "total_duration", "earnings", "video_id")
+    TARIFF_SORT_FIELDS = ("earnings", "videos_played", "total_duration_seconds", "active_vehicles", "tariff")
+
+    MAX_PAGE_SIZE = 1000
+
+    @staticmethod
+    def encode_cursor(sort_value: Any, row_id: int) -> str:
+        """Закодировать позицию последней строки страницы в непрозрачный курсор"""
+        raw = json.dumps([sort_value, row_id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, int]:
+        """Раскодировать курсор; ValueError если курсор поврежден"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            return sort_value, int(row_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def _check_params(sort_by: str, allowed: Tuple[str, ...], order: str, limit: Optional[int] = None) -> None:
+        if sort_by not in allowed:
+            raise ValueError(f"sort_by must be one of: {', '.join(allowed)}")
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be 'asc' or 'desc'")
+        if limit is not None and not 1 <= limit <= FleetAnalyticsService.MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {FleetAnalyticsService.MAX_PAGE_SIZE}")
+
+    @staticmethod
+    def _apply_keyset(stmt, sort_col, id_col, order: str, cursor: Optional[str], limit: int):
+        """Добавить к запросу условие keyset-пагинации, сортировку и лимит"""
+        if cursor:
+            sort_value, row_id = FleetAnalyticsService.decode_cursor(cursor)
+            if sort_col is id_col:
+                condition = id_col > row_id if order == "asc" else id_col < row_id
+            else:
+                key = tuple_(sort_col, id_col)
+                condition = key > tuple_(sort_value, row_id) if order == "asc" else key < tuple_(sort_value, row_id)
+            stmt = stmt.where(condition)
+
+        if order == "asc":
+            stmt = stmt.order_by(sort_col.asc(), id_col.asc())
+        else:
+            stmt = stmt.order_by(sort_col.desc(), id_col.desc())
+
+        # +1 строка, чтобы понять, есть ли следующая страница
+        return stmt.limit(limit + 1)
+
+    @staticmethod
+    def get_vehicle_totals(
+        db: Session,
+        start_date: date,
+        end_date: date,
+        sort_by: str = "earnings",
+        order: str = "desc",
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        tariff: Optional[VehicleTariff] = None
+    ) -> FleetVehiclePage:
+        """Итоги по каждому автомобилю парка за период"""
+        FleetAnalyticsService._check_params(sort_by, FleetAnalyticsService.VEHICLE_SORT_FIELDS, order, limit)
+
+        totals = (
+            select(
+                VehicleDailyStats.vehicle_id.label("vehicle_id"),
+                func.sum(VehicleDailyStats.videos_played).label("videos_played"),
+                func.sum(VehicleDailyStats.total_duration_seconds).label("total_duration_seconds"),
+                func.sum(VehicleDailyStats.prime_time_duration_seconds).label("prime_time_duration_seconds"),
+                func.sum(VehicleDailyStats.earnings).label("earnings"),
+            )
+            .where(VehicleDailyStats.day >= start_date, VehicleDailyStats.day <= end_date)
+            .group_by(VehicleDailyStats.vehicle_id)
+            .subquery()
+        )
+
+        stmt = select(totals, Vehicle.car_number, Vehicle.tariff).join(
+            Vehicle, Vehicle.id == totals.c.vehicle_id
+        )
+        if tariff:
+            stmt = stmt.where(Vehicle.tariff == tariff)
+
+        stmt = FleetAnalyticsService._apply_keyset(
+            stmt, totals.c[sort_by], totals.c.vehicle_id, order, cursor, limit
+        )
+        rows = db.execute(stmt).mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = FleetAnalyticsService.encode_cursor(last[sort_by], last["vehicle_id"])
+
+        return FleetVehiclePage(
+            items=[FleetVehicleTotals(**row) for row in rows],
+            next_cursor=next_cursor
+        )
+
+    @staticmethod
+    def get_video_totals(
+        db: Session,
+        start_date: date,
+        end_date: date,
+        sort_by: str = "play_count",
+        order: str = "desc",
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        tariff: Optional[VehicleTariff] = None
+    ) -> FleetVideoPage:
+        """Итоги по каждому видео по всему парку за период"""
+        FleetAnalyticsService._check_params(sort_by, FleetAnalyticsService.VIDEO_SORT_FIELDS, order, limit)
+
+        totals = (
+            select(
+                VideoDailyStats.video_id.label("video_id"),
+                func.sum(VideoDailyStats.play_count).label("play_count"),
+                func.sum(VideoDailyStats.total_duration).label("total_duration"),
+                func.sum(VideoDailyStats.earnings).label("earnings"),
+            )
+            .where(VideoDailyStats.day >= start_date, VideoDailyStats.day <= end_date)
+        )
+        if tariff:
+            totals = totals.where(VideoDailyStats.tariff == tariff)
+        totals = totals.group_by(VideoDailyStats.video_id).subquery()
+
+        stmt = select(
+            totals,
+            Video.title.label("video_title"),
+            Video.video_type
+        ).join(Video, Video.id == totals.c.video_id)
+
+        stmt = FleetAnalyticsService._apply_keyset(
+            stmt, totals.c[sort_by], totals.c.video_id, order, cursor, limit
+        )
+        rows = db.execute(stmt).mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = FleetAnalyticsService.encode_cursor(last[sort_by], last["video_id"])
+
+        return FleetVideoPage(
+            items=[FleetVideoTotals(**row) for row in rows],
+            next_cursor=next_cursor
+        )
+
+    @staticmethod
+    def get_tariff_totals(
+        db: Session,
+        start_date: date,
+        end_date: date,
+        sort_by: str = "earnings",
+        order: str = "desc"
+    ) -> List[FleetTariffTotals]:
+        """
+        Итоги по тарифам за период.
+
+        Тарифов всего несколько, поэтому пагинация не нужна - только сортировка.
+        """
+        FleetAnalyticsService._check_params(sort_by, FleetAnalyticsService.TARIFF_SORT_FIELDS, order)
+
+        totals = (
+            select(
+                VehicleDailyStats.tariff.label("tariff"),
+                func.count(distinct(VehicleDailyStats.vehicle_id)).label("active_vehicles"),
+                func.sum(VehicleDailyStats.videos_played).label("videos_played"),
+                func.sum(VehicleDailyStats.total_duration_seconds).label("total_duration_seconds"),
+                func.sum(VehicleDailyStats.prime_time_duration_seconds).label("prime_time_duration_seconds"),
+                func.sum(VehicleDailyStats.earnings).label("earnings"),
+            )
+            .where(VehicleDailyStats.day >= start_date, VehicleDailyStats.day <= end_date)
+            .group_by(VehicleDailyStats.tariff)
+            .subquery()
+        )
+
+        sort_col = totals.c[sort_by]
+        stmt = select(totals).order_by(sort_col.asc() if order == "asc" else sort_col.desc())
+        rows = db.execute(stmt).mappings().all()
+
+        return [FleetTariffTotals(**row) for row in rows]
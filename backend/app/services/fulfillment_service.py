@@ -0,0 +1,189 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from app.core.time_utils import as_utc_naive
+from app.models.models import (
+    Video, VideoType, VehicleTariff, VehicleHourlyActivity, VideoHourlyStats
+)
+from app.schemas.schemas import (
+    ContractHourFulfillment, ContractTariffFulfillment, ContractFulfillment, FulfillmentReport
+)
+
+
+class FulfillmentService:
+    """
+    Отчет о выполнении контрактов: фактические показы против обещанных.
+
+    Обещание контракта на час = plays_per_hour * число активных автомобилей
+    тарифа в этом часе (автомобиль активен, если за час у него было хотя бы одно
+    воспроизведение). Оба значения берутся из почасовых агрегатов
+    (vehicle_hourly_activity, video_hourly_stats), которые группирует БД, -
+    месяц по всему парку - это тысячи строк, а не сотни миллионов логов.
+    """
+
+    @staticmethod
+    def _active_vehicles(
+        db: Session,
+        start: datetime,
+        end: datetime,
+        tariff: Optional[VehicleTariff]
+    ) -> Dict[Tuple[VehicleTariff, datetime], int]:
+        """Число активных автомобилей по (тариф, час)"""
+        stmt = (
+            select(
+                VehicleHourlyActivity.tariff,
+                VehicleHourlyActivity.hour,
+                func.count().label("active_vehicles")
+            )
+            .where(VehicleHourlyActivity.hour >= start, VehicleHourlyActivity.hour < end)
+            .group_by(VehicleHourlyActivity.tariff, VehicleHourlyActivity.hour)
+        )
+        if tariff:
+            stmt = stmt.where(VehicleHourlyActivity.tariff == tariff)
+
+        return {
+            (row.tariff, as_utc_naive(row.hour)): row.active_vehicles
+            for row in db.execute(stmt)
+        }
+
+    @staticmethod
+    def _delivered(
+        db: Session,
+        video_ids: List[int],
+        start: datetime,
+        end: datetime,
+        tariff: Optional[VehicleTariff]
+    ) -> Dict[Tuple[int, VehicleTariff, datetime], int]:
+        """Фактические показы по (видео, тариф, час)"""
+        stmt = select(
+            VideoHourlyStats.video_id,
+            VideoHourlyStats.tariff,
+            VideoHourlyStats.hour,
+            VideoHourlyStats.play_count
+        ).where(
+            VideoHourlyStats.video_id.in_(video_ids),
+            VideoHourlyStats.hour >= start,
+            VideoHourlyStats.hour < end
+        )
+        if tariff:
+            stmt = stmt.where(VideoHourlyStats.tariff == tariff)
+
+        return {
+            (row.video_id, row.tariff, as_utc_naive(row.hour)): row.play_count
+            for row in db.execute(stmt)
+        }
+
+    @staticmethod
+    def get_contract_fulfillment(
+        db: Session,
+        start_date: date,
+        end_date: date,
+        video_id: Optional[int] = None,
+        tariff: Optional[VehicleTariff] = None,
+        tolerance: float = 0.0,
+        include_hours: bool = False
+    ) -> FulfillmentReport:
+        """
+        Выполнение контрактов за период.
+
+        Args:
+            tolerance: допустимая доля недопоказа; час считается недовыполненным,
+                если delivered < promised * (1 - tolerance)
+            include_hours: вернуть все часы, а не только недовыполненные
+        """
+        if end_date < start_date:
+            raise ValueError("end_date must not be before start_date")
+        if not 0.0 <= tolerance < 1.0:
+            raise ValueError("tolerance must be in [0, 1)")
+
+        start = datetime.combine(start_date, time.min)
+        end = datetime.combine(end_date + timedelta(days=1), time.min)
+
+        query = db.query(Video).filter(
+            Video.video_type == VideoType.CONTRACT,
+            Video.plays_per_hour.isnot(None),
+            Video.plays_per_hour > 0
+        )
+        if video_id is not None:
+            query = query.filter(Video.id == video_id)
+        else:
+            query = query.filter(Video.is_active == True)
+        contracts = query.order_by(Video.id).all()
+
+        if not contracts:
+            return FulfillmentReport(start_date=start_date, end_date=end_date, tolerance=tolerance, contracts=[])
+
+        active = FulfillmentService._active_vehicles(db, start, end, tariff)
+        delivered = FulfillmentService._delivered(db, [v.id for v in contracts], start, end, tariff)
+
+        # Часы, отсортированные один раз для всех контрактов
+        active_hours = sorted(active.items(), key=lambda item: (item[0][1], item[0][0].value))
+
+        results = []
+        for video in contracts:
+            eligible = {t.strip() for t in (video.tariffs or "").split(",") if t.strip()}
+            contract_start = as_utc_naive(video.created_at).replace(minute=0, second=0, microsecond=0) \
+                if video.created_at else start
+
+            by_tariff: Dict[VehicleTariff, Dict[str, int]] = {}
+            hours: List[ContractHourFulfillment] = []
+            shortfall_hours: List[ContractHourFulfillment] = []
+
+            for (hour_tariff, hour), active_vehicles in active_hours:
+                if hour_tariff.value not in eligible or hour < contract_start:
+                    continue
+
+                promised = video.plays_per_hour * active_vehicles
+                actual = delivered.get((video.id, hour_tariff, hour), 0)
+                item = ContractHourFulfillment(
+                    hour=hour.replace(tzinfo=timezone.utc),
+                    tariff=hour_tariff,
+                    active_vehicles=active_vehicles,
+                    promised=promised,
+                    delivered=actual,
+                    shortfall=max(promised - actual, 0)
+                )
+
+                totals = by_tariff.setdefault(
+                    hour_tariff,
+                    {"active_vehicle_hours": 0, "promised": 0, "delivered": 0, "shortfall_hours": 0}
+                )
+                totals["active_vehicle_hours"] += active_vehicles
+                totals["promised"] += promised
+                totals["delivered"] += actual
+
+                if actual < promised * (1.0 - tolerance):
+                    totals["shortfall_hours"] += 1
+                    shortfall_hours.append(item)
+                if include_hours:
+                    hours.append(item)
+
+            promised_total = sum(t["promised"] for t in by_tariff.values())
+            delivered_total = sum(t["delivered"] for t in by_tariff.values())
+
+            results.append(ContractFulfillment(
+                video_id=video.id,
+                video_title=video.title,
+                plays_per_hour=video.plays_per_hour,
+                promised=promised_total,
+                delivered=delivered_total,
+                fulfillment_rate=(delivered_total / promised_total) if promised_total else 1.0,
+                by_tariff=[
+                    ContractTariffFulfillment(
+                        tariff=t,
+                        fulfillment_rate=(v["delivered"] / v["promised"]) if v["promised"] else 1.0,
+                        **v
+                    )
+                    for t, v in sorted(by_tariff.items(), key=lambda item: item[0].value)
+                ],
+                shortfall_hours=shortfall_hours,
+                hours=hours if include_hours else None
+            ))
+
+        return FulfillmentReport(
+            start_date=start_date,
+            end_date=end_date,
+            tolerance=tolerance,
+            contracts=results
+        )
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.cache import get_redis, mark_redis_failed
+from app.core.config import settings
+from app.models.models import VehicleTariff
+from app.schemas.schemas import LiveStatsSnapshot, LiveVideoPlays
+
+logger = logging.getLogger(__name__)
+
+
+class _Slot:
+    """Счетчики одной секунды"""
+
+    __slots__ = ("second", "tariffs", "videos", "vehicles")
+
+    def __init__(self) -> None:
+        self.second = -1
+        self.tariffs: Counter = Counter()
+        self.videos: Counter = Counter()
+        self.vehicles: Dict[int, str] = {}
+
+    def reset(self, second: int) -> None:
+        self.second = second
+        self.tariffs.clear()
+        self.videos.clear()
+        self.vehicles.clear()
+
+
+class LiveStats:
+    """
+    Скользящие счетчики воспроизведений за последние LIVE_STATS_WINDOW_SECONDS.
+
+    Кольцевой буфер по секундам в памяти воркера: запись из пути приема логов -
+    O(1) под блокировкой, без БД. Снимок окна суммирует не больше window слотов.
+    """
+
+    def __init__(self, window_seconds: int) -> None:
+        self.window_seconds = window_seconds
+        self._slots = [_Slot() for _ in range(window_seconds)]
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        plays: Iterable[Tuple[int, int, float]],
+        tariff: VehicleTariff,
+        now: Optional[float] = None
+    ) -> None:
+        """
+        Учесть воспроизведения: plays - (vehicle_id, video_id, played_at в секундах epoch).
+
+        Показ попадает в слот своей секунды played_at; показы старше окна (логи,
+        накопленные офлайн и присланные пачкой) в живые счетчики не попадают.
+        """
+        current = int(time.time() if now is None else now)
+        oldest = current - self.window_seconds
+        tariff_key = tariff.value if isinstance(tariff, VehicleTariff) else str(tariff)
+        with self._lock:
+            for vehicle_id, video_id, played_at in plays:
+                second = min(int(played_at), current)
+                if second <= oldest:
+                    continue
+                slot = self._slots[second % self.window_seconds]
+                if slot.second != second:
+                    slot.reset(second)
+                slot.tariffs[tariff_key] += 1
+                slot.videos[video_id] += 1
+                slot.vehicles[vehicle_id] = tariff_key
+
+    def window(self, now: Optional[float] = None) -> Tuple[Counter, Counter, Dict[int, str]]:
+        """Суммы по окну: (показы по тарифам, показы по видео, vehicle_id -> тариф)"""
+        oldest = int(time.time() if now is None else now) - self.window_seconds
+        tariffs: Counter = Counter()
+        videos: Counter = Counter()
+        vehicles: Dict[int, str] = {}
+        with self._lock:
+            for slot in self._slots:
+                if slot.second > oldest:
+                    tariffs.update(slot.tariffs)
+                    videos.update(slot.videos)
+                    vehicles.update(slot.vehicles)
+        return tariffs, videos, vehicles
+
+
+class LiveStatsHub:
+    """
+    Раздача снимков LiveStats подписчикам SSE.
+
+    Снимок строится один раз за тик (LIVE_STATS_PUSH_INTERVAL_SECONDS) независимо от
+    числа подписчиков - каждая вкладка только ждет следующей версии. В БД хаб не
+    ходит. При нескольких воркерах каждый раз в тик публикует свое окно в Redis,
+    а снимок складывает окна всех живых воркеров.
+    """
+
+    REDIS_PREFIX = "live:stats:v1"
+
+    def __init__(self, stats: LiveStats) -> None:
+        self.stats = stats
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._snapshot: Optional[LiveStatsSnapshot] = None
+        self._version = 0
+        self._subscribers = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запустить тики (вызывать из lifespan при старте)"""
+        self._condition = asyncio.Condition()
+        self._task = asyncio.create_task(self._run(), name="live_stats_hub")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                snapshot = await run_in_threadpool(self._tick, self._subscribers > 0)
+                if snapshot is not None:
+                    async with self._condition:
+                        self._snapshot = snapshot
+                        self._version += 1
+                        self._condition.notify_all()
+            except Exception:
+                logger.exception("Live stats tick failed")
+            await asyncio.sleep(settings.LIVE_STATS_PUSH_INTERVAL_SECONDS)
+
+    def _tick(self, build_snapshot: bool) -> Optional[LiveStatsSnapshot]:
+        """Опубликовать свое окно в Redis и (если есть подписчики) собрать общий снимок"""
+        tariffs, videos, vehicles = self.stats.window()
+        windows = [(tariffs, videos, vehicles)]
+
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                windows = self._exchange(redis_client, tariffs, videos, vehicles, build_snapshot)
+            except Exception as e:
+                mark_redis_failed(e)
+
+        if not build_snapshot:
+            return None
+        return self._build_snapshot(windows)
+
+    def _exchange(self, redis_client, tariffs, videos, vehicles, read_all: bool) -> list:
+        now = time.time()
+        ttl = max(3 * settings.LIVE_STATS_PUSH_INTERVAL_SECONDS, 5)
+        registry = f"{self.REDIS_PREFIX}:workers"
+        payload = json.dumps(
+            {"t": tariffs, "v": {str(k): n for k, n in videos.items()}, "c": {str(k): t for k, t in vehicles.items()}},
+            separators=(",", ":")
+        )
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.setex(f"{self.REDIS_PREFIX}:worker:{self.worker_id}", ttl, payload)
+        pipe.zadd(registry, {self.worker_id: now})
+        pipe.zremrangebyscore(registry, "-inf", now - ttl)
+        if read_all:
+            pipe.zrangebyscore(registry, now - ttl, "+inf")
+        results = pipe.execute()
+        if not read_all:
+            return [(tariffs, videos, vehicles)]
+
+        workers = [w.decode() if isinstance(w, bytes) else w for w in results[-1]]
+        raws = redis_client.mget([f"{self.REDIS_PREFIX}:worker:{w}" for w in workers]) if workers else []
+        windows = [(tariffs, videos, vehicles)]
+        for worker, raw in zip(workers, raws):
+            if worker == self.worker_id or raw is None:
+                continue
+            data = json.loads(raw)
+            windows.append((
+                Counter(data["t"]),
+                Counter({int(k): n for k, n in data["v"].items()}),
+                {int(k): t for k, t in data["c"].items()},
+            ))
+        return windows
+
+    @staticmethod
+    def _build_snapshot(windows: list) -> LiveStatsSnapshot:
+        tariffs: Counter = Counter()
+        videos: Counter = Counter()
+        vehicles: Dict[int, str] = {}
+        for window_tariffs, window_videos, window_vehicles in windows:
+            tariffs.update(window_tariffs)
+            videos.update(window_videos)
+            vehicles.update(window_vehicles)
+
+        # Сумма за окно приводится к показам в минуту
+        per_minute = 60.0 / settings.LIVE_STATS_WINDOW_SECONDS
+        active_by_tariff = Counter(vehicles.values())
+
+        return LiveStatsSnapshot(
+            generated_at=datetime.utcnow(),
+            window_seconds=settings.LIVE_STATS_WINDOW_SECONDS,
+            plays_per_minute={t.value: tariffs.get(t.value, 0) * per_minute for t in VehicleTariff},
+            total_plays_per_minute=sum(tariffs.values()) * per_minute,
+            active_vehicles=len(vehicles),
+            active_vehicles_by_tariff={t.value: active_by_tariff.get(t.value, 0) for t in VehicleTariff},
+            top_videos=[
+                LiveVideoPlays(video_id=video_id, plays=plays)
+                for video_id, plays in videos.most_common(settings.LIVE_STATS_TOP_VIDEOS)
+            ],
+        )
+
+    async def subscribe(self) -> AsyncIterator[LiveStatsSnapshot]:
+        """Снимки по мере появления (первый - сразу, если уже есть)"""
+        if self._condition is None:
+            raise RuntimeError("LiveStatsHub is not started")
+
+        self._subscribers += 1
+        try:
+            # Снимок, собранный до появления подписчиков, устарел - ждать следующий тик
+            fresh_after = datetime.utcnow() - timedelta(seconds=2 * settings.LIVE_STATS_PUSH_INTERVAL_SECONDS)
+            stale = self._snapshot is None or self._snapshot.generated_at < fresh_after
+            seen = self._version if stale else 0
+            while True:
+                async with self._condition:
+                    await self._condition.wait_for(lambda: self._version != seen)
+                    seen = self._version
+                    snapshot = self._snapshot
+                yield snapshot
+        finally:
+            self._subscribers -= 1
+
+
+live_stats = LiveStats(settings.LIVE_STATS_WINDOW_SECONDS)
+live_stats_hub = LiveStatsHub(live_stats)
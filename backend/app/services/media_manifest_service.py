@@ -0,0 +1,120 @@
+import json
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, selectinload
+
+from app.models.models import Playlist, TranscodeStatus, Video
+from app.schemas.schemas import MediaManifestFile, MediaManifestResponse
+from app.services.media_storage_service import MediaStorageService
+
+# Длина часового цикла плейлиста (как в build_playlist_timeline)
+_LOOP_SECONDS = 3600.0
+
+SOURCE_VARIANT = "source"
+
+
+class MediaManifestService:
+    """
+    Манифест синхронизации медиа устройства: какие файлы нужны текущему и
+    следующему плейлисту, в порядке первого воспроизведения.
+
+    Для каждого видео выбирается тот же файл, что скачивает устройство: лучшее
+    качество HLS не выше max_height, иначе исходник. URL содержат SHA-256
+    содержимого, поэтому устройство сравнивает манифест с локальным кешем и
+    докачивает только недостающее - сначала то, что понадобится раньше.
+    """
+
+    @staticmethod
+    def pick_file(video: Video, max_height: int) -> Tuple[str, str, Optional[str], Optional[int]]:
+        """(качество, путь, sha256, размер) файла, который устройство воспроизводит"""
+        if video.transcode_status == TranscodeStatus.DONE:
+            best = None
+            for rendition in video.renditions:
+                if rendition.height <= max_height and (best is None or rendition.height > best.height):
+                    best = rendition
+            if best is not None:
+                return best.name, best.file_path, best.content_sha256, best.file_size
+        # Файл вне хранилища (/uploads/videos) может быть перезаписан - сверяется по ETag, а не по хешу
+        return SOURCE_VARIANT, video.file_path, MediaStorageService.video_sha256(video), video.file_size
+
+    @staticmethod
+    def _sequence(playlist: Playlist) -> List[int]:
+        try:
+            return json.loads(playlist.video_sequence) or []
+        except (json.JSONDecodeError, TypeError):
+            return []
+
+    @staticmethod
+    def _walk(sequence: List[int], video_map: Dict[int, Video]) -> Iterator[Tuple[Video, float]]:
+        """(видео, секунда начала в часовом цикле) - те же правила пропуска, что и у временной шкалы"""
+        position = 0.0
+        for video_id in sequence:
+            video = video_map.get(video_id)
+            if video is None or not video.is_active or not video.duration or video.duration <= 0:
+                continue
+            yield video, position
+            position += video.duration
+            if position >= _LOOP_SECONDS:
+                break
+
+    @staticmethod
+    def collect_files(
+        db: Session,
+        playlists: List[Tuple[str, Playlist]],
+        base_url: str,
+        max_height: int
+    ) -> List[MediaManifestFile]:
+        """Файлы плейлистов [(метка, плейлист)] - каждый один раз, в порядке первого воспроизведения"""
+        sequences = {label: MediaManifestService._sequence(playlist) for label, playlist in playlists}
+        video_ids = {video_id for sequence in sequences.values() for video_id in sequence}
+        videos = db.query(Video).options(selectinload(Video.renditions)).filter(Video.id.in_(video_ids)).all() \
+            if video_ids else []
+        video_map = {video.id: video for video in videos}
+
+        files: Dict[str, MediaManifestFile] = {}
+        for label, _ in playlists:
+            for video, position in MediaManifestService._walk(sequences[label], video_map):
+                variant, path, content_sha256, size = MediaManifestService.pick_file(video, max_height)
+                entry = files.get(path)
+                if entry is None:
+                    files[path] = MediaManifestFile(
+                        url=f"{base_url}{path}" if base_url else path,
+                        path=path,
+                        sha256=content_sha256,
+                        size=size,
+                        variant=variant,
+                        video_ids=[video.id],
+                        playlist=label,
+                        first_needed_offset=position
+                    )
+                elif video.id not in entry.video_ids:
+                    # Одинаковое содержимое у разных видео - один файл
+                    entry.video_ids.append(video.id)
+        return list(files.values())
+
+    @staticmethod
+    def build(
+        db: Session,
+        vehicle_id: int,
+        current: Playlist,
+        next_playlist: Optional[Playlist],
+        base_url: str,
+        max_height: int
+    ) -> MediaManifestResponse:
+        playlists = [("current", current)]
+        if next_playlist is not None:
+            playlists.append(("next", next_playlist))
+        files = MediaManifestService.collect_files(db, playlists, base_url, max_height)
+
+        return MediaManifestResponse(
+            vehicle_id=vehicle_id,
+            tariff=current.tariff,
+            generated_at=datetime.utcnow(),
+            current_playlist_id=current.id,
+            current_valid_until=current.valid_until,
+            next_playlist_id=next_playlist.id if next_playlist is not None else None,
+            next_valid_from=next_playlist.valid_from if next_playlist is not None else None,
+            total_bytes=sum(entry.size or 0 for entry in files),
+            files=files
+        )
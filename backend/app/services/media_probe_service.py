@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+
+from app.core.config import settings
+from app.core.mp4 import parse_mp4
+from app.db.database import SessionLocal
+from app.models.models import MediaProbeStatus, Video
+from app.services.media_storage_service import MediaStorageService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MediaInfo:
+    """Метаданные медиафайла"""
+    duration: Optional[float]
+    video_codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    bit_rate: Optional[int] = None
+
+
+_resolved_binaries: Dict[str, Optional[str]] = {}
+_resolve_lock = threading.Lock()
+
+
+def _resolve_binary(name: str, configured: Optional[str]) -> Optional[str]:
+    """
+    Путь к утилите ffmpeg-семейства, определяется один раз на процесс.
+
+    Путь из настроек, иначе поиск в PATH и стандартных каталогах.
+    """
+    if name in _resolved_binaries:
+        return _resolved_binaries[name]
+
+    with _resolve_lock:
+        if name not in _resolved_binaries:
+            candidates = [configured] if configured else [
+                shutil.which(name), f"/usr/bin/{name}", f"/usr/local/bin/{name}"
+            ]
+            found = None
+            for path in candidates:
+                if not path or not os.access(path, os.X_OK):
+                    continue
+                try:
+                    result = subprocess.run([path, "-version"], capture_output=True, timeout=5)
+                except (OSError, subprocess.TimeoutExpired):
+                    continue
+                if result.returncode == 0:
+                    found = path
+                    break
+            _resolved_binaries[name] = found
+    return _resolved_binaries[name]
+
+
+def resolve_ffprobe() -> Optional[str]:
+    """Путь к ffprobe (FFPROBE_PATH или PATH), None - не установлен"""
+    if "ffprobe" in _resolved_binaries:
+        return _resolved_binaries["ffprobe"]
+    path = _resolve_binary("ffprobe", settings.FFPROBE_PATH)
+    if path is None:
+        logger.warning("ffprobe не найден. Установите ffmpeg для автоматического извлечения длительности видео.")
+    return path
+
+
+def resolve_ffmpeg() -> Optional[str]:
+    """Путь к ffmpeg (FFMPEG_PATH или PATH), None - не установлен"""
+    if "ffmpeg" in _resolved_binaries:
+        return _resolved_binaries["ffmpeg"]
+    path = _resolve_binary("ffmpeg", settings.FFMPEG_PATH)
+    if path is None:
+        logger.warning("ffmpeg не найден. Видео будут раздаваться только в исходном качестве.")
+    return path
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def quick_probe(file_path: str) -> Optional[MediaInfo]:
+    """
+    Метаданные MP4/MOV встроенным парсером (доли миллисекунды, без ffprobe).
+
+    None - другой контейнер или длительность в moov не найдена.
+    """
+    info = parse_mp4(file_path)
+    if info is None or info.duration is None:
+        return None
+    return MediaInfo(
+        duration=info.duration,
+        video_codec=info.video_codec,
+        width=info.width,
+        height=info.height,
+        bit_rate=info.bit_rate
+    )
+
+
+def probe_file(file_path: str) -> Optional[MediaInfo]:
+    """
+    Метаданные видео: встроенный парсер MP4/MOV, для остальных контейнеров - ffprobe
+    (блокирующий вызов - только из пула потоков).
+
+    Returns:
+        MediaInfo или None, если файл не разобран
+    """
+    info = quick_probe(file_path)
+    if info is not None:
+        return info
+    return _ffprobe_file(file_path)
+
+
+def _ffprobe_file(file_path: str) -> Optional[MediaInfo]:
+    ffprobe = resolve_ffprobe()
+    if ffprobe is None:
+        return None
+
+    try:
+        result = subprocess.run(
+            [
+                ffprobe,
+                "-v", "error",
+                "-print_format", "json",
+                "-show_format",
+                "-show_streams",
+                "-select_streams", "v:0",
+                file_path
+            ],
+            capture_output=True,
+            text=True,
+            timeout=settings.MEDIA_PROBE_TIMEOUT_SECONDS
+        )
+    except subprocess.TimeoutExpired:
+        logger.error(f"Таймаут при извлечении метаданных для {file_path}")
+        return None
+    except OSError as e:
+        logger.error(f"Ошибка при извлечении метаданных для {file_path}: {e}")
+        return None
+
+    if result.returncode != 0:
+        logger.warning(f"Не удалось извлечь метаданные для {file_path}: {result.stderr}")
+        return None
+
+    try:
+        data = json.loads(result.stdout or "{}")
+    except ValueError:
+        logger.warning(f"Не удалось распарсить вывод ffprobe для {file_path}")
+        return None
+
+    fmt = data.get("format", {})
+    stream = (data.get("streams") or [{}])[0]
+    try:
+        duration = float(fmt.get("duration") or stream.get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+
+    return MediaInfo(
+        duration=duration if duration and duration > 0 else None,
+        video_codec=stream.get("codec_name"),
+        width=_to_int(stream.get("width")),
+        height=_to_int(stream.get("height")),
+        bit_rate=_to_int(fmt.get("bit_rate")) or _to_int(stream.get("bit_rate"))
+    )
+
+
+def local_video_path(video: Video) -> str:
+    content_sha256 = MediaStorageService.video_sha256(video)
+    if content_sha256:
+        return MediaStorageService.blob_path(content_sha256)
+    return os.path.join(settings.UPLOAD_DIR, video.filename)
+
+
+class MediaJobQueue(ABC):
+    """
+    Фоновая обработка загруженных видео: очередь video_id в памяти и свой пул потоков.
+
+    Запрос только ставит video_id в очередь и сразу отвечает; worker_count() задач
+    разбирают очередь, блокирующая работа (process) выполняется в собственном пуле
+    потоков очереди, а не в общем пуле запросов. Очередь живет в памяти воркера;
+    после перезапуска (или при переполнении) необработанные видео подбирает
+    периодический requeue_pending. Успешно обработанное видео передается в
+    next_stage, если он задан.
+    """
+
+    name = "media_job"
+
+    def __init__(self) -> None:
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queued: set = set()
+        self.next_stage: Optional["MediaJobQueue"] = None
+
+    @abstractmethod
+    def worker_count(self) -> int:
+        ...
+
+    @abstractmethod
+    def queue_size(self) -> int:
+        ...
+
+    @abstractmethod
+    def requeue_interval(self) -> int:
+        ...
+
+    @abstractmethod
+    def pending_video_ids(self) -> List[int]:
+        """Видео, ожидающие обработки (блокирующий вызов)"""
+
+    @abstractmethod
+    def process(self, video_id: int) -> bool:
+        """Обработать видео (блокирующий вызов); True - передать в next_stage"""
+
+    def on_start(self) -> None:
+        """Подготовка в пуле потоков очереди сразу после старта"""
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size())
+        self._executor = ThreadPoolExecutor(max_workers=self.worker_count(), thread_name_prefix=self.name)
+        self._executor.submit(self.on_start)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"{self.name}_{i}")
+            for i in range(self.worker_count())
+        ]
+        self._workers.append(asyncio.create_task(self._requeue_loop(), name=f"{self.name}_requeue"))
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def enqueue(self, video_id: int) -> bool:
+        """Поставить видео в очередь (из цикла событий); False - очередь полна или не запущена"""
+        if self._queue is None or video_id in self._queued:
+            return False
+        try:
+            self._queue.put_nowait(video_id)
+        except asyncio.QueueFull:
+            logger.warning("%s queue is full, video %s will be picked up later", self.name, video_id)
+            return False
+        self._queued.add(video_id)
+        return True
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def requeue_pending(self) -> int:
+        """Поставить в очередь все видео, ожидающие обработки (старт и периодически)"""
+        loop = asyncio.get_running_loop()
+        video_ids = await loop.run_in_executor(self._executor, self.pending_video_ids)
+        return sum(self.enqueue(video_id) for video_id in video_ids)
+
+    async def _requeue_loop(self) -> None:
+        while True:
+            try:
+                await self.requeue_pending()
+            except Exception:
+                logger.exception("Failed to requeue pending videos for %s", self.name)
+            await asyncio.sleep(self.requeue_interval())
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            video_id = await self._queue.get()
+            try:
+                done = await loop.run_in_executor(self._executor, self.process, video_id)
+                if done and self.next_stage is not None:
+                    self.next_stage.enqueue(video_id)
+            except Exception:
+                logger.exception("%s failed for video %s", self.name, video_id)
+            finally:
+                self._queued.discard(video_id)
+                self._queue.task_done()
+
+
+class MediaProbeQueue(MediaJobQueue):
+    """
+    Фоновое извлечение метаданных загруженных видео.
+
+    MEDIA_PROBE_WORKERS задач, очередь на MEDIA_PROBE_QUEUE_SIZE видео. Пока видео
+    не разобрано, duration пустая, и генератор плейлистов его пропускает.
+    """
+
+    name = "media_probe"
+
+    def worker_count(self) -> int:
+        return settings.MEDIA_PROBE_WORKERS
+
+    def queue_size(self) -> int:
+        return settings.MEDIA_PROBE_QUEUE_SIZE
+
+    def requeue_interval(self) -> int:
+        return settings.MEDIA_PROBE_REQUEUE_INTERVAL_SECONDS
+
+    def on_start(self) -> None:
+        # Найти ffprobe сразу при старте, а не при первой загрузке
+        resolve_ffprobe()
+
+    @staticmethod
+    def _unclaimed():
+        """Разбор не захвачен другим воркером (или захват брошен: воркер упал посреди ffprobe)"""
+        stale_before = datetime.utcnow() - timedelta(seconds=2 * settings.MEDIA_PROBE_TIMEOUT_SECONDS)
+        return or_(Video.probe_claimed_at.is_(None), Video.probe_claimed_at < stale_before)
+
+    def pending_video_ids(self) -> List[int]:
+        db = SessionLocal()
+        try:
+            return [row[0] for row in db.query(Video.id).filter(
+                Video.probe_status == MediaProbeStatus.PENDING,
+                MediaProbeQueue._unclaimed()
+            ).order_by(Video.id).limit(settings.MEDIA_PROBE_QUEUE_SIZE)]
+        finally:
+            db.close()
+
+    def process(self, video_id: int) -> bool:
+        info = self.probe_video(video_id)
+        return info is not None and info.duration is not None
+
+    @staticmethod
+    def apply(video: Video, info: Optional[MediaInfo]) -> None:
+        """Записать результат разбора в видео (без commit)"""
+        if info is None or info.duration is None:
+            video.probe_status = MediaProbeStatus.FAILED
+            logger.warning(f"Не удалось автоматически извлечь длительность для {video.filename}. "
+                           f"Видео не попадет в плейлисты до ручного указания длительности через API.")
+        else:
+            # Длительность, указанная вручную до окончания разбора, не перезаписывается
+            if video.duration is None:
+                video.duration = info.duration
+            video.video_codec = info.video_codec
+            video.width = info.width
+            video.height = info.height
+            video.bit_rate = info.bit_rate
+            video.probe_status = MediaProbeStatus.DONE
+        video.probed_at = datetime.utcnow()
+
+    @staticmethod
+    def probe_video(video_id: int) -> Optional[MediaInfo]:
+        """Разобрать файл видео и записать метаданные (блокирующий вызов)"""
+        db = SessionLocal()
+        try:
+            # Воркеры приложения подбирают одни и те же pending - разбирает тот, кто захватил видео
+            video = db.query(Video).filter(
+                Video.id == video_id,
+                Video.probe_status == MediaProbeStatus.PENDING,
+                MediaProbeQueue._unclaimed()
+            ).with_for_update(skip_locked=True).first()
+            if video is None:
+                return None
+            video.probe_claimed_at = datetime.utcnow()
+            source = local_video_path(video)
+            db.commit()
+        finally:
+            db.close()
+
+        # ffprobe работает без блокировки строки и без открытой транзакции
+        info = probe_file(source)
+
+        db = SessionLocal()
+        try:
+            # Захват мог истечь и перейти к другому воркеру - результат записывает первый
+            video = db.query(Video).filter(Video.id == video_id).with_for_update().first()
+            if video is None or video.probe_status != MediaProbeStatus.PENDING:
+                return None
+            MediaProbeQueue.apply(video, info)
+            db.commit()
+            return info
+        finally:
+            db.close()
+
+
+media_probe_queue = MediaProbeQueue()
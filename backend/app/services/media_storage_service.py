@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+import shutil
+from typing import Optional
+
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.models.models import MediaBlob, Video
+
+logger = logging.getLogger(__name__)
+
+# Публичные URL содержимого: /media/<sha256><.ext>; содержимое по URL никогда не меняется
+MEDIA_URL_PREFIX = "/media"
+
+_PUBLIC_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,8})?$")
+
+
+class MediaStorageService:
+    """
+    Контентно-адресуемое хранилище видео: файл лежит один раз под своим SHA-256
+    в MEDIA_STORE_DIR/<sha[:2]>/<sha>, сколько бы видео на него ни ссылалось.
+
+    Повторная загрузка того же файла не занимает место, одинаковые имена файлов
+    разных видео больше не перезаписывают друг друга. Число ссылок хранится в
+    media_blobs.ref_count; файл удаляется вместе с последней ссылкой. Строка
+    media_blobs блокируется на время операций с файлом (upsert при загрузке,
+    UPDATE при удалении). Файл последней ссылки удаляется только после commit
+    (purge) и под той же блокировкой содержимого, что и загрузка: откат удаления
+    не оставляет живую ссылку без файла, а загрузка того же содержимого между
+    commit и purge не теряет его. Файл-сирота безопасен - следующая загрузка
+    его переиспользует.
+    """
+
+    @staticmethod
+    def blob_path(content_sha256: str) -> str:
+        return os.path.join(settings.MEDIA_STORE_DIR, content_sha256[:2], content_sha256)
+
+    @staticmethod
+    def hls_dir(content_sha256: str) -> str:
+        """Производные файлы содержимого (лестница качеств HLS), удаляются вместе с ним"""
+        return os.path.join(settings.MEDIA_STORE_DIR, "hls", content_sha256)
+
+    @staticmethod
+    def public_url(content_sha256: str, filename: str) -> str:
+        """URL для клиентов; расширение исходного файла - только для типа содержимого"""
+        extension = os.path.splitext(filename)[1].lower()
+        if not _PUBLIC_NAME.match(f"{content_sha256}{extension}"):
+            extension = ""
+        return f"{MEDIA_URL_PREFIX}/{content_sha256}{extension}"
+
+    @staticmethod
+    def parse_public_name(name: str) -> Optional[str]:
+        """SHA-256 из имени в публичном URL; None - имя не наше"""
+        match = _PUBLIC_NAME.match(name)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def local_path(url_path: str) -> Optional[str]:
+        """Локальный файл по URL-пути медиа (/media/..., /media/hls/..., /uploads/videos/...)"""
+        parts = url_path.split("/")
+        if any(part in ("", ".", "..") for part in parts[1:]):
+            return None
+        if url_path.startswith(f"{MEDIA_URL_PREFIX}/hls/") and len(parts) == 6:
+            return os.path.join(MediaStorageService.hls_dir(parts[3]), parts[4], parts[5])
+        if url_path.startswith(f"{MEDIA_URL_PREFIX}/") and len(parts) == 3:
+            content_sha256 = MediaStorageService.parse_public_name(parts[2])
+            return MediaStorageService.blob_path(content_sha256) if content_sha256 else None
+        if url_path.startswith("/uploads/videos/") and len(parts) == 4:
+            return os.path.join(settings.UPLOAD_DIR, parts[3])
+        return None
+
+    @staticmethod
+    def video_sha256(video: Video) -> Optional[str]:
+        """SHA-256 содержимого, если файл видео лежит в хранилище (а не в UPLOAD_DIR)"""
+        if video.content_sha256 and video.file_path.startswith(f"{MEDIA_URL_PREFIX}/"):
+            return video.content_sha256
+        return None
+
+    @staticmethod
+    def _place(temp_path: str, content_sha256: str) -> None:
+        """Перенести загруженный файл в хранилище или удалить его, если содержимое уже есть"""
+        blob_path = MediaStorageService.blob_path(content_sha256)
+        if os.path.exists(blob_path):
+            os.remove(temp_path)
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # Тот же том (uploads), поэтому replace - атомарное переименование без копирования
+        os.replace(temp_path, blob_path)
+
+    @staticmethod
+    def _lock_key(content_sha256: str) -> int:
+        """Ключ advisory-блокировки содержимого (60 бит SHA-256 - в пределах bigint)"""
+        return int(content_sha256[:15], 16)
+
+    @staticmethod
+    async def acquire(db: AsyncSession, temp_path: str, content_sha256: str, size: int) -> str:
+        """
+        Добавить ссылку на содержимое и положить файл в хранилище (без commit).
+
+        Строка media_blobs остается заблокированной до commit вызывающего.
+
+        Returns:
+            локальный путь к файлу в хранилище
+        """
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"),
+            {"key": MediaStorageService._lock_key(content_sha256)}
+        )
+        stmt = pg_insert(MediaBlob).values(sha256=content_sha256, size=size, ref_count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaBlob.sha256],
+            set_={"ref_count": MediaBlob.ref_count + 1}
+        )
+        await db.execute(stmt)
+        await run_in_threadpool(MediaStorageService._place, temp_path, content_sha256)
+        return MediaStorageService.blob_path(content_sha256)
+
+    @staticmethod
+    def release(db: Session, content_sha256: str) -> bool:
+        """
+        Убрать ссылку на содержимое (без commit); файлы не трогаются.
+
+        Returns:
+            True, если это была последняя ссылка - после commit вызвать purge
+        """
+        remaining = db.execute(
+            update(MediaBlob)
+            .where(MediaBlob.sha256 == content_sha256)
+            .values(ref_count=MediaBlob.ref_count - 1)
+            .returning(MediaBlob.ref_count)
+        ).scalar()
+        if remaining is None or remaining > 0:
+            return False
+
+        db.execute(delete(MediaBlob).where(MediaBlob.sha256 == content_sha256))
+        return True
+
+    @staticmethod
+    def purge(db: Session, content_sha256: str) -> bool:
+        """
+        Удалить файл и производные содержимого после commit последнего release.
+
+        Отдельная короткая транзакция под блокировкой содержимого: если за это
+        время загрузили то же содержимое заново, файл остается.
+
+        Returns:
+            True, если файл удален
+        """
+        try:
+            db.execute(
+                text("SELECT pg_advisory_xact_lock(:key)"),
+                {"key": MediaStorageService._lock_key(content_sha256)}
+            )
+            referenced = db.execute(
+                select(MediaBlob.sha256).where(MediaBlob.sha256 == content_sha256)
+            ).first() is not None
+            if referenced:
+                return False
+
+            shutil.rmtree(MediaStorageService.hls_dir(content_sha256), ignore_errors=True)
+            blob_path = MediaStorageService.blob_path(content_sha256)
+            try:
+                os.remove(blob_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Файл-сирота безопасен, следующая загрузка его переиспользует
+                logger.warning("Could not delete media blob %s: %s", blob_path, e)
+                return False
+            return True
+        finally:
+            # Снять блокировку содержимого
+            db.commit()
@@ -0,0 +1,120 @@
+from sqlalchemy import text
+from datetime import date, datetime
+from typing import List, Optional
+import logging
+from app.core.config import settings
+from app.db.database import engine
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionService:
+    """
+    Обслуживание месячных секций таблицы playback_logs.
+
+    Родительская таблица секционирована по RANGE (played_at). Секция на каждый
+    месяц называется playback_logs_YYYY_MM. Будущие секции создаются заранее
+    (PLAYBACK_LOG_PARTITIONS_AHEAD месяцев), а старые месяцы отсоединяются
+    через DETACH PARTITION - это изменение метаданных, а не удаление строк,
+    поэтому занимает константное время независимо от объема месяца.
+
+    Методы принимают Session или Connection - оба умеют execute(text(...)).
+    """
+
+    PARENT_TABLE = "playback_logs"
+
+    @staticmethod
+    def month_start(value: date) -> date:
+        return date(value.year, value.month, 1)
+
+    @staticmethod
+    def add_months(value: date, months: int) -> date:
+        index = value.year * 12 + (value.month - 1) + months
+        return date(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def partition_name(month: date) -> str:
+        return f"{PartitionService.PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+    @staticmethod
+    def is_partitioned(db) -> bool:
+        """Проверить, что playback_logs - секционированная таблица (а не обычная heap)"""
+        bind = db.get_bind() if hasattr(db, "get_bind") else db
+        if bind.dialect.name != "postgresql":
+            return False
+        return db.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :name)"
+        ), {"name": PartitionService.PARENT_TABLE}).scalar()
+
+    @staticmethod
+    def create_partition(db, month: date) -> str:
+        """Создать секцию для месяца (идемпотентно)"""
+        month = PartitionService.month_start(month)
+        next_month = PartitionService.add_months(month, 1)
+        name = PartitionService.partition_name(month)
+        db.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {PartitionService.PARENT_TABLE} '
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{next_month.isoformat()} 00:00:00+00')"
+        ))
+        return name
+
+    @staticmethod
+    def ensure_partitions(
+        db,
+        from_month: Optional[date] = None,
+        months_ahead: Optional[int] = None
+    ) -> List[str]:
+        """
+        Создать недостающие секции от from_month (по умолчанию - текущий месяц)
+        до текущего месяца + months_ahead включительно.
+        """
+        if not PartitionService.is_partitioned(db):
+            return []
+
+        if months_ahead is None:
+            months_ahead = settings.PLAYBACK_LOG_PARTITIONS_AHEAD
+
+        current = PartitionService.month_start(datetime.utcnow().date())
+        month = PartitionService.month_start(from_month) if from_month else current
+        last = PartitionService.add_months(current, months_ahead)
+
+        created = []
+        while month <= last:
+            created.append(PartitionService.create_partition(db, month))
+            month = PartitionService.add_months(month, 1)
+        return created
+
+    @staticmethod
+    def list_partitions(db) -> List[str]:
+        """Список подключенных секций, от старых к новым"""
+        rows = db.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name ORDER BY c.relname"
+        ), {"name": PartitionService.PARENT_TABLE}).scalars().all()
+        return list(rows)
+
+    @staticmethod
+    def detach_partition(db, month: date, concurrently: bool = False) -> str:
+        """
+        Отсоединить секцию месяца от playback_logs.
+
+        Данные остаются в отдельной таблице playback_logs_YYYY_MM: ее можно
+        выгрузить, перенести в архив или удалить (DROP TABLE) без влияния на
+        рабочую таблицу. CONCURRENTLY не блокирует чтение/запись, но не может
+        выполняться внутри транзакции - передавайте соединение в AUTOCOMMIT.
+        """
+        name = PartitionService.partition_name(PartitionService.month_start(month))
+        mode = " CONCURRENTLY" if concurrently else ""
+        db.execute(text(f'ALTER TABLE {PartitionService.PARENT_TABLE} DETACH PARTITION "{name}"{mode}'))
+        return name
+
+    @staticmethod
+    def run_maintenance() -> None:
+        """Периодическая задача: создать секции на будущие месяцы"""
+        with engine.begin() as connection:
+            created = PartitionService.ensure_partitions(connection)
+        if created:
+            logger.info("playback_logs partitions ensured up to %s", created[-1])
@@ -1,11 +1,13 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime, timedelta
 from typing import List, Optional, Tuple, Dict
 import json
 import random
 from collections import Counter
-from app.models.models import Video, VideoType, VehicleTariff, Playlist
+from app.models.models import Video, VideoType, VehicleTariff, Playlist, TranscodeStatus
+from app.schemas.schemas import PlaylistResponse, ContractVideoItem, FillerVideoItem, VideoMedia
 from app.core.config import settings
+from app.core.time_utils import as_utc_naive
 
 
 class PlaylistService:
@@ -289,7 +291,8 @@ class PlaylistService:
         db: Session, 
         tariff: VehicleTariff, 
         vehicle_id: Optional[int] = None, 
-        hours: int = 24
+        hours: int = 24,
+        valid_from: Optional[datetime] = None
     ) -> Playlist:
         """
         Создать плейлист для тарифа или конкретного автомобиля.
@@ -298,7 +301,8 @@ class PlaylistService:
         Если vehicle_id указан - создается индивидуальный плейлист для автомобиля.
         
         Генерируется только 1 час контента.
-        Период действия — hours (по умолчанию 24). Приложение зацикливает часовой плейлист.
+        Период действия — hours (по умолчанию 24) с valid_from (по умолчанию сейчас).
+        Приложение зацикливает часовой плейлист.
         """
         # Один часовой плейлист — приложение зациклит его
         hourly_sequence = PlaylistService.generate_hourly_playlist(db, tariff)
@@ -318,13 +322,13 @@ class PlaylistService:
                     # Есть видео без длительности - это проблема
                     pass  # Можно добавить логирование здесь
         
-        now = datetime.utcnow()
+        start = valid_from or datetime.utcnow()
         playlist = Playlist(
             vehicle_id=vehicle_id,  # None для плейлиста по тарифу
             tariff=tariff,
             video_sequence=json.dumps(hourly_sequence) if hourly_sequence else json.dumps([]),
-            valid_from=now,
-            valid_until=now + timedelta(hours=hours)
+            valid_from=start,
+            valid_until=start + timedelta(hours=hours)
         )
         
         db.add(playlist)
@@ -365,12 +369,84 @@ class PlaylistService:
         
         return playlist
     
+    @staticmethod
+    def get_next_playlist(
+        db: Session,
+        current: Playlist,
+        create: bool = True,
+        lead_seconds: Optional[int] = None
+    ) -> Optional[Playlist]:
+        """
+        Плейлист, который сменит current после его valid_until (тот же тариф и автомобиль).
+        
+        Создается заранее, если до смены осталось не больше lead_seconds (по умолчанию
+        PLAYLIST_NEXT_PREFETCH_SECONDS): устройства успевают скачать его видео до смены. Строка current блокируется,
+        чтобы одновременные запросы разных автомобилей тарифа не создали разные плейлисты.
+        """
+        def find() -> Optional[Playlist]:
+            query = db.query(Playlist).filter(
+                Playlist.tariff == current.tariff,
+                Playlist.valid_from >= current.valid_until
+            )
+            if current.vehicle_id is None:
+                query = query.filter(Playlist.vehicle_id.is_(None))
+            else:
+                query = query.filter(Playlist.vehicle_id == current.vehicle_id)
+            return query.order_by(Playlist.valid_from, Playlist.created_at.desc()).first()
+        
+        playlist = find()
+        if playlist is not None or not create:
+            return playlist
+        
+        valid_until = as_utc_naive(current.valid_until)
+        if lead_seconds is None:
+            lead_seconds = settings.PLAYLIST_NEXT_PREFETCH_SECONDS
+        if (valid_until - datetime.utcnow()).total_seconds() > lead_seconds:
+            return None
+        
+        db.query(Playlist.id).filter(Playlist.id == current.id).with_for_update().first()
+        playlist = find()
+        if playlist is None:
+            playlist = PlaylistService.create_playlist(
+                db,
+                current.tariff,
+                vehicle_id=current.vehicle_id,
+                valid_from=valid_until
+            )
+        return playlist
+    
+    @staticmethod
+    def build_playlist_response(db: Session, playlist: Playlist, base_url: Optional[str] = None) -> PlaylistResponse:
+        """Построить PlaylistResponse из объекта Playlist (base_url="" - относительные URL медиа)"""
+        # Построить временную шкалу плейлиста
+        contract_videos, filler_videos, media = PlaylistService.build_playlist_timeline(db, playlist, base_url)
+        
+        # Получить упорядоченную последовательность видео
+        try:
+            video_sequence = json.loads(playlist.video_sequence)
+        except (json.JSONDecodeError, TypeError):
+            video_sequence = []
+        
+        return PlaylistResponse(
+            id=playlist.id,
+            vehicle_id=playlist.vehicle_id,
+            tariff=playlist.tariff,
+            contract_videos=[ContractVideoItem(**item) for item in contract_videos],
+            filler_videos=[FillerVideoItem(**item) for item in filler_videos],
+            media={video_id: VideoMedia(**links) for video_id, links in media.items()},
+            video_sequence=video_sequence,
+            total_duration=3600.0,  # 1 час
+            valid_from=playlist.valid_from,
+            valid_until=playlist.valid_until,
+            created_at=playlist.created_at
+        )
+    
     @staticmethod
     def build_playlist_timeline(
         db: Session, 
         playlist: Playlist,
         base_url: Optional[str] = None
-    ) -> Tuple[List[Dict], List[Dict]]:
+    ) -> Tuple[List[Dict], List[Dict], Dict[int, Dict]]:
         """
         Построить временную шкалу плейлиста.
         
@@ -380,9 +456,10 @@ class PlaylistService:
             base_url: Базовый URL для медиа файлов (если None, будет использован из настроек)
         
         Returns:
-            Tuple[List[Dict], List[Dict]]: 
+            Tuple[List[Dict], List[Dict], Dict[int, Dict]]: 
                 - Список контрактных видео с временными метками (группированные по ID с частотой)
                 - Список филлеров с длительностью и URL
+                - Исходник и качества HLS по video_id - один раз на видео, а не на каждый показ
         """
         # Парсим video_sequence
         try:
@@ -392,14 +469,15 @@ class PlaylistService:
         
         if not video_sequence:
             # Если последовательность пустая, возвращаем пустые списки
-            return [], []
+            return [], [], {}
         
         # Получить информацию о всех видео
         video_ids = set(video_sequence)
         if not video_ids:
-            return [], []
+            return [], [], {}
         
-        videos = db.query(Video).filter(Video.id.in_(video_ids)).all()
+        # Качества HLS - одним дополнительным запросом на все видео плейлиста
+        videos = db.query(Video).options(selectinload(Video.renditions)).filter(Video.id.in_(video_ids)).all()
         video_map = {v.id: v for v in videos}
         
         # Проверить, что все видео найдены
@@ -433,6 +511,31 @@ class PlaylistService:
         # Вычислить временные метки для всех видео в последовательности
         # Проходим по последовательности и вычисляем реальные временные метки
         # Для контрактных видео сохраняем ВСЕ повторения с их временными метками
+        def absolute(path: str) -> str:
+            return f"{base_url}{path}" if base_url else path
+        
+        # Ссылки на исходник и качества HLS - одни и те же для всех повторов видео,
+        # поэтому отдаются отдельной картой, а элементы шкалы несут только media_url
+        media_links: Dict[int, Dict] = {}
+        for vid, video in video_map.items():
+            ready = video.transcode_status == TranscodeStatus.DONE and video.hls_path
+            media_links[vid] = {
+                'media_url': absolute(video.file_path),
+                'hls_url': absolute(video.hls_path) if ready else None,
+                'variants': [
+                    {
+                        'name': rendition.name,
+                        'width': rendition.width,
+                        'height': rendition.height,
+                        'bandwidth': rendition.bandwidth,
+                        'average_bandwidth': rendition.average_bandwidth,
+                        'media_url': absolute(rendition.file_path),
+                        'playlist_url': absolute(rendition.playlist_path),
+                    }
+                    for rendition in video.renditions
+                ] if ready else [],
+            }
+        
         contract_items = []  # Список всех воспроизведений контрактных видео
         filler_items = []  # Список ВСЕХ воспроизведений филлеров (включая повторы)
         
@@ -458,23 +561,21 @@ class PlaylistService:
             
             if video_id in contract_video_ids:
                 # Контрактное видео - сохраняем КАЖДОЕ воспроизведение с временными метками
-                media_url = f"{base_url}{video.file_path}" if base_url else video.file_path
                 contract_items.append({
                     'video_id': video_id,
                     'start_time': current_time,
                     'end_time': end_time,
                     'duration': duration,
                     'file_path': video.file_path,
-                    'media_url': media_url,
+                    'media_url': media_links[video_id]['media_url'],
                 })
             else:
                 # Филлер - сохраняем КАЖДОЕ воспроизведение (включая повторы)
-                media_url = f"{base_url}{video.file_path}" if base_url else video.file_path
                 filler_items.append({
                     'video_id': video_id,
                     'duration': duration,
                     'file_path': video.file_path,
-                    'media_url': media_url,
+                    'media_url': media_links[video_id]['media_url'],
                 })
             
             # Перемещаем время вперед на длительность этого видео
@@ -527,4 +628,7 @@ class PlaylistService:
         # filler_items уже содержит все вхождения филлеров, включая повторы
         # Ничего дополнительно делать не нужно
         
-        return contract_items_final, filler_items
+        played_ids = {item['video_id'] for item in contract_items_final} | {item['video_id'] for item in filler_items}
+        media = {video_id: media_links[video_id] for video_id in sorted(played_ids)}
+        
+        return contract_items_final, filler_items, media
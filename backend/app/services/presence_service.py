@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import Integer, bindparam, cast, func, update
+from sqlalchemy.orm import Session
+
+from app.core.cache import get_redis, mark_redis_failed
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import Vehicle, VehicleSession, VehicleTariff
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """
+    Онлайн-статус парка по heartbeat'ам устройств.
+
+    heartbeat() только обновляет словарь в памяти воркера - ни Postgres, ни Redis
+    на каждый вызов не трогаются. Периодический flush() переносит накопленное:
+      - в Redis (sorted set vehicle_id -> время последнего heartbeat), чтобы
+        онлайн-статус был общим для всех воркеров;
+      - в БД (vehicles.last_seen_at, vehicle_sessions.last_seen_at) пачкой UPDATE.
+    Без Redis онлайн считается по vehicles.last_seen_at (отставание - интервал flush).
+    """
+
+    REDIS_KEY = "presence:last_seen:v1"
+
+    def __init__(self) -> None:
+        # vehicle_id -> (unix time последнего heartbeat, session_id)
+        self._pending: Dict[int, Tuple[float, Optional[int]]] = {}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, vehicle_id: int, session_id: Optional[int] = None, seen_at: Optional[float] = None) -> None:
+        """Отметить автомобиль живым (только память)"""
+        seen_at = time.time() if seen_at is None else seen_at
+        with self._lock:
+            previous = self._pending.get(vehicle_id)
+            if previous is None or previous[0] <= seen_at:
+                # Пустой session_id не затирает известную сессию из предыдущего heartbeat
+                if session_id is None and previous is not None:
+                    session_id = previous[1]
+                self._pending[vehicle_id] = (seen_at, session_id)
+
+    def _take_pending(self) -> Dict[int, Tuple[float, Optional[int]]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore_pending(self, pending: Dict[int, Tuple[float, Optional[int]]]) -> None:
+        """Вернуть неудачно сброшенные heartbeat'ы (новые, пришедшие за время flush, важнее)"""
+        with self._lock:
+            for vehicle_id, (seen_at, session_id) in pending.items():
+                current = self._pending.get(vehicle_id)
+                if current is None or current[0] < seen_at:
+                    self._pending[vehicle_id] = (seen_at, session_id)
+
+    def flush(self) -> int:
+        """Сбросить накопленные heartbeat'ы в Redis и БД; возвращает число автомобилей"""
+        pending = self._take_pending()
+        if not pending:
+            return 0
+
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.zadd(self.REDIS_KEY, {str(vehicle_id): seen_at for vehicle_id, (seen_at, _) in pending.items()})
+                # Записи старше окна чистильщика больше не нужны
+                pipe.zremrangebyscore(self.REDIS_KEY, "-inf", time.time() - settings.SESSION_STALE_AFTER_SECONDS)
+                pipe.execute()
+            except Exception as e:
+                mark_redis_failed(e)
+
+        vehicle_rows = [
+            {"row_id": vehicle_id, "seen_at": datetime.utcfromtimestamp(seen_at)}
+            for vehicle_id, (seen_at, _) in sorted(pending.items())
+        ]
+        session_rows = sorted(
+            (
+                {"row_id": session_id, "owner_id": vehicle_id, "seen_at": datetime.utcfromtimestamp(seen_at)}
+                for vehicle_id, (seen_at, session_id) in pending.items() if session_id is not None
+            ),
+            key=lambda row: row["row_id"]
+        )
+
+        vehicles = Vehicle.__table__
+        sessions = VehicleSession.__table__
+        db = SessionLocal()
+        try:
+            # Один executemany на таблицу; last_seen_at только растет
+            # (другой воркер мог уже записать более свежее время)
+            db.execute(
+                update(vehicles)
+                .where(vehicles.c.id == bindparam("row_id"))
+                .values(
+                    last_seen_at=func.greatest(
+                        func.coalesce(vehicles.c.last_seen_at, bindparam("seen_at")), bindparam("seen_at")
+                    ),
+                    # heartbeat - не изменение карточки автомобиля (onupdate не срабатывает)
+                    updated_at=vehicles.c.updated_at
+                ),
+                vehicle_rows
+            )
+            if session_rows:
+                db.execute(
+                    update(sessions)
+                    # session_id приходит с устройства: продлевается только сессия этого же автомобиля
+                    .where(
+                        sessions.c.id == bindparam("row_id"),
+                        sessions.c.vehicle_id == bindparam("owner_id"),
+                        sessions.c.end_time.is_(None)
+                    )
+                    .values(last_seen_at=func.greatest(
+                        func.coalesce(sessions.c.last_seen_at, bindparam("seen_at")), bindparam("seen_at")
+                    )),
+                    session_rows
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore_pending(pending)
+            raise
+        finally:
+            db.close()
+
+        return len(pending)
+
+    @staticmethod
+    def close_stale_sessions() -> int:
+        """
+        Закрыть открытые сессии без heartbeat дольше SESSION_STALE_AFTER_SECONDS.
+
+        Одним UPDATE: end_time = последний heartbeat (или начало сессии, если
+        heartbeat'ов не было). Запуск на нескольких воркерах безопасен -
+        повторный проход ничего не найдет.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.SESSION_STALE_AFTER_SECONDS)
+        last_seen = func.coalesce(VehicleSession.last_seen_at, VehicleSession.start_time)
+
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(VehicleSession)
+                .where(VehicleSession.end_time.is_(None), last_seen < cutoff)
+                .values(
+                    end_time=last_seen,
+                    total_duration_seconds=cast(
+                        func.extract("epoch", last_seen - VehicleSession.start_time), Integer
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        if result.rowcount:
+            logger.info("Closed %s stale vehicle sessions", result.rowcount)
+        return result.rowcount
+
+    def sweep(self) -> None:
+        """Периодическая задача: сбросить свои heartbeat'ы, затем закрыть зависшие сессии"""
+        self.flush()
+        self.close_stale_sessions()
+
+    def online_vehicle_ids(self) -> Optional[Set[int]]:
+        """
+        Автомобили с heartbeat за ONLINE_WINDOW_SECONDS по данным Redis
+        (плюс еще не сброшенные heartbeat'ы этого воркера).
+
+        None - Redis недоступен, нужно считать по БД.
+        """
+        cutoff = time.time() - settings.ONLINE_WINDOW_SECONDS
+        redis_client = get_redis()
+        if redis_client is None:
+            return None
+        try:
+            members = redis_client.zrangebyscore(self.REDIS_KEY, cutoff, "+inf")
+        except Exception as e:
+            mark_redis_failed(e)
+            return None
+
+        online = {int(member) for member in members}
+        with self._lock:
+            online.update(vehicle_id for vehicle_id, (seen_at, _) in self._pending.items() if seen_at >= cutoff)
+        return online
+
+    def online_counts(self, db: Session) -> Dict[VehicleTariff, int]:
+        """Число автомобилей онлайн по тарифам"""
+        online = self.online_vehicle_ids()
+
+        query = db.query(Vehicle.tariff, func.count(Vehicle.id))
+        if online is not None:
+            if not online:
+                return {}
+            query = query.filter(Vehicle.id.in_(online))
+        else:
+            cutoff = time.time() - settings.ONLINE_WINDOW_SECONDS
+            with self._lock:
+                local = [vehicle_id for vehicle_id, (seen_at, _) in self._pending.items() if seen_at >= cutoff]
+            condition = Vehicle.last_seen_at >= datetime.utcfromtimestamp(cutoff)
+            if local:
+                condition = condition | Vehicle.id.in_(local)
+            query = query.filter(condition)
+
+        return dict(query.group_by(Vehicle.tariff).all())
+
+
+presence_tracker = PresenceTracker()
@@ -0,0 +1,164 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.time_utils import as_utc_naive
+from app.models.models import RateCard, VehicleTariff
+from app.schemas.schemas import (
+    RateCardCreate, RateCardVersionResponse, RateCardDaypartResponse
+)
+
+
+class RateCardVersionConflict(ValueError):
+    """Версию тарифа одновременно создал другой запрос"""
+
+
+class RateCardService:
+    """
+    Версионированные ставки по тарифам и частям суток.
+
+    Версии тарифа кешируются в памяти воркера на RATE_CARD_CACHE_TTL_SECONDS,
+    поэтому прием лога не ходит в БД за ставкой. Чтобы все воркеры гарантированно
+    увидели новую версию до ее вступления в силу, effective_from не может быть
+    раньше, чем через TTL (по умолчанию - ровно через TTL).
+    """
+
+    # tariff -> [(effective_from, version, [(start_hour, end_hour, rate_card_id, rate)])], новые первыми
+    _versions_cache = TTLCache(maxsize=64, ttl=settings.RATE_CARD_CACHE_TTL_SECONDS)
+
+    @staticmethod
+    def _load_versions(db: Session, tariff: VehicleTariff) -> list:
+        cached = RateCardService._versions_cache.get(tariff)
+        if cached is not None:
+            return cached
+
+        rows = db.query(RateCard).filter(RateCard.tariff == tariff).order_by(
+            RateCard.effective_from.desc(), RateCard.version.desc(), RateCard.start_hour
+        ).all()
+
+        versions = []
+        for row in rows:
+            effective_from = as_utc_naive(row.effective_from)
+            if not versions or versions[-1][1] != row.version:
+                versions.append((effective_from, row.version, []))
+            versions[-1][2].append((row.start_hour, row.end_hour, row.id, row.rate_per_second))
+
+        RateCardService._versions_cache.set(tariff, versions)
+        return versions
+
+    @staticmethod
+    def resolve_rate(
+        db: Session,
+        tariff: VehicleTariff,
+        played_at: datetime
+    ) -> Optional[Tuple[int, float]]:
+        """
+        Ставка, действовавшая для тарифа в момент played_at.
+
+        Returns:
+            (rate_card_id, rate_per_second) или None, если для тарифа нет карты
+        """
+        played_at = as_utc_naive(played_at)
+        hour = played_at.hour
+        for effective_from, _, dayparts in RateCardService._load_versions(db, tariff):
+            if effective_from > played_at:
+                continue
+            for start_hour, end_hour, rate_card_id, rate in dayparts:
+                if start_hour <= hour < end_hour:
+                    return rate_card_id, rate
+            return None
+        return None
+
+    @staticmethod
+    def _validate_dayparts(card: RateCardCreate) -> None:
+        dayparts = sorted(card.dayparts, key=lambda d: d.start_hour)
+        expected_start = 0
+        for daypart in dayparts:
+            if daypart.end_hour <= daypart.start_hour:
+                raise ValueError("Daypart end_hour must be greater than start_hour")
+            if daypart.start_hour != expected_start:
+                raise ValueError("Dayparts must cover 0-24 hours without gaps or overlaps")
+            expected_start = daypart.end_hour
+        if expected_start != 24:
+            raise ValueError("Dayparts must cover 0-24 hours without gaps or overlaps")
+
+    @staticmethod
+    def create_version(db: Session, card: RateCardCreate) -> RateCardVersionResponse:
+        """Создать новую версию карты тарифа (старые версии не изменяются)"""
+        RateCardService._validate_dayparts(card)
+
+        # Кеш остальных воркеров сбрасывается только по TTL: раньше версия вступить в силу не может
+        earliest = datetime.utcnow() + timedelta(seconds=settings.RATE_CARD_CACHE_TTL_SECONDS)
+        if card.effective_from is None:
+            effective_from = earliest
+        else:
+            effective_from = as_utc_naive(card.effective_from)
+            if effective_from < earliest:
+                raise ValueError(
+                    f"effective_from must be at least {settings.RATE_CARD_CACHE_TTL_SECONDS}s in the future: "
+                    f"rate changes never rewrite history and every worker must see the new version first"
+                )
+
+        version = (db.query(func.max(RateCard.version)).filter(
+            RateCard.tariff == card.tariff
+        ).scalar() or 0) + 1
+
+        rows = [
+            RateCard(
+                tariff=card.tariff,
+                version=version,
+                start_hour=daypart.start_hour,
+                end_hour=daypart.end_hour,
+                rate_per_second=daypart.rate_per_second,
+                effective_from=effective_from
+            )
+            for daypart in sorted(card.dayparts, key=lambda d: d.start_hour)
+        ]
+        db.add_all(rows)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Тот же номер версии выбрал параллельный запрос: уникальность (tariff, version, start_hour)
+            db.rollback()
+            raise RateCardVersionConflict(f"Rate card version {version} for {card.tariff.value} already exists")
+        for row in rows:
+            db.refresh(row)
+
+        RateCardService._versions_cache.delete(card.tariff)
+        return RateCardService._to_response(rows)
+
+    @staticmethod
+    def list_versions(db: Session, tariff: Optional[VehicleTariff] = None) -> List[RateCardVersionResponse]:
+        """Все версии карт (новые первыми)"""
+        query = db.query(RateCard)
+        if tariff:
+            query = query.filter(RateCard.tariff == tariff)
+        rows = query.order_by(
+            RateCard.tariff, RateCard.version.desc(), RateCard.start_hour
+        ).all()
+
+        grouped = {}
+        for row in rows:
+            grouped.setdefault((row.tariff, row.version), []).append(row)
+        return [RateCardService._to_response(group) for group in grouped.values()]
+
+    @staticmethod
+    def _to_response(rows: List[RateCard]) -> RateCardVersionResponse:
+        first = rows[0]
+        return RateCardVersionResponse(
+            tariff=first.tariff,
+            version=first.version,
+            effective_from=first.effective_from,
+            dayparts=[
+                RateCardDaypartResponse(
+                    id=row.id,
+                    start_hour=row.start_hour,
+                    end_hour=row.end_hour,
+                    rate_per_second=row.rate_per_second
+                )
+                for row in rows
+            ]
+        )
@@ -0,0 +1,115 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import date, timedelta
+import math
+from typing import Iterable, List, Tuple
+from app.core.hll import HyperLogLog, HLL_REGISTERS, HLL_STANDARD_ERROR, hll_position
+from app.models.models import VideoReachDaily, VideoReachMonthly
+from app.schemas.schemas import VideoReach
+
+
+class ReachService:
+    """
+    Приблизительный охват видео (уникальные автомобили) по HyperLogLog-скетчам.
+
+    Ошибка оценки: относительная стандартная ошибка 1.04 / sqrt(4096) ~ 1.6%,
+    примерно 95% ответов - в пределах +-3.3% от точного COUNT(DISTINCT vehicle_id).
+    Для малых значений (до ~10 000 автомобилей) используется линейный подсчет,
+    и ошибка заметно меньше. Память ответа ограничена: один скетч 4 КБ, а диапазон
+    читается полными месяцами плюс дни на краях (не больше ~60 дневных скетчей).
+    """
+
+    # Доверительный интервал ~95% (два стандартных отклонения)
+    CONFIDENCE_SIGMAS = 2
+
+    @staticmethod
+    def month_start(day: date) -> date:
+        return day.replace(day=1)
+
+    @staticmethod
+    def next_month(day: date) -> date:
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    @staticmethod
+    def record(db: Session, vehicle_id: int, video_days: Iterable[Tuple[int, date]]) -> None:
+        """
+        Учесть показы автомобиля в скетчах (в транзакции приема логов).
+
+        Позиция в скетче зависит только от vehicle_id, поэтому вся пачка
+        меняет один и тот же регистр: один UPSERT на таблицу, а повторные
+        показы того же автомобиля за день строк не изменяют (WHERE в DO UPDATE).
+        """
+        video_days = sorted(set(video_days))
+        if not video_days:
+            return
+
+        index, rank = hll_position(vehicle_id)
+        initial = bytearray(HLL_REGISTERS)
+        initial[index] = rank
+        initial = bytes(initial)
+
+        months = sorted({(video_id, ReachService.month_start(day)) for video_id, day in video_days})
+
+        for model, key_column, keys in (
+            (VideoReachDaily, VideoReachDaily.day, video_days),
+            (VideoReachMonthly, VideoReachMonthly.month, months),
+        ):
+            stmt = pg_insert(model).values([
+                {"video_id": video_id, key_column.key: period, "registers": initial}
+                for video_id, period in keys
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[model.video_id, key_column],
+                set_={"registers": func.set_byte(model.registers, index, rank)},
+                where=func.get_byte(model.registers, index) < rank
+            )
+            db.execute(stmt)
+
+    @staticmethod
+    def _range_sketches(db: Session, video_id: int, start_date: date, end_date: date) -> List[bytes]:
+        """Скетчи, покрывающие [start_date, end_date]: полные месяцы + дни на краях"""
+        first_full = start_date if start_date.day == 1 else ReachService.next_month(start_date)
+        after_end = end_date + timedelta(days=1)
+        last_full_end = ReachService.month_start(after_end)
+
+        if first_full >= last_full_end:
+            # Внутри нет полного месяца - только дни
+            return [row[0] for row in db.query(VideoReachDaily.registers).filter(
+                VideoReachDaily.video_id == video_id,
+                VideoReachDaily.day >= start_date,
+                VideoReachDaily.day <= end_date
+            )]
+
+        sketches = [row[0] for row in db.query(VideoReachMonthly.registers).filter(
+            VideoReachMonthly.video_id == video_id,
+            VideoReachMonthly.month >= first_full,
+            VideoReachMonthly.month < last_full_end
+        )]
+        sketches.extend(row[0] for row in db.query(VideoReachDaily.registers).filter(
+            VideoReachDaily.video_id == video_id,
+            ((VideoReachDaily.day >= start_date) & (VideoReachDaily.day < first_full))
+            | ((VideoReachDaily.day >= last_full_end) & (VideoReachDaily.day <= end_date))
+        ))
+        return sketches
+
+    @staticmethod
+    def get_video_reach(db: Session, video_id: int, start_date: date, end_date: date) -> VideoReach:
+        """Оценка числа уникальных автомобилей, показавших видео за период"""
+        if end_date < start_date:
+            raise ValueError("end_date must not be before start_date")
+
+        sketches = ReachService._range_sketches(db, video_id, start_date, end_date)
+        estimate = HyperLogLog.union(bytes(s) for s in sketches).estimate() if sketches else 0.0
+        margin = ReachService.CONFIDENCE_SIGMAS * HLL_STANDARD_ERROR * estimate
+
+        return VideoReach(
+            video_id=video_id,
+            start_date=start_date,
+            end_date=end_date,
+            unique_vehicles=round(estimate),
+            relative_standard_error=HLL_STANDARD_ERROR,
+            lower_bound=max(math.floor(estimate - margin), 0),
+            upper_bound=math.ceil(estimate + margin),
+            sketches_merged=len(sketches)
+        )
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.schemas.schemas import UploadSessionCreate, UploadSessionStatus
+from app.services.upload_service import UploadTooLarge
+
+logger = logging.getLogger(__name__)
+
+
+class UploadNotFound(LookupError):
+    """Загрузка не найдена (завершена, отменена или истекла)"""
+
+
+class UploadOffsetMismatch(ValueError):
+    """Кусок прислан не с текущего смещения загрузки"""
+
+    def __init__(self, offset: int) -> None:
+        super().__init__(f"Upload offset is {offset}")
+        self.offset = offset
+
+
+class UploadChecksumMismatch(ValueError):
+    """SHA-256 куска или всего файла не совпал с заявленным"""
+
+
+class ResumableUploadService:
+    """
+    Возобновляемая загрузка видео кусками: создать -> PUT кусков по смещению -> завершить.
+
+    Состояние живет на локальном диске в UPLOAD_INCOMING_DIR/<upload_id>/:
+    meta.json (имя, размер, ожидаемый SHA-256) и data (принятые байты).
+    Текущее смещение - размер data, поэтому после обрыва или перезапуска
+    воркера клиент спрашивает смещение и продолжает с него. Каждый кусок
+    проверяется по X-Chunk-SHA256 до записи; в память одновременно попадает
+    не больше одного куска (RESUMABLE_UPLOAD_CHUNK_MAX_MB).
+    """
+
+    META_FILE = "meta.json"
+    DATA_FILE = "data"
+
+    # Куски одной загрузки пишутся по очереди (в пределах воркера)
+    _locks: Dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def _dir(upload_id: str) -> str:
+        # upload_id - uuid4 hex; все остальное - не наша загрузка
+        if len(upload_id) != 32 or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadNotFound(upload_id)
+        return os.path.join(settings.UPLOAD_INCOMING_DIR, upload_id)
+
+    @staticmethod
+    def _lock(upload_id: str) -> asyncio.Lock:
+        lock = ResumableUploadService._locks.get(upload_id)
+        if lock is None:
+            lock = ResumableUploadService._locks[upload_id] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    async def _load(upload_id: str) -> Tuple[dict, int]:
+        """(meta, текущее смещение)"""
+        upload_dir = ResumableUploadService._dir(upload_id)
+        try:
+            async with aiofiles.open(os.path.join(upload_dir, ResumableUploadService.META_FILE)) as f:
+                meta = json.loads(await f.read())
+            offset = (await aiofiles.os.stat(os.path.join(upload_dir, ResumableUploadService.DATA_FILE))).st_size
+        except FileNotFoundError:
+            raise UploadNotFound(upload_id)
+        return meta, offset
+
+    @staticmethod
+    def _status(upload_id: str, meta: dict, offset: int) -> UploadSessionStatus:
+        return UploadSessionStatus(
+            upload_id=upload_id,
+            filename=meta["filename"],
+            size=meta["size"],
+            offset=offset,
+            chunk_max_bytes=settings.RESUMABLE_UPLOAD_CHUNK_MAX_MB * 1024 * 1024
+        )
+
+    @staticmethod
+    async def create(data: UploadSessionCreate) -> UploadSessionStatus:
+        if data.size > settings.MAX_VIDEO_SIZE_MB * 1024 * 1024:
+            raise UploadTooLarge(f"File exceeds {settings.MAX_VIDEO_SIZE_MB} MB")
+
+        upload_id = uuid.uuid4().hex
+        upload_dir = ResumableUploadService._dir(upload_id)
+        meta = {
+            "filename": os.path.basename(data.filename),
+            "size": data.size,
+            "sha256": data.sha256.lower() if data.sha256 else None,
+            "created_at": int(time.time()),
+        }
+        await aiofiles.os.makedirs(upload_dir, exist_ok=True)
+        async with aiofiles.open(os.path.join(upload_dir, ResumableUploadService.DATA_FILE), "wb"):
+            pass
+        async with aiofiles.open(os.path.join(upload_dir, ResumableUploadService.META_FILE), "w") as f:
+            await f.write(json.dumps(meta))
+        return ResumableUploadService._status(upload_id, meta, 0)
+
+    @staticmethod
+    async def get_status(upload_id: str) -> UploadSessionStatus:
+        meta, offset = await ResumableUploadService._load(upload_id)
+        return ResumableUploadService._status(upload_id, meta, offset)
+
+    @staticmethod
+    async def write_chunk(
+        upload_id: str,
+        offset: int,
+        chunk_sha256: str,
+        body: AsyncIterator[bytes]
+    ) -> UploadSessionStatus:
+        """Принять кусок с offset; запись только после проверки SHA-256 куска"""
+        chunk_limit = settings.RESUMABLE_UPLOAD_CHUNK_MAX_MB * 1024 * 1024
+
+        async with ResumableUploadService._lock(upload_id):
+            meta, current = await ResumableUploadService._load(upload_id)
+            if offset != current:
+                raise UploadOffsetMismatch(current)
+
+            digest = hashlib.sha256()
+            parts = []
+            received = 0
+            async for part in body:
+                received += len(part)
+                if received > chunk_limit:
+                    raise UploadTooLarge(f"Chunk exceeds {settings.RESUMABLE_UPLOAD_CHUNK_MAX_MB} MB")
+                if offset + received > meta["size"]:
+                    raise UploadTooLarge("Chunk goes past the declared upload size")
+                digest.update(part)
+                parts.append(part)
+
+            if digest.hexdigest() != chunk_sha256.lower():
+                raise UploadChecksumMismatch("Chunk SHA-256 mismatch")
+
+            data_path = os.path.join(ResumableUploadService._dir(upload_id), ResumableUploadService.DATA_FILE)
+            async with aiofiles.open(data_path, "r+b") as f:
+                await f.seek(offset)
+                await f.write(b"".join(parts))
+
+            return ResumableUploadService._status(upload_id, meta, offset + received)
+
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    async def finalize(upload_id: str) -> Tuple[str, str, int, str]:
+        """
+        Проверить целостность и вынуть файл из каталога загрузки.
+
+        Файл остается в UPLOAD_INCOMING_DIR (<upload_id>.upload) до переноса в хранилище.
+
+        Returns:
+            (имя файла, локальный путь, размер, sha256)
+        """
+        async with ResumableUploadService._lock(upload_id):
+            meta, offset = await ResumableUploadService._load(upload_id)
+            if offset != meta["size"]:
+                raise UploadOffsetMismatch(offset)
+
+            upload_dir = ResumableUploadService._dir(upload_id)
+            data_path = os.path.join(upload_dir, ResumableUploadService.DATA_FILE)
+            # Многогигабайтный файл читается потоково и вне цикла событий
+            content_sha256 = await run_in_threadpool(ResumableUploadService._file_sha256, data_path)
+            if meta["sha256"] and content_sha256 != meta["sha256"]:
+                raise UploadChecksumMismatch("File SHA-256 mismatch")
+
+            local_path = f"{upload_dir}.upload"
+            await aiofiles.os.replace(data_path, local_path)
+            await run_in_threadpool(shutil.rmtree, upload_dir, True)
+
+        ResumableUploadService._locks.pop(upload_id, None)
+        return meta["filename"], local_path, offset, content_sha256
+
+    @staticmethod
+    async def abort(upload_id: str) -> None:
+        upload_dir = ResumableUploadService._dir(upload_id)
+        async with ResumableUploadService._lock(upload_id):
+            if not await aiofiles.os.path.isdir(upload_dir):
+                raise UploadNotFound(upload_id)
+            await run_in_threadpool(shutil.rmtree, upload_dir, True)
+        ResumableUploadService._locks.pop(upload_id, None)
+
+    @staticmethod
+    def _scan_expired(now: Optional[float]) -> Tuple[List[str], int]:
+        """
+        Найти брошенные загрузки (в пуле потоков).
+
+        Returns:
+            (upload_id каталогов старше TTL, число удаленных файлов, не дошедших до хранилища)
+        """
+        root = settings.UPLOAD_INCOMING_DIR
+        if not os.path.isdir(root):
+            return [], 0
+
+        cutoff = (time.time() if now is None else now) - settings.RESUMABLE_UPLOAD_TTL_HOURS * 3600
+        expired: List[str] = []
+        removed_files = 0
+        for entry in os.scandir(root):
+            # Время последнего принятого куска, а не создания: активная загрузка не удаляется
+            data_path = os.path.join(entry.path, ResumableUploadService.DATA_FILE)
+            try:
+                last_activity = os.stat(data_path).st_mtime
+            except (FileNotFoundError, NotADirectoryError):
+                last_activity = entry.stat().st_mtime
+            if last_activity >= cutoff:
+                continue
+            if entry.is_dir():
+                expired.append(entry.name)
+            else:
+                # Файл, не дошедший до хранилища (оборванный запрос или падение воркера)
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed_files += 1
+        return expired, removed_files
+
+    @staticmethod
+    async def purge_expired(now: Optional[float] = None) -> int:
+        """Периодическая задача: удалить незавершенные загрузки старше RESUMABLE_UPLOAD_TTL_HOURS"""
+        expired, removed = await run_in_threadpool(ResumableUploadService._scan_expired, now)
+
+        # Блокировки - объекты цикла событий: берутся и удаляются только здесь, не в пуле потоков
+        for upload_id in expired:
+            lock = ResumableUploadService._lock(upload_id)
+            if lock.locked():
+                # Кусок этой загрузки пишется прямо сейчас - она не брошена
+                continue
+            async with lock:
+                upload_dir = os.path.join(settings.UPLOAD_INCOMING_DIR, upload_id)
+                await run_in_threadpool(shutil.rmtree, upload_dir, True)
+            if not lock.locked():
+                ResumableUploadService._locks.pop(upload_id, None)
+            removed += 1
+
+        if removed:
+            logger.info("Removed %s expired resumable uploads", removed)
+        return removed
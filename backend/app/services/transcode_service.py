@@ -0,0 +1,401 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.mp4 import parse_mp4
+from app.db.database import SessionLocal
+from app.models.models import MediaProbeStatus, TranscodeStatus, Video, VideoRendition
+from app.services.media_probe_service import MediaJobQueue, local_video_path, resolve_ffmpeg
+from app.services.media_storage_service import MEDIA_URL_PREFIX, MediaStorageService
+
+logger = logging.getLogger(__name__)
+
+# Меняется вместе с параметрами кодирования: новая версия - новый каталог и новые URL
+_FORMAT_VERSION = "fmp4-1"
+
+RENDITIONS_FILE = "renditions.json"
+MASTER_PLAYLIST = "master.m3u8"
+
+
+@dataclass(frozen=True)
+class Rung:
+    """Ступень лестницы качеств"""
+    height: int
+    video_kbps: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.height}p"
+
+
+@dataclass
+class RenditionInfo:
+    """Готовое качество: файлы в каталоге лестницы и измеренный битрейт"""
+    name: str
+    width: int
+    height: int
+    bandwidth: int
+    average_bandwidth: int
+    codecs: Optional[str]
+    playlist: str  # имя файла плейлиста в каталоге лестницы
+    media: str     # имя fMP4-файла в каталоге лестницы
+    file_size: int
+    content_sha256: Optional[str] = None  # SHA-256 fMP4-файла (манифест синхронизации устройств)
+
+
+class TranscodeBusy(RuntimeError):
+    """Та же лестница для того же содержимого уже кодируется (другим потоком или воркером)"""
+
+
+def parse_ladder(spec: str) -> List[Rung]:
+    """TRANSCODE_LADDER: "240:400,360:800" -> ступени по возрастанию высоты"""
+    rungs = set()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        height, _, kbps = item.partition(":")
+        rungs.add(Rung(int(height), int(kbps)))
+    if not rungs:
+        raise ValueError("TRANSCODE_LADDER is empty")
+    return sorted(rungs, key=lambda rung: rung.height)
+
+
+def select_rungs(rungs: List[Rung], source_height: Optional[int]) -> List[Rung]:
+    """Ступени не выше исходника (без апскейла); хотя бы одна - самая низкая"""
+    if not source_height:
+        return rungs
+    return [rung for rung in rungs if rung.height <= source_height] or rungs[:1]
+
+
+def ladder_id(rungs: List[Rung]) -> str:
+    """Идентификатор параметров кодирования: часть URL, поэтому файлы по нему неизменяемы"""
+    spec = ",".join(f"{rung.height}:{rung.video_kbps}" for rung in rungs)
+    key = (
+        f"{_FORMAT_VERSION};{spec};{settings.HLS_SEGMENT_SECONDS};"
+        f"{settings.TRANSCODE_PRESET};{settings.TRANSCODE_AUDIO_BITRATE_KBPS}"
+    )
+    return hashlib.sha256(key.encode()).hexdigest()[:10]
+
+
+def scaled_width(source_width: Optional[int], source_height: Optional[int], height: int) -> int:
+    """Ширина при масштабировании до height с сохранением пропорций (четная, как scale=-2)"""
+    if not source_width or not source_height:
+        return (height * 16 // 9 + 1) // 2 * 2
+    return max(2, round(source_width * height / source_height / 2) * 2)
+
+
+def measure_playlist(playlist_path: str) -> Tuple[int, int]:
+    """
+    (пиковый, средний) битрейт качества по его плейлисту, бит/с.
+
+    BANDWIDTH в master-плейлисте - пик по сегментам; размеры сегментов берутся
+    из EXT-X-BYTERANGE (один fMP4-файл на качество).
+    """
+    durations: List[float] = []
+    sizes: List[int] = []
+    pending_duration = None
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                pending_duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line.startswith("#EXT-X-BYTERANGE:") and pending_duration is not None:
+                sizes.append(int(line[len("#EXT-X-BYTERANGE:"):].split("@")[0]))
+                durations.append(pending_duration)
+                pending_duration = None
+
+    if not durations or not sum(durations):
+        raise ValueError(f"No byte-range segments in {playlist_path}")
+
+    peak = max(int(size * 8 / duration) for size, duration in zip(sizes, durations) if duration > 0)
+    average = int(sum(sizes) * 8 / sum(durations))
+    return peak, average
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HlsTranscoder:
+    """
+    Лестница качеств HLS для содержимого из хранилища (ffmpeg/libx264).
+
+    Каждое качество - отдельный проход ffmpeg в один fMP4-файл (single_file) с
+    плейлистом по байтовым диапазонам: плеер HLS переключает качества по
+    сегментам, а устройство с офлайн-кешем может скачать одно подходящее
+    качество целиком. Результат кладется в MEDIA_STORE_DIR/hls/<sha256>/<ladder>/
+    атомарным переименованием готового каталога, поэтому файлы по URL не меняются,
+    а одинаковое содержимое разных видео кодируется один раз.
+    """
+
+    @staticmethod
+    def output_dir(content_sha256: str, ladder: str) -> str:
+        return os.path.join(MediaStorageService.hls_dir(content_sha256), ladder)
+
+    @staticmethod
+    def url_prefix(content_sha256: str, ladder: str) -> str:
+        return f"{MEDIA_URL_PREFIX}/hls/{content_sha256}/{ladder}"
+
+    @staticmethod
+    def command(ffmpeg: str, source: str, work_dir: str, rung: Rung) -> List[str]:
+        segment = settings.HLS_SEGMENT_SECONDS
+        return [
+            ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-y",
+            "-i", source,
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-vf", f"scale=-2:{rung.height}",
+            "-c:v", "libx264", "-preset", settings.TRANSCODE_PRESET,
+            "-profile:v", "main", "-pix_fmt", "yuv420p",
+            "-b:v", f"{rung.video_kbps}k",
+            "-maxrate", f"{rung.video_kbps * 107 // 100}k",
+            "-bufsize", f"{rung.video_kbps * 3 // 2}k",
+            # Ключевой кадр на границе каждого сегмента - переключение качества без артефактов
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment})", "-sc_threshold", "0",
+            "-c:a", "aac", "-b:a", f"{settings.TRANSCODE_AUDIO_BITRATE_KBPS}k", "-ac", "2",
+            "-f", "hls", "-hls_time", str(segment), "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4", "-hls_flags", "single_file+independent_segments",
+            "-hls_segment_filename", os.path.join(work_dir, f"{rung.name}.mp4"),
+            os.path.join(work_dir, f"{rung.name}.m3u8"),
+        ]
+
+    @staticmethod
+    def load(out_dir: str) -> Optional[List[RenditionInfo]]:
+        """Уже готовая лестница (в том числе закодированная для другого видео с тем же содержимым)"""
+        try:
+            with open(os.path.join(out_dir, RENDITIONS_FILE)) as f:
+                return [RenditionInfo(**item) for item in json.load(f)]
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_master(work_dir: str, renditions: List[RenditionInfo]) -> None:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for rendition in renditions:
+            attributes = (
+                f"BANDWIDTH={rendition.bandwidth},AVERAGE-BANDWIDTH={rendition.average_bandwidth},"
+                f"RESOLUTION={rendition.width}x{rendition.height}"
+            )
+            if rendition.codecs:
+                attributes += f',CODECS="{rendition.codecs}"'
+            lines += [f"#EXT-X-STREAM-INF:{attributes}", rendition.playlist]
+        with open(os.path.join(work_dir, MASTER_PLAYLIST), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    @staticmethod
+    def _acquire_lock(lock_path: str, stale_after: float) -> None:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.stat(lock_path).st_mtime
+            except FileNotFoundError:
+                age = stale_after
+            if age < stale_after:
+                raise TranscodeBusy(lock_path)
+            # Воркер, кодировавший лестницу, упал: забрать блокировку
+            os.remove(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+
+    @staticmethod
+    def transcode(
+        source: str,
+        content_sha256: str,
+        source_width: Optional[int],
+        source_height: Optional[int]
+    ) -> Tuple[str, List[RenditionInfo]]:
+        """
+        Закодировать лестницу (блокирующий вызов, минуты на длинное видео).
+
+        Returns:
+            (идентификатор лестницы, качества по возрастанию)
+        Raises:
+            TranscodeBusy: лестница уже кодируется
+            RuntimeError: ffmpeg не найден или завершился с ошибкой
+        """
+        rungs = select_rungs(parse_ladder(settings.TRANSCODE_LADDER), source_height)
+        ladder = ladder_id(rungs)
+        out_dir = HlsTranscoder.output_dir(content_sha256, ladder)
+        existing = HlsTranscoder.load(out_dir)
+        if existing is not None:
+            return ladder, existing
+
+        ffmpeg = resolve_ffmpeg()
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg is not available")
+
+        os.makedirs(os.path.dirname(out_dir), exist_ok=True)
+        lock_path = f"{out_dir}.lock"
+        HlsTranscoder._acquire_lock(lock_path, settings.TRANSCODE_TIMEOUT_SECONDS * (len(rungs) + 1))
+        work_dir = f"{out_dir}.tmp-{uuid.uuid4().hex}"
+        try:
+            existing = HlsTranscoder.load(out_dir)
+            if existing is not None:
+                return ladder, existing
+
+            os.makedirs(work_dir)
+            renditions = []
+            for rung in rungs:
+                started = time.perf_counter()
+                result = subprocess.run(
+                    HlsTranscoder.command(ffmpeg, source, work_dir, rung),
+                    capture_output=True,
+                    text=True,
+                    timeout=settings.TRANSCODE_TIMEOUT_SECONDS
+                )
+                if result.returncode != 0:
+                    raise RuntimeError(f"ffmpeg failed for {rung.name}: {result.stderr[-2000:]}")
+
+                playlist = f"{rung.name}.m3u8"
+                media = f"{rung.name}.mp4"
+                media_path = os.path.join(work_dir, media)
+                bandwidth, average_bandwidth = measure_playlist(os.path.join(work_dir, playlist))
+                # Размеры и кодек - из init-сегмента готового файла (moov в начале fMP4)
+                info = parse_mp4(media_path)
+                width = info.width if info is not None and info.width else None
+                height = info.height if info is not None and info.height else None
+                codecs = None
+                if info is not None and info.codec_tag:
+                    codecs = f"{info.codec_tag},mp4a.40.2" if info.has_audio else info.codec_tag
+                renditions.append(RenditionInfo(
+                    name=rung.name,
+                    width=width or scaled_width(source_width, source_height, rung.height),
+                    height=height or rung.height,
+                    bandwidth=bandwidth,
+                    average_bandwidth=average_bandwidth,
+                    codecs=codecs,
+                    playlist=playlist,
+                    media=media,
+                    file_size=os.path.getsize(media_path),
+                    content_sha256=_file_sha256(media_path)
+                ))
+                logger.info(
+                    "Transcoded %s %s in %.1fs (%d kbit/s)",
+                    content_sha256[:12], rung.name, time.perf_counter() - started, average_bandwidth // 1000
+                )
+
+            HlsTranscoder._write_master(work_dir, renditions)
+            with open(os.path.join(work_dir, RENDITIONS_FILE), "w") as f:
+                json.dump([asdict(rendition) for rendition in renditions], f)
+            os.replace(work_dir, out_dir)
+            return ladder, renditions
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+
+class MediaTranscodeQueue(MediaJobQueue):
+    """
+    Фоновое перекодирование видео в лестницу качеств HLS (после разбора метаданных).
+
+    ffmpeg выполняется в собственном пуле очереди (TRANSCODE_WORKERS потоков), строка
+    видео во время кодирования не блокируется - редактирование и удаление видео не ждут.
+    Пока лестница не готова, клиенты получают исходный файл.
+    """
+
+    name = "media_transcode"
+
+    def worker_count(self) -> int:
+        return settings.TRANSCODE_WORKERS
+
+    def queue_size(self) -> int:
+        return settings.TRANSCODE_QUEUE_SIZE
+
+    def requeue_interval(self) -> int:
+        return settings.MEDIA_PROBE_REQUEUE_INTERVAL_SECONDS
+
+    def on_start(self) -> None:
+        if settings.TRANSCODE_ENABLED:
+            resolve_ffmpeg()
+
+    def pending_video_ids(self) -> List[int]:
+        db = SessionLocal()
+        try:
+            return [row[0] for row in db.query(Video.id).filter(
+                Video.transcode_status == TranscodeStatus.PENDING,
+                Video.probe_status == MediaProbeStatus.DONE
+            ).order_by(Video.id).limit(settings.TRANSCODE_QUEUE_SIZE)]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _finish(video_id: int, status: TranscodeStatus, ladder: Optional[str] = None,
+                renditions: Optional[List[RenditionInfo]] = None) -> None:
+        db = SessionLocal()
+        try:
+            video = db.query(Video).filter(Video.id == video_id).with_for_update().first()
+            if video is None or video.transcode_status != TranscodeStatus.PENDING:
+                return
+            video.transcode_status = status
+            if renditions:
+                prefix = HlsTranscoder.url_prefix(video.content_sha256, ladder)
+                video.hls_path = f"{prefix}/{MASTER_PLAYLIST}"
+                video.renditions = [
+                    VideoRendition(
+                        name=rendition.name,
+                        width=rendition.width,
+                        height=rendition.height,
+                        bandwidth=rendition.bandwidth,
+                        average_bandwidth=rendition.average_bandwidth,
+                        codecs=rendition.codecs,
+                        playlist_path=f"{prefix}/{rendition.playlist}",
+                        file_path=f"{prefix}/{rendition.media}",
+                        file_size=rendition.file_size,
+                        content_sha256=rendition.content_sha256
+                    )
+                    for rendition in renditions
+                ]
+            db.commit()
+        finally:
+            db.close()
+
+    def process(self, video_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            video = db.query(Video).filter(Video.id == video_id).first()
+            if video is None or video.transcode_status != TranscodeStatus.PENDING:
+                return False
+            if video.probe_status != MediaProbeStatus.DONE:
+                # Вернется через next_stage разбора или requeue
+                return False
+            content_sha256 = MediaStorageService.video_sha256(video)
+            source = local_video_path(video)
+            source_width, source_height = video.width, video.height
+        finally:
+            db.close()
+
+        if content_sha256 is None or not settings.TRANSCODE_ENABLED or resolve_ffmpeg() is None:
+            self._finish(video_id, TranscodeStatus.SKIPPED)
+            return False
+
+        try:
+            ladder, renditions = HlsTranscoder.transcode(source, content_sha256, source_width, source_height)
+        except TranscodeBusy:
+            # Та же лестница кодируется для другого видео: подберется requeue
+            return False
+        except (RuntimeError, OSError, ValueError, subprocess.TimeoutExpired) as e:
+            logger.error("Transcoding failed for video %s: %s", video_id, e)
+            self._finish(video_id, TranscodeStatus.FAILED)
+            return False
+
+        self._finish(video_id, TranscodeStatus.DONE, ladder, renditions)
+        return True
+
+
+media_transcode_queue = MediaTranscodeQueue()
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+import multipart
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import parse_options_header
+from starlette.datastructures import Headers
+
+from app.core.config import settings
+
+# Текстовые поля формы держатся в памяти - их суммарный размер ограничен
+MAX_FORM_FIELDS_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Файл превышает MAX_VIDEO_SIZE_MB"""
+
+
+class UploadMalformed(ValueError):
+    """Тело запроса - не multipart/form-data с одним файлом"""
+
+
+class _FormCollector:
+    """Колбэки python-multipart: текстовые поля копятся в памяти, данные файла - в очередь на запись"""
+
+    def __init__(self, file_field: str) -> None:
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_chunks: List[bytes] = []
+        self._fields_size = 0
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name = ""
+        self._data = bytearray()
+        self._is_file = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+        self._data = bytearray()
+        self._is_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise UploadMalformed('Content-Disposition "name" is required')
+        self._name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            if self._name != self.file_field or self.filename is not None:
+                raise UploadMalformed(f'Only one file in field "{self.file_field}" is accepted')
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._is_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._is_file:
+            self.file_chunks.append(data[start:end])
+            return
+        self._fields_size += end - start
+        if self._fields_size > MAX_FORM_FIELDS_BYTES:
+            raise UploadMalformed("Form fields are too large")
+        self._data += data[start:end]
+
+    def on_part_end(self) -> None:
+        if not self._is_file:
+            self.fields[self._name] = self._data.decode("utf-8", "replace")
+
+
+class UploadService:
+    """
+    Сохранение загружаемых видео без блокировки цикла событий.
+
+    multipart/form-data разбирается прямо из потока запроса (python-multipart):
+    данные файла пишутся через aiofiles сразу в место назначения, без
+    промежуточной копии во временном файле фреймворка. Лимит размера проверяется
+    по мере поступления - запрос с чанкованным телом (без Content-Length)
+    обрывается с 413, как только превышен лимит. SHA-256 считается в том же
+    проходе. Запись идет во временный .part файл, который переименовывается
+    только после успешного завершения.
+    """
+
+    @staticmethod
+    def max_size_bytes() -> int:
+        return settings.MAX_VIDEO_SIZE_MB * 1024 * 1024
+
+    @staticmethod
+    def check_declared_size(content_length: Optional[str]) -> None:
+        """Отказать сразу, если Content-Length запроса уже больше лимита"""
+        if content_length and content_length.isdigit() and int(content_length) > UploadService.max_size_bytes():
+            raise UploadTooLarge(f"File exceeds {settings.MAX_VIDEO_SIZE_MB} MB")
+
+    @staticmethod
+    async def save_multipart(
+        headers: Headers,
+        stream: AsyncIterator[bytes],
+        destination: str,
+        file_field: str = "file"
+    ) -> Tuple[Dict[str, str], str, int, str]:
+        """
+        Сохранить файл из поля file_field в destination.
+
+        Returns:
+            (текстовые поля формы, имя файла, размер в байтах, sha256 hex)
+        """
+        content_type, params = parse_options_header(headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadMalformed("Expected multipart/form-data")
+
+        limit = UploadService.max_size_bytes()
+        collector = _FormCollector(file_field)
+        parser = multipart.MultipartParser(params[b"boundary"], collector.callbacks())
+        digest = hashlib.sha256()
+        size = 0
+        part_path = f"{destination}.{uuid.uuid4().hex}.part"
+
+        await aiofiles.os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        try:
+            async with aiofiles.open(part_path, "wb") as out:
+                async for chunk in stream:
+                    try:
+                        parser.write(chunk)
+                    except MultipartParseError as e:
+                        raise UploadMalformed(str(e))
+                    if not collector.file_chunks:
+                        continue
+                    data = b"".join(collector.file_chunks)
+                    collector.file_chunks.clear()
+                    size += len(data)
+                    if size > limit:
+                        raise UploadTooLarge(f"File exceeds {settings.MAX_VIDEO_SIZE_MB} MB")
+                    digest.update(data)
+                    await out.write(data)
+                parser.finalize()
+            if collector.filename is None:
+                raise UploadMalformed(f'Field "{file_field}" with a file is required')
+            await aiofiles.os.replace(part_path, destination)
+        except BaseException:
+            try:
+                await aiofiles.os.remove(part_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        return collector.fields, collector.filename, size, digest.hexdigest()
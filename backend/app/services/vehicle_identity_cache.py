@@ -0,0 +1,98 @@
+import json
+import logging
+from typing import NamedTuple, Optional
+
+from app.core.cache import TTLCache, get_redis, mark_redis_failed
+from app.core.config import settings
+from app.models.models import VehicleTariff
+
+logger = logging.getLogger(__name__)
+
+
+class VehicleIdentity(NamedTuple):
+    """Минимум данных автомобиля для авторизации запроса"""
+
+    id: int
+    tariff: VehicleTariff
+    is_active: bool
+
+
+class VehicleIdentityCache:
+    """
+    Кеш авторизационного состояния автомобиля (тариф, is_active) по vehicle_id.
+
+    Слои: in-process TTLCache -> Redis -> запрос в БД. Опрос устройства
+    (плейлист, логи, сессии) обычно не ходит в БД за проверкой токена.
+    update_vehicle/delete_vehicle вызывают invalidate: ключ удаляется в Redis
+    и в памяти текущего воркера; в других воркерах копия живет не дольше
+    VEHICLE_IDENTITY_CACHE_LOCAL_TTL.
+    """
+
+    KEY_PREFIX = "auth:vehicle:v1"
+
+    _local = TTLCache(
+        maxsize=settings.VEHICLE_IDENTITY_CACHE_MAX_ENTRIES,
+        ttl=settings.VEHICLE_IDENTITY_CACHE_LOCAL_TTL
+    )
+
+    @staticmethod
+    def key(vehicle_id: int) -> str:
+        return f"{VehicleIdentityCache.KEY_PREFIX}:{vehicle_id}"
+
+    @staticmethod
+    def get_local(vehicle_id: int) -> Optional[VehicleIdentity]:
+        """Только память воркера (без ввода-вывода - можно звать из цикла событий)"""
+        return VehicleIdentityCache._local.get(vehicle_id)
+
+    @staticmethod
+    def get(vehicle_id: int) -> Optional[VehicleIdentity]:
+        """Память воркера, затем Redis; None - нужно прочитать из БД"""
+        identity = VehicleIdentityCache._local.get(vehicle_id)
+        if identity is not None:
+            return identity
+
+        redis_client = get_redis()
+        if redis_client is None:
+            return None
+        try:
+            raw = redis_client.get(VehicleIdentityCache.key(vehicle_id))
+        except Exception as e:
+            mark_redis_failed(e)
+            return None
+        if raw is None:
+            return None
+
+        data = json.loads(raw)
+        identity = VehicleIdentity(vehicle_id, VehicleTariff(data["tariff"]), data["is_active"])
+        VehicleIdentityCache._local.set(vehicle_id, identity)
+        return identity
+
+    @staticmethod
+    def set(identity: VehicleIdentity) -> None:
+        VehicleIdentityCache._local.set(identity.id, identity)
+
+        redis_client = get_redis()
+        if redis_client is None:
+            return
+        try:
+            redis_client.setex(
+                VehicleIdentityCache.key(identity.id),
+                settings.VEHICLE_IDENTITY_CACHE_REDIS_TTL,
+                json.dumps({"tariff": identity.tariff.value, "is_active": identity.is_active}, separators=(",", ":"))
+            )
+        except Exception as e:
+            mark_redis_failed(e)
+
+    @staticmethod
+    def invalidate(vehicle_id: int) -> None:
+        """Сбросить кеш автомобиля (изменение тарифа, деактивация, удаление)"""
+        VehicleIdentityCache._local.delete(vehicle_id)
+
+        redis_client = get_redis()
+        if redis_client is None:
+            return
+        try:
+            redis_client.delete(VehicleIdentityCache.key(vehicle_id))
+        except Exception as e:
+            mark_redis_failed(e)
+            logger.warning("Failed to invalidate identity cache for vehicle %s", vehicle_id)
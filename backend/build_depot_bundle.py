@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Скрипт для сборки пакетов синхронизации в депо (плейлисты тарифа + медиа, tar с оглавлением).
+
+Запускается по расписанию перед возвращением машин в депо; неизмененные файлы
+переносятся из предыдущего пакета.
+
+Примеры:
+    python build_depot_bundle.py
+    python build_depot_bundle.py standard comfort --hours 36
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import SessionLocal
+from app.models.models import VehicleTariff
+from app.services.depot_bundle_service import DepotBundleService, DepotBundleBusy
+
+
+def build_bundle(tariff: VehicleTariff, hours: int):
+    """Собрать пакет тарифа и вывести итог"""
+    db = SessionLocal()
+    try:
+        index = DepotBundleService.build(db, tariff, hours)
+    finally:
+        db.close()
+
+    archive = DepotBundleService.archive_path(tariff, index.bundle_id)
+    print(
+        f"✅ {tariff.value}: {index.bundle_id}, {len(index.playlists)} плейлистов, {len(index.files)} файлов, "
+        f"новых {index.packed_bytes / 1024 / 1024:.1f} МБ, из предыдущего {index.reused_bytes / 1024 / 1024:.1f} МБ "
+        f"-> {archive}"
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сборка пакетов синхронизации в депо')
+    parser.add_argument('tariffs', nargs='*', type=VehicleTariff,
+                        help=f"тарифы: {', '.join(t.value for t in VehicleTariff)} (по умолчанию все)")
+    parser.add_argument('--hours', type=int, default=None, help='на сколько часов вперед (DEPOT_BUNDLE_HOURS)')
+
+    args = parser.parse_args()
+
+    failed = False
+    for tariff in args.tariffs or list(VehicleTariff):
+        try:
+            build_bundle(tariff, args.hours)
+        except (DepotBundleBusy, OSError) as e:
+            print(f"❌ {tariff.value}: {e}", file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
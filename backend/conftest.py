@@ -0,0 +1,20 @@
+"""
+Общие фикстуры pytest для тестов backend (pytest - зависимость разработки,
+в requirements.txt не входит, и пакет app его не импортирует).
+
+    def test_my_analytics(client, auth, query_budget):
+        with query_budget(4):
+            client.get("/api/v1/analytics/me", headers=auth)
+"""
+import pytest
+
+from app.core import query_inspector
+from app.db.database import engine, async_engine
+
+
+@pytest.fixture
+def query_budget():
+    """Контекстный менеджер: тест падает, если блок выполнил больше SQL-запросов, чем разрешено"""
+    query_inspector.install(engine)
+    query_inspector.install(async_engine.sync_engine)
+    return query_inspector.query_budget
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Скрипт для выгрузки логов воспроизведения за месяц (для биллинга рекламодателей).
+
+Примеры:
+    python export_playback_logs.py 2026-09
+    python export_playback_logs.py 2026-09 --format parquet -o september.parquet
+    python export_playback_logs.py 2026-09 --format csv.gz -o - | aws s3 cp - s3://billing/2026-09.csv.gz
+"""
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.export_service import ExportService
+
+
+def export_month(month: str, fmt: str, output: str, chunk_size: int):
+    """Выгрузить месяц в файл (или stdout при output='-')"""
+    start, end = ExportService.month_range(month)
+    stream = ExportService.stream_export(start, end, fmt=fmt, chunk_size=chunk_size)
+
+    started = time.monotonic()
+    written = 0
+    out = sys.stdout.buffer if output == "-" else open(output, "wb")
+    try:
+        for data in stream:
+            out.write(data)
+            written += len(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    elapsed = time.monotonic() - started
+    print(f"✅ {month}: {written / 1024 / 1024:.1f} МБ за {elapsed:.1f} с -> {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Выгрузка playback_logs за месяц')
+    parser.add_argument('month', help='месяц в формате YYYY-MM')
+    parser.add_argument('--format', choices=list(ExportService.FORMATS), default='csv')
+    parser.add_argument('-o', '--output', help='файл назначения ("-" - stdout)')
+    parser.add_argument('--chunk-size', type=int, default=ExportService.DEFAULT_CHUNK_SIZE,
+                        help='строк в одной пачке серверного курсора')
+
+    args = parser.parse_args()
+    output = args.output or f"playback_logs_{args.month}.{ExportService.FORMATS[args.format][1]}"
+
+    try:
+        export_month(args.month, args.format, output, args.chunk_size)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Скрипт для обслуживания месячных секций таблицы playback_logs.
+
+Примеры:
+    python manage_partitions.py list
+    python manage_partitions.py ensure --ahead 6
+    python manage_partitions.py detach 2025-01 --concurrently
+"""
+import sys
+import os
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import engine
+from app.services.partition_service import PartitionService
+
+
+def list_partitions():
+    """Показать подключенные секции"""
+    with engine.connect() as connection:
+        if not PartitionService.is_partitioned(connection):
+            print("❌ playback_logs не секционирована. Выполните: alembic upgrade head")
+            return
+        for name in PartitionService.list_partitions(connection):
+            print(f"  {name}")
+
+
+def ensure_partitions(ahead: int):
+    """Создать секции на текущий и ahead следующих месяцев"""
+    with engine.begin() as connection:
+        created = PartitionService.ensure_partitions(connection, months_ahead=ahead)
+    if created:
+        print(f"✅ Секции готовы: {created[0]} … {created[-1]}")
+    else:
+        print("❌ playback_logs не секционирована. Выполните: alembic upgrade head")
+
+
+def detach_partition(month: str, concurrently: bool):
+    """Отсоединить секцию месяца (данные остаются в отдельной таблице)"""
+    month_date = datetime.strptime(month, "%Y-%m").date()
+    if concurrently:
+        # DETACH ... CONCURRENTLY нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            name = PartitionService.detach_partition(connection, month_date, concurrently=True)
+    else:
+        with engine.begin() as connection:
+            name = PartitionService.detach_partition(connection, month_date)
+    print(f"✅ Секция {name} отсоединена. Удалить данные: DROP TABLE {name};")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Управление секциями playback_logs')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    subparsers.add_parser('list', help='показать секции')
+
+    ensure_parser = subparsers.add_parser('ensure', help='создать секции на будущие месяцы')
+    ensure_parser.add_argument('--ahead', type=int, default=None, help='сколько месяцев вперед')
+
+    detach_parser = subparsers.add_parser('detach', help='отсоединить секцию месяца')
+    detach_parser.add_argument('month', help='месяц в формате YYYY-MM')
+    detach_parser.add_argument('--concurrently', action='store_true', help='без блокировки таблицы')
+
+    args = parser.parse_args()
+
+    if args.action == 'list':
+        list_partitions()
+    elif args.action == 'ensure':
+        ensure_partitions(args.ahead)
+    elif args.action == 'detach':
+        detach_partition(args.month, args.concurrently)
@@ -1,3 +1,81 @@
+/// Макс. высота качества, которое скачивает устройство (экран планшета в такси).
+const int kPreferredVideoHeight = 720;
+
+/// Качество видео из лестницы HLS: fMP4-файл целиком подходит для офлайн-кеша.
+class VideoVariant {
+  final String name;      // например "480p"
+  final int width;
+  final int height;
+  final int bandwidth;    // пиковый битрейт, бит/с
+  final String mediaUrl;  // fMP4-файл качества
+  final String playlistUrl; // плейлист качества HLS
+
+  VideoVariant({
+    required this.name,
+    required this.width,
+    required this.height,
+    required this.bandwidth,
+    required this.mediaUrl,
+    required this.playlistUrl,
+  });
+
+  factory VideoVariant.fromJson(Map<String, dynamic> json) {
+    return VideoVariant(
+      name: json['name'] ?? '',
+      width: json['width'] ?? 0,
+      height: json['height'] ?? 0,
+      bandwidth: json['bandwidth'] ?? 0,
+      mediaUrl: json['media_url'] ?? '',
+      playlistUrl: json['playlist_url'] ?? '',
+    );
+  }
+
+  static List<VideoVariant> listFromJson(dynamic json) {
+    if (json is! List) return const [];
+    return json.map((v) => VideoVariant.fromJson(v as Map<String, dynamic>)).toList();
+  }
+
+  /// URL для скачивания: лучшее качество не выше [maxHeight], иначе исходный файл.
+  static String pickMediaUrl(String original, List<VideoVariant> variants,
+      {int maxHeight = kPreferredVideoHeight}) {
+    VideoVariant? best;
+    for (final v in variants) {
+      if (v.height <= maxHeight && v.mediaUrl.isNotEmpty && (best == null || v.height > best.height)) {
+        best = v;
+      }
+    }
+    return best?.mediaUrl ?? original;
+  }
+}
+
+/// Ссылки видео плейлиста: исходник и лестница HLS (одна запись на видео).
+class VideoMedia {
+  final String mediaUrl;  // исходник
+  final String? hlsUrl;   // master-плейлист HLS (если лестница качеств готова)
+  final List<VideoVariant> variants;
+
+  VideoMedia({
+    required this.mediaUrl,
+    this.hlsUrl,
+    this.variants = const [],
+  });
+
+  factory VideoMedia.fromJson(Map<String, dynamic> json) {
+    return VideoMedia(
+      mediaUrl: json['media_url'] ?? '',
+      hlsUrl: json['hls_url'],
+      variants: VideoVariant.listFromJson(json['variants']),
+    );
+  }
+
+  /// Ключи JSON-объекта - строки с video_id.
+  static Map<int, VideoMedia> mapFromJson(dynamic json) {
+    if (json is! Map) return const {};
+    return json.map<int, VideoMedia>((key, value) =>
+        MapEntry(int.parse(key.toString()), VideoMedia.fromJson(value as Map<String, dynamic>)));
+  }
+}
+
 class ContractVideoItem {
   final int videoId;
   final double startTime; // Время начала в секундах от начала часа (0-3600)
@@ -71,20 +149,21 @@ class PlaylistPlayItem {
     this.title = '',
   });
 
-  factory PlaylistPlayItem.fromContract(ContractVideoItem c) {
+  factory PlaylistPlayItem.fromContract(ContractVideoItem c, VideoMedia? media) {
     return PlaylistPlayItem(
       videoId: c.videoId,
-      mediaUrl: c.mediaUrl,
+      // Качество под экран вместо исходника: меньше мобильного трафика
+      mediaUrl: VideoVariant.pickMediaUrl(c.mediaUrl, media?.variants ?? const []),
       duration: c.duration,
       startTime: c.startTime,
       endTime: c.endTime,
     );
   }
 
-  factory PlaylistPlayItem.fromFiller(FillerVideoItem f) {
+  factory PlaylistPlayItem.fromFiller(FillerVideoItem f, VideoMedia? media) {
     return PlaylistPlayItem(
       videoId: f.videoId,
-      mediaUrl: f.mediaUrl,
+      mediaUrl: VideoVariant.pickMediaUrl(f.mediaUrl, media?.variants ?? const []),
       duration: f.duration,
       startTime: 0,
       endTime: f.duration,
@@ -98,6 +177,7 @@ class Playlist {
   final String tariff;
   final List<ContractVideoItem> contractVideos;
   final List<FillerVideoItem> fillerVideos;
+  final Map<int, VideoMedia> media; // Исходник и качества HLS по video_id
   final List<int> videoSequence; // Упорядоченная последовательность ID видео
   final double totalDuration; // Общая длительность плейлиста в секундах (3600 для часового)
   final DateTime validFrom;
@@ -110,6 +190,7 @@ class Playlist {
     required this.tariff,
     required this.contractVideos,
     required this.fillerVideos,
+    this.media = const {},
     required this.videoSequence,
     required this.totalDuration,
     required this.validFrom,
@@ -128,6 +209,7 @@ class Playlist {
       fillerVideos: (json['filler_videos'] as List<dynamic>?)
           ?.map((item) => FillerVideoItem.fromJson(item))
           .toList() ?? [],
+      media: VideoMedia.mapFromJson(json['media']),
       videoSequence: (json['video_sequence'] as List<dynamic>?)
           ?.map((id) => id as int)
           .toList() ?? [],
@@ -165,10 +247,10 @@ class Playlist {
     final sortedContract = List<ContractVideoItem>.from(contractVideos)
       ..sort((a, b) => a.startTime.compareTo(b.startTime));
     for (final c in sortedContract) {
-      list.add(PlaylistPlayItem.fromContract(c));
+      list.add(PlaylistPlayItem.fromContract(c, media[c.videoId]));
     }
     for (final f in fillerVideos) {
-      list.add(PlaylistPlayItem.fromFiller(f));
+      list.add(PlaylistPlayItem.fromFiller(f, media[f.videoId]));
     }
     return list;
   }
@@ -1,12 +1,18 @@
+import 'dart:async';
+
 import 'package:flutter/foundation.dart';
 import 'api_service.dart';
 
 class AnalyticsService extends ChangeNotifier {
   final ApiService _apiService = ApiService();
   
+  // Heartbeat: без него сервер закроет сессию как зависшую
+  static const Duration heartbeatInterval = Duration(seconds: 30);
+
   int? _currentSessionId;
   DateTime? _sessionStartTime;
   DateTime? _currentVideoStartTime;
+  Timer? _heartbeatTimer;
 
   int? get currentSessionId => _currentSessionId;
   bool get hasActiveSession => _currentSessionId != null;
@@ -16,6 +22,7 @@ class AnalyticsService extends ChangeNotifier {
       final sessionData = await _apiService.startSession();
       _currentSessionId = sessionData['id'];
       _sessionStartTime = DateTime.now();
+      _startHeartbeat();
       notifyListeners();
     } catch (e) {
       debugPrint('Error starting session: $e');
@@ -24,6 +31,7 @@ class AnalyticsService extends ChangeNotifier {
 
   Future<void> endSession() async {
     if (_currentSessionId == null) return;
+    _stopHeartbeat();
 
     try {
       await _apiService.endSession(_currentSessionId!);
@@ -35,6 +43,22 @@ class AnalyticsService extends ChangeNotifier {
     }
   }
 
+  void _startHeartbeat() {
+    _heartbeatTimer?.cancel();
+    _heartbeatTimer = Timer.periodic(heartbeatInterval, (_) async {
+      try {
+        await _apiService.sendHeartbeat(sessionId: _currentSessionId);
+      } catch (e) {
+        debugPrint('Error sending heartbeat: $e');
+      }
+    });
+  }
+
+  void _stopHeartbeat() {
+    _heartbeatTimer?.cancel();
+    _heartbeatTimer = null;
+  }
+
   void startVideoPlayback() {
     _currentVideoStartTime = DateTime.now();
   }
@@ -80,4 +104,10 @@ class AnalyticsService extends ChangeNotifier {
     if (_sessionStartTime == null) return null;
     return DateTime.now().difference(_sessionStartTime!);
   }
+
+  @override
+  void dispose() {
+    _stopHeartbeat();
+    super.dispose();
+  }
 }
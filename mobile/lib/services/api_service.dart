@@ -101,6 +101,14 @@ class ApiService {
     return response.data;
   }
 
+  /// Манифест медиа текущего и следующего плейлиста: файлы в порядке воспроизведения.
+  Future<Map<String, dynamic>> getMediaManifest({int maxHeight = 720}) async {
+    final response = await _dio.get('/playlists/current/manifest', queryParameters: {
+      'max_height': maxHeight,
+    });
+    return response.data;
+  }
+
   Future<Map<String, dynamic>> regeneratePlaylist({int hours = 24}) async {
     final response = await _dio.post('/playlists/regenerate', queryParameters: {
       'hours': hours,
@@ -121,6 +129,13 @@ class ApiService {
     return response.data;
   }
 
+  Future<void> sendHeartbeat({int? sessionId}) async {
+    await _dio.post(
+      '/sessions/heartbeat',
+      queryParameters: sessionId != null ? {'session_id': sessionId} : null,
+    );
+  }
+
   // Playback logs
   Future<Map<String, dynamic>> logPlayback({
     required int videoId,
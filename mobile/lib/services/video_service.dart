@@ -49,7 +49,7 @@ class VideoService extends ChangeNotifier {
         _usePlayItems = true;
         _playList = _currentPlaylist!.buildPlayItemsFromContractAndFiller();
         _videos = [];
-        _cachePlayListUrls();
+        _prefetchFromManifest();
       }
 
       _isLoading = false;
@@ -100,6 +100,29 @@ class VideoService extends ChangeNotifier {
     }
   }
 
+  /// Manifest bo‘yicha faqat keshda yo‘q fayllarni yuklash (joriy, keyin keyingi pleylist tartibida).
+  /// Manifest olinmasa - eski usul: pleylistdagi barcha URL.
+  Future<void> _prefetchFromManifest() async {
+    List<dynamic> files;
+    try {
+      final manifest = await _apiService.getMediaManifest(maxHeight: kPreferredVideoHeight);
+      files = manifest['files'] as List<dynamic>? ?? [];
+    } catch (e) {
+      debugPrint('Error loading media manifest: $e');
+      await _cachePlayListUrls();
+      return;
+    }
+    for (var file in files) {
+      final url = file['url'] as String;
+      try {
+        if (await _cacheManager.getFileFromCache(url) != null) continue;
+        await _cacheManager.downloadFile(url);
+      } catch (e) {
+        debugPrint('Error caching $url: $e');
+      }
+    }
+  }
+
   Future<String> getVideoUrl(Video video) async {
     final videoUrl = '${ApiService.baseUrl.replaceAll('/api/v1', '')}${video.filePath}';
     try {